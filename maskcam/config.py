@@ -28,6 +28,8 @@ ENV_CONFIG_OVERRIDES = (
     ("MASKCAM_INFERENCE_INTERVAL_AUTO", ("maskcam", "inference-interval-auto")),
     ("MASKCAM_INFERENCE_MAX_FPS", ("maskcam", "inference-max-fps")),
     ("MASKCAM_INFERENCE_LOG_INTERVAL", ("maskcam", "inference-log-interval")),
+    ("MASKCAM_LOG_BACKEND", ("maskcam", "log-backend")),  # Also read directly by prints.py
+    ("MASKCAM_LOG_RATE_LIMIT", ("maskcam", "log-rate-limit")),
     ("MASKCAM_STREAMING_START_DEFAULT", ("maskcam", "streaming-start-default")),
     ("MASKCAM_STREAMING_PORT", ("maskcam", "streaming-port")),
     ("MASKCAM_FILESERVER_ENABLED", ("maskcam", "fileserver-enabled")),
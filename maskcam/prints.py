@@ -20,32 +20,209 @@
 # DEALINGS IN THE SOFTWARE.
 ################################################################################
 
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
 import logging
+import configparser
+from logging.handlers import QueueHandler, QueueListener
 from rich.logging import RichHandler
+from rich.errors import MarkupError
+from rich.text import Text
+
+from .common import CONFIG_FILE
+
+# Logging backends, selected with `log-backend` in the config file
+LOG_BACKEND_RICH = "rich"  # Synchronous RichHandler with markup (default)
+LOG_BACKEND_QUEUE = "queue"  # Rich output rendered by a background writer thread
+LOG_BACKEND_JSON = "json"  # JSON lines rendered by a background writer thread
+LOG_BACKENDS = (LOG_BACKEND_RICH, LOG_BACKEND_QUEUE, LOG_BACKEND_JSON)
 
-logging.basicConfig(
-    level="NOTSET",
-    format="%(message)s",
-    datefmt="|",  # Not needed w/balena, use [%X] otherwise
-    handlers=[RichHandler(markup=True)],
+# Can't use maskcam.config here since it imports this module
+_log_config = configparser.ConfigParser()
+_log_config.read(CONFIG_FILE)
+LOG_BACKEND = os.environ.get(
+    "MASKCAM_LOG_BACKEND", _log_config.get("maskcam", "log-backend", fallback=LOG_BACKEND_RICH)
+).strip()
+LOG_RATE_LIMIT = float(
+    os.environ.get(
+        "MASKCAM_LOG_RATE_LIMIT", _log_config.get("maskcam", "log-rate-limit", fallback="0")
+    )
 )
 
 log = logging.getLogger("rich")
 
+_listener = None
+_rate_limit = 0
+_call_sites = {}  # (filename, lineno) -> [window start, messages in window, suppressed]
+
+
+class LazyMessage:
+    """
+    Defer the concatenation of print arguments until a handler formats the record
+    """
+
+    __slots__ = ("color", "process_name", "args", "suppressed")
+
+    def __init__(self, color, process_name, args, suppressed=0):
+        self.color = color
+        self.process_name = process_name
+        self.args = args
+        self.suppressed = suppressed
+
+    def plain(self):
+        msg = " ".join([str(arg) for arg in self.args])
+        if self.suppressed:
+            msg = f"{msg} ({self.suppressed} similar messages suppressed)"
+        return msg
+
+    def __str__(self):
+        return f"[{self.color}]{self.process_name}[/{self.color}] | {self.plain()}"
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves all formatting to the listener thread
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            # Tracebacks can't wait: render them while the frames are still alive
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    One JSON object per line, with rich markup stripped from the message
+    """
+
+    def format(self, record):
+        if isinstance(record.msg, LazyMessage):
+            process_name = record.msg.process_name
+            message = record.msg.plain()
+        else:
+            process_name = None
+            message = record.getMessage()
+        try:
+            message = Text.from_markup(message).plain
+        except MarkupError:
+            pass  # Unbalanced tags, keep the raw message
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "pid": record.process,
+            "process": process_name,
+            "msg": message,
+        }
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry)
+
+
+def setup_logging(backend=LOG_BACKEND, rate_limit=LOG_RATE_LIMIT, stream=None):
+    """
+    (Re)configure the logging backend used by all print_* functions.
+
+    Arguments:
+        backend {str} -- One of LOG_BACKENDS.
+        rate_limit {float} -- Max messages per second for each call site, 0 to disable.
+        stream -- Output stream, defaults to sys.stderr.
+    """
+    global _listener, _rate_limit
+
+    if backend not in LOG_BACKENDS:
+        raise ValueError(f"Invalid log backend: {backend}. Valid options: {LOG_BACKENDS}")
+
+    if _listener is not None:
+        _listener.stop()  # Flushes pending records
+        _listener = None
+
+    if backend == LOG_BACKEND_JSON:
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(JsonLinesFormatter())
+    else:
+        console = None
+        if stream is not None:
+            from rich.console import Console
+
+            console = Console(file=stream)
+        handler = RichHandler(markup=True, console=console)
+        handler.setFormatter(logging.Formatter("%(message)s", datefmt="|"))
+
+    if backend != LOG_BACKEND_RICH:
+        log_queue = queue.Queue(-1)
+        _listener = QueueListener(log_queue, handler)
+        _listener.start()
+        handler = BackgroundQueueHandler(log_queue)
+
+    # Same as logging.basicConfig(), but allowed to run more than once
+    root_logger = logging.getLogger()
+    for old_handler in root_logger.handlers[:]:
+        root_logger.removeHandler(old_handler)
+    root_logger.addHandler(handler)
+    root_logger.setLevel(logging.NOTSET)
+
+    _rate_limit = rate_limit
+    _call_sites.clear()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _check_rate_limit():
+    """
+    Returns None if the caller of print_* must be silenced, otherwise
+    the number of messages suppressed on that call site since the last one.
+    """
+    caller = sys._getframe(3)  # _check_rate_limit <- print_process <- print_* <- caller
+    key = (caller.f_code.co_filename, caller.f_lineno)
+    now = time.monotonic()
+    site = _call_sites.get(key)
+    if site is None:
+        _call_sites[key] = [now, 1, 0]
+        return 0
+    if now - site[0] >= 1.0:
+        suppressed = site[2]
+        site[:] = [now, 1, 0]
+        return suppressed
+    if site[1] >= _rate_limit:
+        site[2] += 1
+        return None
+    site[1] += 1
+    return 0
+
 
 def print_process(
     color, process_name, *args, error=False, warning=False, exception=False, **kwargs
 ):
-    msg = " ".join([str(arg) for arg in args])  # Concatenate all incoming strings or objects
-    rich_msg = f"[{color}]{process_name}[/{color}] | {msg}"
     if error:
-        log.error(rich_msg)
+        level = logging.ERROR
     elif warning:
-        log.warning(rich_msg)
+        level = logging.WARNING
     elif exception:
-        log.exception(rich_msg)
+        level = logging.ERROR
     else:
-        log.info(rich_msg)
+        level = logging.INFO
+    if not log.isEnabledFor(level):
+        return
+
+    suppressed = 0
+    if _rate_limit and not (error or exception):
+        suppressed = _check_rate_limit()
+        if suppressed is None:
+            return
+
+    # Concatenated only when (and where) a handler formats the record
+    msg = LazyMessage(color, process_name, args, suppressed)
+    log.log(level, msg, exc_info=exception)
 
 
 def print_run(*args, **kwargs):
@@ -74,3 +251,7 @@ def print_mqtt(*args, **kwargs):
 
 def print_common(*args, **kwargs):
     print_process("white", "common", *args, **kwargs)
+
+
+setup_logging()
+atexit.register(_stop_listener)
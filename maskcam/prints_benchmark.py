@@ -0,0 +1,94 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+
+import sys
+import time
+
+from .prints import LOG_BACKENDS, setup_logging, print_inference, print_mqtt
+
+# Same message the deepstream probe logs every `inference-log-interval` frames
+MQTT_MESSAGE = {
+    "device_id": "maskcam-benchmark",
+    "timestamp": 1609780971.514455,
+    "people_with_mask": 4,
+    "people_without_mask": 7,
+    "people_total": 11,
+}
+
+
+class NullStream:
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def cb_probe_log(frame_number, log_interval):
+    # Mimics the logging part of maskcam_inference.cb_buffer_probe
+    if not frame_number % log_interval:
+        print_inference(f"Processed {frame_number} frames...")
+
+
+def benchmark(backend, rate_limit, log_interval, n_calls):
+    setup_logging(backend, rate_limit=rate_limit, stream=NullStream())
+
+    start = time.perf_counter()
+    for frame_number in range(n_calls):
+        cb_probe_log(frame_number, log_interval)
+    probe_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(n_calls // log_interval):
+        print_mqtt(MQTT_MESSAGE)
+    mqtt_time = time.perf_counter() - start
+
+    # Time to flush the background writer isn't paid by the probe
+    start = time.perf_counter()
+    setup_logging(backend, rate_limit=0, stream=NullStream())
+    flush_time = time.perf_counter() - start
+
+    return probe_time, mqtt_time, flush_time
+
+
+def main(n_calls=20000):
+    print(f"{n_calls} probe calls per run, times in microseconds per call\n")
+    print(f"{'backend':<8} {'rate limit':>10} {'interval':>8} {'probe':>8} {'mqtt':>8} {'flush ms':>9}")
+    for backend in LOG_BACKENDS:
+        for rate_limit in (0, 10):
+            for log_interval in (1, 300):
+                probe_time, mqtt_time, flush_time = benchmark(
+                    backend, rate_limit, log_interval, n_calls
+                )
+                n_mqtt = n_calls // log_interval
+                print(
+                    f"{backend:<8} {rate_limit:>10} {log_interval:>8} "
+                    f"{probe_time * 1e6 / n_calls:>8.2f} "
+                    f"{mqtt_time * 1e6 / n_mqtt:>8.2f} "
+                    f"{flush_time * 1e3:>9.1f}"
+                )
+    setup_logging()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
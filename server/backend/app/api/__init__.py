@@ -20,6 +20,24 @@
 # DEALINGS IN THE SOFTWARE.
 ################################################################################
 
-from .exceptions import NoItemFoundException, GenericException, ItemAlreadyExist
+from .exceptions import (
+    NoItemFoundException,
+    GenericException,
+    InvalidCursorException,
+    ItemAlreadyExist,
+    TooManyItemsException,
+)
+from .cache import (
+    CachedResponse,
+    ResponseCache,
+    cache_datetime,
+    request_key,
+    statistics_cache,
+)
+from .compression import UNCOMPRESSED_PATHS, CompressionMiddleware
+from .listener import DatabaseListener, database_listener
+from .live import LiveHub, format_event, live_hub
 from .routes.device_routes import device_router
+from .routes.export_routes import export_router
+from .routes.live_routes import live_router
 from .routes.statistic_routes import statistic_router
@@ -0,0 +1,295 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple, Union
+
+from app.core.config import STATISTICS_CACHE_MAX_BYTES, STATISTICS_CACHE_TTL
+
+from fastapi import Request, Response
+
+
+def cache_datetime(value: Union[None, str, datetime]) -> Optional[datetime]:
+    """
+    Convert a datetime filter to a naive UTC datetime, to compare it with
+    the datetimes of changed statistics.
+
+    Arguments:
+        value {Union[None, str, datetime]} -- Datetime filter of a request.
+
+    Returns:
+        Optional[datetime] -- Naive UTC datetime. Raises ValueError if the
+        string can't be parsed here.
+    """
+    if value is None or isinstance(value, datetime) and value.tzinfo is None:
+        return value
+
+    if isinstance(value, str):
+        # PostgreSQL ignores the time zone of strings cast to timestamp
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class CachedResponse:
+    """
+    JSON response body along with its ETag and the statistics it depends on:
+    those of device_id (any device if None) between from_date and to_date.
+    """
+
+    def __init__(
+        self,
+        body: bytes,
+        device_id: Optional[str] = None,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        headers: Dict = None,
+    ):
+        self.body = body
+        self.etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        self.device_id = device_id
+        self.from_date = from_date
+        self.to_date = to_date
+        self.headers = headers or {}
+        # Monotonic time when it expires, set by ResponseCache.put
+        self.expires = None
+
+    def depends_on(
+        self, device_id: Optional[str], from_date: datetime, to_date: datetime
+    ) -> bool:
+        if device_id is not None and self.device_id not in (None, device_id):
+            return False
+        if self.from_date is not None and to_date < self.from_date:
+            return False
+        if self.to_date is not None and from_date > self.to_date:
+            return False
+        return True
+
+    def to_response(self, request: Request) -> Response:
+        """
+        Respond with the body, or with 304 Not Modified if the client
+        already has this version.
+        """
+        headers = {**self.headers, "ETag": self.etag}
+        if_none_match = request.headers.get("if-none-match", "")
+        if self.etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        return Response(
+            content=self.body, media_type="application/json", headers=headers
+        )
+
+
+class ResponseCache:
+    """
+    In-process LRU cache of responses, bounded by the size of their bodies,
+    whose entries expire after ttl seconds.
+
+    Statistics for a datetime range only change if statistics within that
+    range are added, modified or deleted, which the database announces on
+    STATISTIC_CHANGES_CHANNEL, see on_change. Only the entries of the changed
+    device and range are invalidated. Responses are only cached while
+    listening, so no change can be missed.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = STATISTICS_CACHE_MAX_BYTES,
+        ttl: float = STATISTICS_CACHE_TTL,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.listening = False
+        # Incremented on every change, see put
+        self.changes = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "uncacheable": 0,
+            "not_modified": 0,
+            "invalidations": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    def get(self, key: Tuple) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires < time.monotonic():
+                self._remove(key)
+                self._counters["expirations"] += 1
+                entry = None
+
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry
+
+    def put(
+        self,
+        key: Tuple,
+        entry: CachedResponse,
+        changes: int,
+        cacheable: bool = True,
+    ) -> CachedResponse:
+        """
+        Keep a response, if it's cacheable and fits.
+
+        Arguments:
+            key {Tuple} -- Request key, see request_key.
+            entry {CachedResponse} -- Response to keep.
+            changes {int} -- Value of changes before querying the database.
+            If some change arrived since, the response may be outdated.
+            cacheable {bool} -- False if the response depends on something
+            else than the statistics in its range, e.g: the current time.
+
+        Returns:
+            CachedResponse -- The same entry.
+        """
+        with self._lock:
+            if not (
+                cacheable
+                and self.listening
+                and changes == self.changes
+                and len(entry.body) <= self.max_bytes
+            ):
+                self._counters["uncacheable"] += 1
+                return entry
+
+            if key in self._entries:
+                self._remove(key)
+            entry.expires = time.monotonic() + self.ttl
+            self._entries[key] = entry
+            self._bytes += len(entry.body)
+
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+        return entry
+
+    def respond(self, request: Request, entry: CachedResponse) -> Response:
+        response = entry.to_response(request)
+        if response.status_code == 304:
+            with self._lock:
+                self._counters["not_modified"] += 1
+        return response
+
+    def invalidate(
+        self,
+        device_id: Optional[str] = None,
+        from_date: datetime = datetime.min,
+        to_date: datetime = datetime.max,
+    ) -> int:
+        """
+        Remove the entries that depend on the statistics of device_id
+        (every device if None) between from_date and to_date.
+
+        Returns:
+            int -- Number of entries removed.
+        """
+        with self._lock:
+            self.changes += 1
+            keys = [
+                key
+                for key, entry in self._entries.items()
+                if entry.depends_on(device_id, from_date, to_date)
+            ]
+            for key in keys:
+                self._remove(key)
+            self._counters["invalidations"] += len(keys)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self.changes += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": self._counters["hits"] / lookups if lookups else 0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "listening": self.listening,
+            }
+
+    def on_change(self, payload: str):
+        """
+        Invalidate the entries affected by a notification of
+        notify_statistic_changes.
+        """
+        change = json.loads(payload)
+        if change["device_id"] is None:
+            self.invalidate()
+        else:
+            self.invalidate(
+                change["device_id"],
+                datetime.fromisoformat(change["from"]),
+                datetime.fromisoformat(change["to"]),
+            )
+
+    def on_device_deleted(self, device_id: str):
+        """
+        Invalidate the entries of a device deleted along with its statistics,
+        announced by delete_device.
+        """
+        self.invalidate(device_id)
+
+    def reset(self, listening: bool):
+        """
+        Start or stop caching, when the database listener connects or
+        disconnects. Changes may have been missed in between.
+        """
+        self.listening = listening and self.max_bytes > 0
+        self.clear()
+
+    def _remove(self, key: Tuple):
+        self._bytes -= len(self._entries.pop(key).body)
+
+
+def request_key(request: Request) -> Tuple:
+    """
+    Cache key of a request: its path and query parameters, which include the
+    device, datetime range and bucket.
+    """
+    return (
+        request.url.path,
+        tuple(sorted(request.query_params.multi_items())),
+    )
+
+
+statistics_cache = ResponseCache()
@@ -39,6 +39,22 @@ class ItemAlreadyExist(HTTPException):
         )
 
 
+class InvalidCursorException(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=400,
+            detail="The provided cursor is not valid",
+        )
+
+
+class TooManyItemsException(HTTPException):
+    def __init__(self, max_items: int):
+        super().__init__(
+            status_code=413,
+            detail=f"Too many items, the maximum is {max_items}",
+        )
+
+
 class GenericException(HTTPException):
     def __init__(self, message: str):
         super().__init__(
@@ -0,0 +1,101 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+import asyncio
+from typing import Callable, Dict, List
+
+import asyncpg
+
+from app.core.config import DB_URI
+
+# Seconds to wait before connecting again to the database
+LISTEN_RETRY_INTERVAL = 5
+
+
+class DatabaseListener:
+    """
+    Single connection per API worker receiving PostgreSQL notifications
+    (NOTIFY) and handing their payloads to the callbacks of each channel.
+
+    Notifications sent while disconnected are lost, so reset callbacks are
+    called with False on disconnection and with True once listening again.
+    """
+
+    def __init__(self):
+        self.listening = False
+        self._channels: Dict[str, List[Callable[[str], None]]] = {}
+        self._reset_callbacks: List[Callable[[bool], None]] = []
+        self._task = None
+
+    def add_channel(self, channel: str, callback: Callable[[str], None]):
+        self._channels.setdefault(channel, []).append(callback)
+
+    def add_reset_callback(self, callback: Callable[[bool], None]):
+        self._reset_callbacks.append(callback)
+
+    async def start(self):
+        if self._channels and self._task is None:
+            self._task = asyncio.ensure_future(self._listen_forever())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _reset(self, listening: bool):
+        self.listening = listening
+        for callback in self._reset_callbacks:
+            callback(listening)
+
+    def _dispatch(self, connection, pid: int, channel: str, payload: str):
+        for callback in self._channels[channel]:
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"Exception handling notification on {channel}: {e}")
+
+    async def _listen_forever(self):
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(DB_URI)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                for channel in self._channels:
+                    await connection.add_listener(channel, self._dispatch)
+                self._reset(True)
+                await closed.wait()
+                print("Connection receiving notifications was closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Exception receiving notifications: {e}")
+            finally:
+                if self.listening:
+                    self._reset(False)
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+            await asyncio.sleep(LISTEN_RETRY_INTERVAL)
+
+
+database_listener = DatabaseListener()
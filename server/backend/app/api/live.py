@@ -0,0 +1,156 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+import asyncio
+import json
+from typing import Dict, Set
+
+from app.core.config import LIVE_QUEUE_SIZE
+from app.db.utils import StatisticTypeEnum
+
+LIVE_EVENTS = {
+    StatisticTypeEnum.REPORT.value: "report",
+    StatisticTypeEnum.ALERT.value: "alert",
+}
+
+
+class LiveHub:
+    """
+    Fan out of new statistics and device status messages to the dashboards
+    connected to this API worker, see live_routes.
+
+    Events arrive through the database listener: statistics inserted by the
+    MQTT subscriber are announced on STATISTIC_CHANGES_CHANNEL and status
+    messages on DEVICE_STATUS_CHANNEL, so a single MQTT subscription serves
+    every dashboard. Each connection gets a bounded queue, where the oldest
+    events are dropped if the client doesn't keep up.
+    """
+
+    def __init__(self, queue_size: int = LIVE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.listening = False
+        self.last_status: Dict[str, Dict] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._counters = {"events": 0, "dropped": 0}
+
+    def subscribe(self, device_id: str) -> asyncio.Queue:
+        """
+        Start receiving the events of a device.
+
+        Arguments:
+            device_id {str} -- Device id.
+
+        Returns:
+            asyncio.Queue -- Queue of (event, data) tuples.
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(device_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, device_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(device_id, set())
+        queues.discard(queue)
+        if not queues:
+            self._subscribers.pop(device_id, None)
+
+    def publish(self, device_id: str, event: str, data: Dict):
+        """
+        Send an event to all the subscribers of a device.
+
+        Arguments:
+            device_id {str} -- Device id.
+            event {str} -- Event name: report, alert, status or resync.
+            data {Dict} -- Event data.
+        """
+        for queue in self._subscribers.get(device_id, ()):
+            if queue.full():
+                queue.get_nowait()
+                self._counters["dropped"] += 1
+            queue.put_nowait((event, data))
+            self._counters["events"] += 1
+
+    def on_statistic_changes(self, payload: str):
+        """
+        Publish the statistics included in a notification of
+        notify_statistic_changes, which are the new ones.
+        """
+        change = json.loads(payload)
+        device_id = change["device_id"]
+        if device_id not in self._subscribers:
+            return
+
+        for statistic in change.get("statistics", []):
+            statistic["device_id"] = device_id
+            self.publish(
+                device_id, LIVE_EVENTS[statistic["statistic_type"]], statistic
+            )
+
+    def on_device_status(self, payload: str):
+        """
+        Keep and publish a status message sent by notify_device_status.
+        """
+        status = json.loads(payload)
+        self.last_status[status["device_id"]] = status
+        self.publish(status["device_id"], "status", status)
+
+    def reset(self, listening: bool):
+        """
+        Tell the dashboards to fetch again what they show, since events
+        may have been missed while the database listener was disconnected.
+        """
+        if listening and not self.listening:
+            for device_id in list(self._subscribers):
+                self.publish(device_id, "resync", {"device_id": device_id})
+        self.listening = listening
+
+    def snapshot(self) -> Dict:
+        """
+        Current usage, for the metrics endpoint.
+
+        Returns:
+            Dict -- Connections, devices followed and events sent or dropped.
+        """
+        return {
+            **self._counters,
+            "connections": sum(
+                len(queues) for queues in self._subscribers.values()
+            ),
+            "devices": len(self._subscribers),
+            "listening": self.listening,
+        }
+
+
+def format_event(event: str, data: Dict) -> str:
+    """
+    Format an event as a Server-Sent Events message.
+
+    Arguments:
+        event {str} -- Event name.
+        data {Dict} -- Event data, sent as JSON.
+
+    Returns:
+        str -- Message, including the blank line that ends it.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+live_hub = LiveHub()
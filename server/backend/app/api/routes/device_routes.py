@@ -20,27 +20,59 @@
 # DEALINGS IN THE SOFTWARE.
 ################################################################################
 
+from datetime import datetime
+from enum import Enum
 from typing import Dict, List, Optional
 
 from app.api import GenericException, ItemAlreadyExist, NoItemFoundException
 from app.db.cruds import (
-    create_device,
+    async_get_device,
+    async_get_devices,
+    async_get_devices_latest,
+    async_get_files_by_device,
     delete_device,
     get_device,
-    get_devices,
     update_device,
-    get_files_by_device
+    upsert_devices,
 )
-from app.db.schema import DeviceSchema, VideoFileSchema, get_db_generator
+from app.db.schema import (
+    DeviceLatestSchema,
+    DeviceSchema,
+    DeviceSummarySchema,
+    VideoFileSchema,
+    get_async_db,
+    get_db_generator,
+)
+from databases.core import Connection
 from fastapi import APIRouter, Depends
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy.exc import DataError, IntegrityError
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import DataError
 from sqlalchemy.orm import Session
 from sqlalchemy.orm.exc import NoResultFound
 
 device_router = APIRouter()
 
 
+def jsonable_row_list(rows: List[Dict]) -> List[Dict]:
+    """
+    Convert the datetimes and enums of database rows to JSON types.
+
+    Arguments:
+        rows {List[Dict]} -- Rows read from the database.
+
+    Returns:
+        List[Dict] -- Rows ready to be serialized as JSON.
+    """
+    for row in rows:
+        for key, value in row.items():
+            if isinstance(value, datetime):
+                row[key] = value.isoformat()
+            elif isinstance(value, Enum):
+                row[key] = value.value
+    return rows
+
+
 @device_router.post("/devices", response_model=DeviceSchema)
 def create_device_item(
     device_information: DeviceSchema,
@@ -57,54 +89,72 @@ def create_device_item(
         Union[DeviceSchema, ItemAlreadyExist] -- Device instance that was added
         to the database or an error in case the device already exists.
     """
-    try:
-        device_information = jsonable_encoder(device_information)
-        return create_device(
-            db_session=db, device_information=device_information
-        )
-    except IntegrityError:
+    device_information = jsonable_encoder(device_information)
+
+    # Existing devices are skipped by the database instead of failing the transaction
+    if not upsert_devices(db_session=db, devices_information=[device_information]):
         raise ItemAlreadyExist()
 
+    return get_device(
+        db_session=db, device_id=device_information["id"].replace(" ", "_")
+    )
+
+
+@device_router.get("/devices/latest", response_model=List[DeviceLatestSchema])
+async def get_devices_latest_items(db: Connection = Depends(get_async_db)):
+    """
+    Get the last statistic, last alert and last hello and file list times of
+    all devices, for a fleet overview. Declared before the device routes so
+    that "latest" is not taken as a device id.
+
+    Arguments:
+        db {Connection} -- Async database connection.
+
+    Returns:
+        List[DeviceLatestSchema] -- Last values of every device.
+    """
+    devices = await async_get_devices_latest(connection=db)
+
+    # Already the schema types, skip validating thousands of rows again
+    return JSONResponse(content=jsonable_row_list(devices))
 
-@device_router.get("/devices/{device_id}", response_model=DeviceSchema)
-def get_device_item(
+
+@device_router.get("/devices/{device_id}", response_model=DeviceSummarySchema)
+async def get_device_item(
     device_id: str,
-    db: Session = Depends(get_db_generator),
+    db: Connection = Depends(get_async_db),
 ):
     """
     Get existing device.
 
     Arguments:
         device_id {str} -- Device id.
-        db {Session} -- Database session.
+        db {Connection} -- Async database connection.
 
     Returns:
-        Union[DeviceSchema, NoItemFoundException] -- Device instance which id is device_id
-        or an exception in case there's no matching device.
+        Union[DeviceSummarySchema, NoItemFoundException] -- Device which id is device_id,
+        with its latest statistic, or an exception in case there's no matching device.
 
     """
     try:
-        return get_device(db_session=db, device_id=device_id)
+        return await async_get_device(connection=db, device_id=device_id)
     except NoResultFound:
         raise NoItemFoundException()
 
 
-@device_router.get(
-    "/devices",
-    response_model=List[DeviceSchema],
-    response_model_include={"id", "description", "file_server_address"},
-)
-def get_devices_items(db: Session = Depends(get_db_generator)):
+@device_router.get("/devices", response_model=List[DeviceSummarySchema])
+async def get_devices_items(db: Connection = Depends(get_async_db)):
     """
     Get all existing devices.
 
     Arguments:
-        db {Session} -- Database session.
+        db {Connection} -- Async database connection.
 
     Returns:
-        List[DeviceSchema] -- All device instances present in the database.
+        List[DeviceSummarySchema] -- All devices present in the database, with their
+        latest statistic.
     """
-    return get_devices(db_session=db)
+    return await async_get_devices(connection=db)
 
 
 @device_router.put("/devices/{device_id}", response_model=DeviceSchema)
@@ -162,18 +212,18 @@ def delete_device_item(
 
 
 @device_router.get("/files/{device_id}", response_model=List[VideoFileSchema])
-def get_device_files(
+async def get_device_files(
     device_id: str,
-    db: Session = Depends(get_db_generator),
+    db: Connection = Depends(get_async_db),
 ):
     """
     Get existing video files in device.
 
     Arguments:
         device_id {str} -- Device id.
-        db {Session} -- Database session.
+        db {Connection} -- Async database connection.
 
     Returns:
         List[VideoFileSchema] -- VideoFile instances which device_id matches
     """
-    return get_files_by_device(db_session=db, device_id=device_id)
+    return await async_get_files_by_device(connection=db, device_id=device_id)
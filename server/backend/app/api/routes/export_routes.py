@@ -0,0 +1,183 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+from datetime import date, datetime
+from enum import Enum
+from typing import Iterator, List, Optional, Tuple, Union
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.db.cruds import iterate_statistics
+from app.db.schema import session_scope
+from app.db.utils import StatisticTypeEnum
+
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+
+export_router = APIRouter()
+
+# Low cardinality strings are dictionary encoded
+STATISTIC_ARROW_SCHEMA = pa.schema(
+    [
+        ("device_id", pa.dictionary(pa.int32(), pa.string())),
+        ("datetime", pa.timestamp("us", tz="UTC")),
+        ("statistic_type", pa.dictionary(pa.int8(), pa.string())),
+        ("people_with_mask", pa.int32()),
+        ("people_without_mask", pa.int32()),
+        ("people_total", pa.int32()),
+    ]
+)
+
+
+class ExportFormat(str, Enum):
+    ARROW = "arrow"
+    PARQUET = "parquet"
+
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.ARROW: "application/vnd.apache.arrow.stream",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet",
+}
+
+
+class ChunkSink:
+    """
+    Write-only file that keeps what was written until it's drained, so
+    Arrow writers can be streamed in a response.
+    """
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def to_record_batch(rows: List[Tuple]) -> pa.RecordBatch:
+    """
+    Convert statistic rows to an Arrow record batch.
+
+    Arguments:
+        rows {List[Tuple]} -- Rows returned by iterate_statistics.
+
+    Returns:
+        pa.RecordBatch -- Batch with the STATISTIC_ARROW_SCHEMA schema.
+    """
+    columns = zip(*rows)
+    return pa.RecordBatch.from_arrays(
+        [
+            pa.array(column, type=field.type)
+            for column, field in zip(columns, STATISTIC_ARROW_SCHEMA)
+        ],
+        schema=STATISTIC_ARROW_SCHEMA,
+    )
+
+
+def generate_export(
+    file_format: ExportFormat,
+    device_id: Optional[str],
+    from_date: Optional[Union[datetime, date]],
+    to_date: Optional[Union[datetime, date]],
+    statistic_type: Optional[StatisticTypeEnum],
+) -> Iterator[bytes]:
+    """
+    Encode the statistics matching the filters, one record batch at a time.
+    """
+    sink = ChunkSink()
+    if file_format == ExportFormat.PARQUET:
+        writer = pq.ParquetWriter(sink, STATISTIC_ARROW_SCHEMA)
+    else:
+        writer = pa.ipc.new_stream(sink, STATISTIC_ARROW_SCHEMA)
+
+    # The session lives as long as the response is being streamed
+    with session_scope() as database_session:
+        for rows in iterate_statistics(
+            db_session=database_session,
+            device_id=device_id,
+            from_date=from_date,
+            to_date=to_date,
+            statistic_type=statistic_type,
+        ):
+            batch = to_record_batch(rows)
+            if file_format == ExportFormat.PARQUET:
+                # Every batch is a row group
+                writer.write_table(pa.Table.from_batches([batch]))
+            else:
+                writer.write_batch(batch)
+            yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
+
+
+@export_router.get("/statistics/export")
+def export_statistics_items(
+    file_format: ExportFormat = Query(ExportFormat.PARQUET, alias="format"),
+    device_id: Optional[str] = Query(None),
+    datefrom: Optional[Union[datetime, date]] = Query(None),
+    dateto: Optional[Union[datetime, date]] = Query(None),
+    statistic_type: Optional[StatisticTypeEnum] = Query(None),
+):
+    """
+    Export statistics as an Apache Arrow IPC stream or a Parquet file,
+    streamed in record batches of EXPORT_BATCH_SIZE rows. Filters are
+    validated before streaming, invalid ones get a 422 response.
+
+    Arguments:
+        file_format {ExportFormat} -- "arrow" or "parquet".
+        device_id {Optional[str]} -- Only export this device.
+        datefrom {Optional[Union[datetime, date]]} -- Datetime to export
+        information from.
+        dateto {Optional[Union[datetime, date]]} -- Datetime to export
+        information to.
+        statistic_type {Optional[StatisticTypeEnum]} -- REPORT or ALERT.
+
+    Returns:
+        StreamingResponse -- Statistics sorted by device and datetime.
+    """
+    extension = "arrows" if file_format == ExportFormat.ARROW else "parquet"
+    return StreamingResponse(
+        generate_export(
+            file_format, device_id, datefrom, dateto, statistic_type
+        ),
+        media_type=EXPORT_MEDIA_TYPES[file_format],
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="statistics.{extension}"'
+            )
+        },
+    )
@@ -0,0 +1,114 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+import asyncio
+from typing import AsyncIterator, Dict
+
+from app.api import NoItemFoundException, format_event, live_hub
+from app.core.config import LIVE_KEEPALIVE_INTERVAL
+
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+
+live_router = APIRouter()
+
+
+async def generate_live_events(
+    request: Request, device_id: str, last_status: bool
+) -> AsyncIterator[str]:
+    """
+    Stream the events of a device until the client disconnects.
+
+    Arguments:
+        request {Request} -- Request, to detect disconnections.
+        device_id {str} -- Device id.
+        last_status {bool} -- Send the last known status first.
+
+    Returns:
+        AsyncIterator[str] -- Server-Sent Events messages.
+    """
+    queue = live_hub.subscribe(device_id)
+    try:
+        # Clients can send commands to the device once they get this
+        yield ": connected\n\n"
+
+        status = live_hub.last_status.get(device_id)
+        if last_status and status is not None:
+            yield format_event("status", status)
+
+        while True:
+            try:
+                event, data = await asyncio.wait_for(
+                    queue.get(), LIVE_KEEPALIVE_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                # Keeps proxies from closing idle connections
+                yield ": keepalive\n\n"
+                continue
+
+            yield format_event(event, data)
+    finally:
+        live_hub.unsubscribe(device_id, queue)
+
+
+@live_router.get("/devices/{device_id}/live")
+async def get_device_live_events(
+    request: Request, device_id: str, last_status: bool = True
+):
+    """
+    Push new statistics and status messages of a device to a dashboard,
+    as Server-Sent Events: report, alert and status events with JSON data,
+    and resync when events may have been missed.
+
+    Arguments:
+        request {Request} -- Request, to detect disconnections.
+        device_id {str} -- Device id.
+        last_status {bool} -- Send the last known status first.
+
+    Returns:
+        StreamingResponse -- text/event-stream response.
+    """
+    return StreamingResponse(
+        generate_live_events(request, device_id, last_status),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@live_router.get("/devices/{device_id}/status")
+def get_device_status(device_id: str) -> Dict:
+    """
+    Get the last status message sent by a device.
+
+    Arguments:
+        device_id {str} -- Device id.
+
+    Returns:
+        Union[Dict, NoItemFoundException] -- Status message or an exception
+        in case the device didn't send its status since the API started.
+    """
+    status = live_hub.last_status.get(device_id)
+    if status is None:
+        raise NoItemFoundException()
+    return status
@@ -20,21 +20,61 @@
 # DEALINGS IN THE SOFTWARE.
 ################################################################################
 
-from typing import Dict, List, Optional
-
-from app.api import GenericException, ItemAlreadyExist, NoItemFoundException
+import json
+from datetime import datetime, timezone
+from enum import Enum
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app.api import (
+    CachedResponse,
+    GenericException,
+    InvalidCursorException,
+    ItemAlreadyExist,
+    NoItemFoundException,
+    TooManyItemsException,
+    cache_datetime,
+    request_key,
+    statistics_cache,
+)
+from app.core.config import (
+    STATISTICS_BULK_MAX_ITEMS,
+    STATISTICS_MAX_PAGE_SIZE,
+    STATISTICS_PAGE_SIZE,
+)
 from app.db.cruds import (
-    create_statistic,
+    bulk_insert_statistics,
+    async_get_statistics_aggregate,
+    async_get_statistics_page,
     delete_statistic,
     get_statistic,
-    get_statistics,
-    get_statistics_from_to,
     update_statistic,
+    upsert_statistics,
+)
+from app.db.schema import (
+    StatisticAggregateSchema,
+    StatisticBulkItemSchema,
+    StatisticBulkResultSchema,
+    StatisticSchema,
+    async_database,
+    get_async_db,
+    get_db_generator,
+)
+from app.db.utils import (
+    StatisticBucketEnum,
+    convert_timestamp_to_datetime,
+    decode_cursor,
+    encode_cursor,
+    get_enum_type,
 )
-from app.db.schema import StatisticSchema, get_db_generator
-from app.db.utils import convert_timestamp_to_datetime, get_enum_type
 
-from fastapi import APIRouter, Depends, Query
+from databases.core import Connection
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError, parse_obj_as
+from pydantic.error_wrappers import ErrorWrapper
 from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.orm import Session
 from sqlalchemy.orm.exc import NoResultFound
@@ -42,6 +82,133 @@ from sqlalchemy.orm.exc import NoResultFound
 statistic_router = APIRouter()
 
 
+class ListFormat(str, Enum):
+    JSON = "json"
+    NDJSON = "ndjson"
+
+
+def encode_statistic(statistic: Dict) -> Dict:
+    """
+    Convert a statistic to JSON types, like StatisticSchema does, without
+    validating it again.
+
+    Arguments:
+        statistic {Dict} -- Statistic read from the database.
+
+    Returns:
+        Dict -- Statistic ready to be serialized as JSON.
+    """
+    statistic["datetime"] = statistic["datetime"].isoformat()
+    statistic["statistic_type"] = statistic["statistic_type"].value
+    return statistic
+
+
+async def generate_ndjson(
+    device_id: Optional[str],
+    from_date: Optional[str],
+    to_date: Optional[str],
+    after: Optional[Tuple[str, datetime]],
+) -> AsyncIterator[bytes]:
+    """
+    Encode the statistics that follow after as NDJSON, one page of
+    STATISTICS_MAX_PAGE_SIZE statistics at a time.
+    """
+    while True:
+        # The connection is only held while a page is being read
+        async with async_database.connection() as connection:
+            statistics = await async_get_statistics_page(
+                connection=connection,
+                limit=STATISTICS_MAX_PAGE_SIZE,
+                device_id=device_id,
+                from_date=from_date,
+                to_date=to_date,
+                after=after,
+            )
+
+        if not statistics:
+            break
+
+        after = (statistics[-1]["device_id"], statistics[-1]["datetime"])
+        yield "".join(
+            json.dumps(encode_statistic(statistic)) + "\n"
+            for statistic in statistics
+        ).encode()
+
+        if len(statistics) < STATISTICS_MAX_PAGE_SIZE:
+            break
+
+
+async def list_statistics(
+    request: Request,
+    db: Connection,
+    limit: int,
+    cursor: Optional[str],
+    list_format: ListFormat,
+    device_id: Optional[str] = None,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    cacheable: bool = True,
+):
+    """
+    Respond with a page of statistics and the cursor of the next page in
+    the X-Next-Cursor header, or with all of them streamed as NDJSON.
+    Pages are cached unless cacheable is False, e.g: when the range ends
+    at the current time.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise InvalidCursorException()
+
+    if list_format == ListFormat.NDJSON:
+        return StreamingResponse(
+            generate_ndjson(device_id, from_date, to_date, after),
+            media_type="application/x-ndjson",
+        )
+
+    try:
+        cache_from, cache_to = cache_datetime(from_date), cache_datetime(
+            to_date
+        )
+    except ValueError:
+        cacheable, cache_from, cache_to = False, None, None
+
+    key = request_key(request)
+    changes = statistics_cache.changes
+    entry = statistics_cache.get(key) if cacheable else None
+
+    if entry is None:
+        # One more statistic tells if there is a next page
+        statistics = await async_get_statistics_page(
+            connection=db,
+            limit=limit + 1,
+            device_id=device_id,
+            from_date=from_date,
+            to_date=to_date,
+            after=after,
+        )
+
+        headers = {}
+        if len(statistics) > limit:
+            statistics = statistics[:limit]
+            headers["X-Next-Cursor"] = encode_cursor(
+                statistics[-1]["device_id"], statistics[-1]["datetime"]
+            )
+
+        body = json.dumps(
+            [encode_statistic(statistic) for statistic in statistics],
+            separators=(",", ":"),
+        ).encode()
+        entry = statistics_cache.put(
+            key,
+            CachedResponse(body, device_id, cache_from, cache_to, headers),
+            changes,
+            cacheable,
+        )
+
+    return statistics_cache.respond(request, entry)
+
+
 @statistic_router.post(
     "/devices/{device_id}/statistics", response_model=StatisticSchema
 )
@@ -62,21 +229,237 @@ def create_statistic_item(
         Union[StatisticSchema, ItemAlreadyExist] -- Statistic instance that was added
         to the database or an exception in case a statistic already exists.
     """
+    # Format input data
+    statistic_information["device_id"] = device_id
+    statistic_information["datetime"] = convert_timestamp_to_datetime(
+        statistic_information["datetime"]
+    )
+    statistic_information["statistic_type"] = get_enum_type(
+        statistic_information["statistic_type"]
+    )
+
     try:
-        # Format input data
-        statistic_information["device_id"] = device_id
-        statistic_information["datetime"] = convert_timestamp_to_datetime(
-            statistic_information["datetime"]
-        )
-        statistic_information["statistic_type"] = get_enum_type(
-            statistic_information["statistic_type"]
+        # Existing statistics are skipped by the database instead of failing the transaction
+        if not upsert_statistics(
+            db_session=db, statistics_information=[statistic_information]
+        ):
+            raise ItemAlreadyExist()
+    except IntegrityError:
+        raise ItemAlreadyExist()
+
+    return get_statistic(
+        db_session=db,
+        device_id=device_id,
+        datetime=statistic_information["datetime"],
+    )
+
+
+def parse_bulk_statistics(
+    body: bytes, content_type: str, device_id: Optional[str] = None
+) -> List[Dict]:
+    """
+    Decode and validate the statistics sent to the bulk endpoints, as a JSON
+    array or as NDJSON (one statistic per line).
+
+    Arguments:
+        body {bytes} -- Request body.
+        content_type {str} -- Request content type.
+        device_id {Optional[str]} -- Device of all the statistics, which can
+        then omit it.
+
+    Returns:
+        Union[List[Dict], RequestValidationError, TooManyItemsException] --
+        Statistics ready to insert, or an exception in case the body is not
+        valid or has too many statistics.
+    """
+    try:
+        if content_type.startswith("application/x-ndjson"):
+            items = [
+                json.loads(line) for line in body.splitlines() if line.strip()
+            ]
+        else:
+            items = json.loads(body)
+    except ValueError as e:
+        raise RequestValidationError([ErrorWrapper(e, ("body",))])
+
+    if not isinstance(items, list):
+        items = [items]
+    if len(items) > STATISTICS_BULK_MAX_ITEMS:
+        raise TooManyItemsException(STATISTICS_BULK_MAX_ITEMS)
+
+    if device_id is not None:
+        for item in items:
+            if isinstance(item, dict):
+                item.setdefault("device_id", device_id)
+
+    try:
+        statistics = parse_obj_as(List[StatisticBulkItemSchema], items)
+    except ValidationError as e:
+        raise RequestValidationError([ErrorWrapper(e, ("body",))])
+
+    if device_id is not None:
+        errors = [
+            ErrorWrapper(
+                ValueError("must match the device in the path"),
+                ("body", index, "device_id"),
+            )
+            for index, statistic in enumerate(statistics)
+            if statistic.device_id != device_id
+        ]
+        if errors:
+            raise RequestValidationError(errors)
+
+    return [statistic.dict() for statistic in statistics]
+
+
+async def ingest_statistics(
+    request: Request, db: Session, device_id: Optional[str] = None
+) -> Dict:
+    """
+    Insert the statistics sent to a bulk endpoint in one transaction.
+
+    Returns:
+        Dict -- Statistics received, inserted and in conflict (they already
+        existed or were repeated), in total and by device.
+    """
+    statistics_information = parse_bulk_statistics(
+        await request.body(),
+        request.headers.get("content-type", ""),
+        device_id,
+    )
+
+    try:
+        devices = await run_in_threadpool(
+            bulk_insert_statistics,
+            db_session=db,
+            statistics_information=statistics_information,
         )
+    except NoResultFound:
+        raise NoItemFoundException()
+    except DataError as e:
+        raise GenericException(e)
+
+    return {
+        "received": sum(counts["received"] for counts in devices.values()),
+        "inserted": sum(counts["inserted"] for counts in devices.values()),
+        "conflicts": sum(counts["conflicts"] for counts in devices.values()),
+        "devices": devices,
+    }
+
+
+@statistic_router.post(
+    "/devices/{device_id}/statistics/bulk",
+    response_model=StatisticBulkResultSchema,
+)
+async def create_device_statistics_bulk(
+    request: Request,
+    device_id: str,
+    db: Session = Depends(get_db_generator),
+):
+    """
+    Create many statistics of a device at once (e.g: backfilling the time it
+    was offline), sent as a JSON array or as NDJSON. Statistics that already
+    exist are skipped and counted as conflicts.
+
+    Arguments:
+        request {Request} -- Request, with the statistics in the body.
+        device_id {str} -- Device id which sent the statistics.
+        db {Session} -- Database session.
+
+    Returns:
+        Union[StatisticBulkResultSchema, NoItemFoundException] -- Statistics
+        received, inserted and in conflict, or an exception in case the
+        device is not registered.
+    """
+    return await ingest_statistics(request, db, device_id)
+
+
+@statistic_router.post(
+    "/statistics/bulk", response_model=StatisticBulkResultSchema
+)
+async def create_statistics_bulk(
+    request: Request,
+    db: Session = Depends(get_db_generator),
+):
+    """
+    Create many statistics of any devices at once, sent as a JSON array or
+    as NDJSON. Statistics that already exist are skipped and counted as
+    conflicts.
 
-        return create_statistic(
-            db_session=db, statistic_information=statistic_information
+    Arguments:
+        request {Request} -- Request, with the statistics in the body.
+        db {Session} -- Database session.
+
+    Returns:
+        Union[StatisticBulkResultSchema, NoItemFoundException] -- Statistics
+        received, inserted and in conflict, in total and by device, or an
+        exception in case some device is not registered (nothing is
+        inserted then).
+    """
+    return await ingest_statistics(request, db)
+
+
+@statistic_router.get(
+    "/devices/{device_id}/statistics/aggregate",
+    response_model=StatisticAggregateSchema,
+)
+async def get_device_statistics_aggregate(
+    request: Request,
+    device_id: str,
+    bucket: StatisticBucketEnum = Query(StatisticBucketEnum.HOUR),
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    db: Connection = Depends(get_async_db),
+):
+    """
+    Get the statistics of a device added up by time bucket, ready to plot.
+    Declared before the statistic item routes so that "aggregate" is not
+    taken as a timestamp. Cached when the range has an end.
+
+    Arguments:
+        request {Request} -- Request, to check If-None-Match.
+        device_id {str} -- Device id.
+        bucket {StatisticBucketEnum} -- Time bucket: minute, hour, day, week
+        or month.
+        from_date {Optional[datetime]} -- Datetime to show information from.
+        to_date {Optional[datetime]} -- Datetime to show information to,
+        now by default.
+        db {Connection} -- Async database connection.
+
+    Returns:
+        StatisticAggregateSchema -- Reports and alerts, each one with the
+        bucket start dates and the totals of every bucket, or None if there
+        are no statistics of that type.
+    """
+    key = request_key(request)
+    changes = statistics_cache.changes
+    cacheable = to_date is not None
+    entry = statistics_cache.get(key) if cacheable else None
+
+    if entry is None:
+        chart_data = await async_get_statistics_aggregate(
+            connection=db,
+            device_id=device_id,
+            bucket=bucket,
+            from_date=from_date,
+            to_date=to_date,
+        )
+        body = json.dumps(
+            jsonable_encoder(chart_data), separators=(",", ":")
+        ).encode()
+        entry = statistics_cache.put(
+            key,
+            CachedResponse(
+                body,
+                device_id,
+                cache_datetime(from_date),
+                cache_datetime(to_date),
+            ),
+            changes,
+            cacheable,
         )
-    except IntegrityError:
-        raise ItemAlreadyExist()
+
+    return statistics_cache.respond(request, entry)
 
 
 @statistic_router.get(
@@ -114,24 +497,36 @@ def get_statistic_item(
     "/devices/{device_id}/statistics",
     response_model=List[StatisticSchema],
 )
-def get_all_device_statistics_items(
+async def get_all_device_statistics_items(
+    request: Request,
     device_id: str,
     datefrom: Optional[str] = Query(None),
     dateto: Optional[str] = Query(None),
     timestampfrom: Optional[float] = Query(None),
     timestampto: Optional[float] = Query(None),
-    db: Session = Depends(get_db_generator),
+    limit: int = Query(
+        STATISTICS_PAGE_SIZE, ge=1, le=STATISTICS_MAX_PAGE_SIZE
+    ),
+    cursor: Optional[str] = Query(None),
+    list_format: ListFormat = Query(ListFormat.JSON, alias="format"),
+    db: Connection = Depends(get_async_db),
 ):
     """
-    Get all statistics of a specific device.
+    Get the statistics of a specific device, sorted by datetime.
+    Cached when the range has an end.
 
     Arguments:
+        request {Request} -- Request, to check If-None-Match.
         device_id {str} -- Device id.
         datefrom {Optional[str]} -- Datetime to show information from.
         dateto {Optional[str]} -- Datetime to show information to.
         timestampfrom {Optional[float]} -- Timestamp to show information from.
         timestampto {Optional[float]} -- Timestamp to show information from.
-        db {Session} -- Database session.
+        limit {int} -- Maximum number of statistics in the page.
+        cursor {Optional[str]} -- X-Next-Cursor of the previous page.
+        list_format {ListFormat} -- "json" for a page of statistics, or
+        "ndjson" to stream all of them.
+        db {Connection} -- Async database connection.
 
     Returns:
         List[StatisticSchema] -- Statistic instances defined by device_id and
@@ -146,11 +541,22 @@ def get_all_device_statistics_items(
     if not to_datetime and timestampto:
         to_datetime = convert_timestamp_to_datetime(timestampto)
 
-    return get_statistics_from_to(
-        db_session=db,
+    # Until the current moment, the response may change without new statistics
+    cacheable = bool(to_datetime)
+    if not to_datetime:
+        # By default, show information until the current moment
+        to_datetime = datetime.now(timezone.utc)
+
+    return await list_statistics(
+        request=request,
+        db=db,
+        limit=limit,
+        cursor=cursor,
+        list_format=list_format,
         device_id=device_id,
         from_date=from_datetime,
         to_date=to_datetime,
+        cacheable=cacheable,
     )
 
 
@@ -158,17 +564,36 @@ def get_all_device_statistics_items(
     "/statistics",
     response_model=List[StatisticSchema],
 )
-def get_all_statistics_items(db: Session = Depends(get_db_generator)):
+async def get_all_statistics_items(
+    request: Request,
+    limit: int = Query(
+        STATISTICS_PAGE_SIZE, ge=1, le=STATISTICS_MAX_PAGE_SIZE
+    ),
+    cursor: Optional[str] = Query(None),
+    list_format: ListFormat = Query(ListFormat.JSON, alias="format"),
+    db: Connection = Depends(get_async_db),
+):
     """
-    Get all statistics from all devices.
+    Get the statistics from all devices, sorted by device and datetime.
 
     Arguments:
-        db {Session} -- Database session.
+        request {Request} -- Request, to check If-None-Match.
+        limit {int} -- Maximum number of statistics in the page.
+        cursor {Optional[str]} -- X-Next-Cursor of the previous page.
+        list_format {ListFormat} -- "json" for a page of statistics, or
+        "ndjson" to stream all of them.
+        db {Connection} -- Async database connection.
 
     Returns:
-        List[StatisticSchema] -- All statistic instances present in the database.
+        List[StatisticSchema] -- Statistic instances present in the database.
     """
-    return get_statistics(db_session=db)
+    return await list_statistics(
+        request=request,
+        db=db,
+        limit=limit,
+        cursor=cursor,
+        list_format=list_format,
+    )
 
 
 @statistic_router.put(
@@ -27,7 +27,8 @@ DB_USER = os.environ["POSTGRES_USER"]
 DB_PASSWORD = os.environ["POSTGRES_PASSWORD"]
 DB_NAME = os.environ["POSTGRES_DB"]
 DB_PORT = os.environ["POSTGRES_PORT"]
-DB_URI = f"postgresql://{DB_USER}:{DB_PASSWORD}@db:{DB_PORT}/{DB_NAME}"
+DB_HOST = os.environ.get("POSTGRES_HOST", "db")
+DB_URI = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 # MQTT broker configuration
 MQTT_BROKER = os.environ["MQTT_BROKER"]
@@ -36,9 +37,105 @@ MQTT_BROKER_PORT = int(os.environ["MQTT_BROKER_PORT"])
 # MQTT subscriber configuration
 SUBSCRIBER_CLIENT_ID = os.environ["SUBSCRIBER_CLIENT_ID"]
 
+# Number of subscriber processes started by the supervisor. With more than one,
+# statistics are load balanced with a shared subscription on SUBSCRIBER_SHARE_GROUP
+# and the other messages are partitioned by device id
+SUBSCRIBER_WORKERS = int(os.environ.get("SUBSCRIBER_WORKERS", 1))
+SUBSCRIBER_SHARE_GROUP = os.environ.get("SUBSCRIBER_SHARE_GROUP", "maskcam-backend")
+
+# Statistics are written in bulk: every INGEST_BATCH_SIZE rows or
+# INGEST_FLUSH_INTERVAL seconds, whichever comes first
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 500))
+INGEST_FLUSH_INTERVAL = float(os.environ.get("INGEST_FLUSH_INTERVAL", 1.0))
+INGEST_METRICS_INTERVAL = float(os.environ.get("INGEST_METRICS_INTERVAL", 60))
+# Bounded queues between ingestion stages: messages are dropped when the
+# receive queue is full, decoding blocks while too many statistics are pending
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", 10000))
+INGEST_MAX_PENDING = int(os.environ.get("INGEST_MAX_PENDING", 5000))
+# Threads (and so database connections) writing statistic batches
+INGEST_DB_WORKERS = int(os.environ.get("INGEST_DB_WORKERS", 2))
+# Seconds before writing a batch again while the database is unavailable,
+# doubled on every attempt up to INGEST_RETRY_MAX_INTERVAL
+INGEST_RETRY_INTERVAL = float(os.environ.get("INGEST_RETRY_INTERVAL", 0.5))
+INGEST_RETRY_MAX_INTERVAL = float(os.environ.get("INGEST_RETRY_MAX_INTERVAL", 30))
+
+# The statistic table is partitioned by month: partitions are created
+# STATISTIC_PARTITIONS_AHEAD months in advance, and the ones older than
+# STATISTIC_RETENTION_MONTHS are dropped (0 keeps them forever)
+STATISTIC_PARTITIONS_AHEAD = int(os.environ.get("STATISTIC_PARTITIONS_AHEAD", 3))
+STATISTIC_RETENTION_MONTHS = int(os.environ.get("STATISTIC_RETENTION_MONTHS", 0))
+
+# Database connection pool, tuned per process type: "api" (default),
+# "subscriber" (set by the supervisor) or "script" (maintenance commands).
+# Each setting can be overridden with <PROCESS TYPE>_<SETTING>, e.g: API_DB_POOL_SIZE
+DB_PROCESS_TYPE = os.environ.get("DB_PROCESS_TYPE", "api")
+DB_POOL_DEFAULTS = {
+    # Every API worker process has its own pool
+    "api": {
+        "DB_POOL_SIZE": 5,
+        "DB_MAX_OVERFLOW": 10,
+        "DB_STATEMENT_TIMEOUT": 30000,
+    },
+    # Statistic writers, the event thread and the device registry
+    "subscriber": {
+        "DB_POOL_SIZE": INGEST_DB_WORKERS + 2,
+        "DB_MAX_OVERFLOW": 2,
+        "DB_STATEMENT_TIMEOUT": 60000,
+    },
+    # Partition management and rollup rebuilds may run for a long time
+    "script": {
+        "DB_POOL_SIZE": 1,
+        "DB_MAX_OVERFLOW": 1,
+        "DB_STATEMENT_TIMEOUT": 0,
+    },
+}
+
+
+def get_pool_setting(name: str, default=None):
+    defaults = DB_POOL_DEFAULTS.get(DB_PROCESS_TYPE, DB_POOL_DEFAULTS["api"])
+    return os.environ.get(
+        f"{DB_PROCESS_TYPE.upper()}_{name}", defaults.get(name, default)
+    )
+
+
+DB_POOL_SIZE = int(get_pool_setting("DB_POOL_SIZE"))
+DB_MAX_OVERFLOW = int(get_pool_setting("DB_MAX_OVERFLOW"))
+# Seconds to wait for a connection before failing
+DB_POOL_TIMEOUT = float(get_pool_setting("DB_POOL_TIMEOUT", 30))
+# Seconds after which connections are replaced, before the server drops them
+DB_POOL_RECYCLE = int(get_pool_setting("DB_POOL_RECYCLE", 1800))
+# Test connections on checkout, so broken ones are replaced transparently
+DB_POOL_PRE_PING = get_pool_setting("DB_POOL_PRE_PING", "true").lower() == "true"
+# Milliseconds before PostgreSQL cancels a statement (0 disables it)
+DB_STATEMENT_TIMEOUT = int(get_pool_setting("DB_STATEMENT_TIMEOUT"))
+# Connections of the async (asyncpg) pool used by the API read endpoints
+DB_ASYNC_POOL_SIZE = int(get_pool_setting("DB_ASYNC_POOL_SIZE", 10))
+
+# Rows per record batch (and Parquet row group) of the statistics export
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 50000))
+
+# Default and maximum number of statistics per page of the listing endpoints
+STATISTICS_PAGE_SIZE = int(os.environ.get("STATISTICS_PAGE_SIZE", 1000))
+STATISTICS_MAX_PAGE_SIZE = int(os.environ.get("STATISTICS_MAX_PAGE_SIZE", 10000))
+
+# Maximum number of statistics per request of the bulk ingestion endpoints
+STATISTICS_BULK_MAX_ITEMS = int(os.environ.get("STATISTICS_BULK_MAX_ITEMS", 100000))
+
+# Response cache of the statistics endpoints, per API worker (0 bytes disables it)
+STATISTICS_CACHE_MAX_BYTES = int(os.environ.get("STATISTICS_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+STATISTICS_CACHE_TTL = float(os.environ.get("STATISTICS_CACHE_TTL", 300))
+
+# Live updates: events buffered per dashboard connection and seconds between keepalives
+LIVE_QUEUE_SIZE = int(os.environ.get("LIVE_QUEUE_SIZE", 100))
+LIVE_KEEPALIVE_INTERVAL = float(os.environ.get("LIVE_KEEPALIVE_INTERVAL", 15))
+
+# Responses smaller than this number of bytes are sent without compression
+GZIP_MINIMUM_SIZE = int(os.environ.get("GZIP_MINIMUM_SIZE", 1000))
+
 # Topic configuration
 MQTT_HELLO_TOPIC = "hello"
 MQTT_ALERT_TOPIC = "alerts"
 MQTT_REPORT_TOPIC = "receive-from-jetson"
 MQTT_SEND_TOPIC = "send-to-jetson"
 MQTT_FILES_TOPIC = "video-files"
+MQTT_STATUS_TOPIC = "device-status"
@@ -20,20 +20,55 @@
 # DEALINGS IN THE SOFTWARE.
 ################################################################################
 
+from .crud_async import (
+    async_get_device,
+    async_get_devices,
+    async_get_devices_latest,
+    async_get_files_by_device,
+    async_get_statistics_aggregate,
+    async_get_statistics_page,
+)
 from .crud_device import (
+    DEVICE_DELETED_CHANNEL,
+    DEVICE_STATUS_CHANNEL,
     create_device,
     delete_device,
     get_device,
+    get_device_ids,
+    get_device_summary_query,
     get_devices,
+    notify_device_status,
     update_device,
+    to_device_summary,
+    upsert_devices,
+)
+from .crud_device_latest import (
+    LATEST_EVENTS,
+    add_statistics_to_latest,
+    get_devices_latest,
+    refresh_device_latest,
+    update_latest_event,
 )
 from .crud_statistic import (
+    STATISTIC_CHANGES_CHANNEL,
+    add_statistics,
+    bulk_insert_statistics,
     create_statistic,
     delete_statistic,
     get_statistic,
     get_statistics,
     get_statistics_from_to,
+    iterate_statistics,
+    notify_statistic_changes,
     update_statistic,
+    upsert_statistics,
+)
+from .crud_statistic_rollup import (
+    ROLLUP_MODELS,
+    add_statistics_to_rollups,
+    get_statistic_rollups,
+    get_statistics_aggregate,
+    refresh_statistic_rollups,
 )
 from .crud_video_file import (
     update_files,
@@ -0,0 +1,207 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple, Union
+
+from app.db.schema import (
+    DeviceLatestModel,
+    StatisticsModel,
+    VideoFilesModel,
+)
+from app.db.utils import StatisticBucketEnum
+
+from .crud_device import get_device_summary_query, to_device_summary
+from .crud_statistic_rollup import get_aggregate_query, to_chart_data
+
+from databases.core import Connection
+from sqlalchemy import DateTime, Text, cast, literal, select, tuple_
+from sqlalchemy.orm.exc import NoResultFound
+
+# Async versions of the CRUD read functions, used by the API read endpoints.
+# They return dicts instead of ORM instances, with the same fields.
+
+
+def as_timestamp(value: Union[str, datetime]):
+    """
+    Convert a datetime filter to a query parameter. asyncpg only accepts
+    naive datetimes for timestamp columns, and strings are parsed by
+    PostgreSQL, just like the sync queries do.
+
+    Arguments:
+        value {Union[str, datetime]} -- Datetime or datetime string.
+
+    Returns:
+        Query parameter to compare with the datetime column.
+    """
+    if isinstance(value, str):
+        return cast(cast(literal(value), Text), DateTime)
+
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return value
+
+
+async def async_get_device(connection: Connection, device_id: str) -> Dict:
+    """
+    Get a device along with its latest statistic.
+
+    Arguments:
+        connection {Connection} -- Async database connection.
+        device_id {str} -- Jetson id.
+
+    Returns:
+        Dict -- Device summary or an exception in case there's
+        no matching device.
+    """
+    device = await connection.fetch_one(get_device_summary_query(device_id))
+
+    if device is None:
+        raise NoResultFound()
+
+    return to_device_summary(device)
+
+
+async def async_get_devices(connection: Connection) -> List[Dict]:
+    """
+    Get all devices along with their latest statistic.
+
+    Arguments:
+        connection {Connection} -- Async database connection.
+
+    Returns:
+        List[Dict] -- Summaries of all devices present in the database.
+    """
+    return [
+        to_device_summary(device)
+        for device in await connection.fetch_all(get_device_summary_query())
+    ]
+
+
+async def async_get_devices_latest(connection: Connection) -> List[Dict]:
+    """
+    Get the last values of all devices, from the device_latest table.
+
+    Arguments:
+        connection {Connection} -- Async database connection.
+
+    Returns:
+        List[Dict] -- Last statistic, last alert and last hello and file
+        list times of every device.
+    """
+    latest = DeviceLatestModel.__table__
+    query = select([latest]).order_by(latest.c.device_id)
+    return [dict(device) for device in await connection.fetch_all(query)]
+
+
+async def async_get_statistics_page(
+    connection: Connection,
+    limit: int,
+    device_id: Optional[str] = None,
+    from_date: Optional[Union[str, datetime]] = None,
+    to_date: Optional[Union[str, datetime]] = None,
+    after: Optional[Tuple[str, datetime]] = None,
+) -> List[Dict]:
+    """
+    Get a page of statistics sorted by device and datetime, using the
+    primary key as a keyset, so every page costs the same to read no
+    matter how deep it is.
+
+    Arguments:
+        connection {Connection} -- Async database connection.
+        limit {int} -- Maximum number of statistics in the page.
+        device_id {Optional[str]} -- Only statistics of this device.
+        from_date {Optional[Union[str, datetime]]} -- Beginning of datetime range.
+        to_date {Optional[Union[str, datetime]]} -- End of datetime range.
+        after {Optional[Tuple[str, datetime]]} -- Device id and datetime of
+        the last statistic of the previous page.
+
+    Returns:
+        List[Dict] -- Statistics that follow after, up to limit.
+    """
+    statistics = StatisticsModel.__table__
+    query = select([statistics])
+
+    if device_id:
+        query = query.where(statistics.c.device_id == device_id)
+
+    if from_date:
+        query = query.where(statistics.c.datetime >= as_timestamp(from_date))
+
+    if to_date:
+        query = query.where(statistics.c.datetime <= as_timestamp(to_date))
+
+    if after is not None:
+        after_device_id, after_datetime = after
+        query = query.where(
+            tuple_(statistics.c.device_id, statistics.c.datetime)
+            > tuple_(literal(after_device_id), as_timestamp(after_datetime))
+        )
+
+    query = query.order_by(
+        statistics.c.device_id, statistics.c.datetime
+    ).limit(limit)
+
+    return [dict(statistic) for statistic in await connection.fetch_all(query)]
+
+
+async def async_get_statistics_aggregate(
+    connection: Connection,
+    device_id: str,
+    bucket: StatisticBucketEnum,
+    from_date: Optional[datetime] = None,
+    to_date: Optional[datetime] = None,
+) -> Dict:
+    """
+    Get the statistics of a device added up by time bucket, as chart data.
+
+    Arguments:
+        connection {Connection} -- Async database connection.
+        device_id {str} -- Jetson id.
+        bucket {StatisticBucketEnum} -- Time bucket to aggregate by.
+        from_date {Optional[datetime]} -- Beginning of datetime range.
+        to_date {Optional[datetime]} -- End of datetime range.
+
+    Returns:
+        Dict -- Reports and alerts chart data.
+    """
+    query = get_aggregate_query(device_id, bucket, from_date, to_date)
+    return to_chart_data(await connection.fetch_all(query))
+
+
+async def async_get_files_by_device(
+    connection: Connection, device_id: str
+) -> List[Dict]:
+    """
+    Get the video files of a device.
+
+    Arguments:
+        connection {Connection} -- Async database connection.
+        device_id {str} -- Jetson id to query files.
+
+    Returns:
+        List[Dict] -- All video files for the device.
+    """
+    files = VideoFilesModel.__table__
+    query = select([files]).where(files.c.device_id == device_id)
+    return [dict(file) for file in await connection.fetch_all(query)]
@@ -20,14 +20,27 @@
 # DEALINGS IN THE SOFTWARE.
 ################################################################################
 
-from typing import List, Union, Dict
+import json
+from typing import List, Optional, Union, Dict
 
-from app.db.schema import DeviceModel
+from app.db.schema import DeviceLatestModel, DeviceModel
+from app.db.utils import UPSERT_BATCH_SIZE
 
+from sqlalchemy import func, or_, select, text
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from sqlalchemy.orm.exc import NoResultFound
 
+# Channel where device status messages are announced, see notify_device_status
+DEVICE_STATUS_CHANNEL = "device_status"
+
+# Channel where the ids of deleted devices are announced, see delete_device
+DEVICE_DELETED_CHANNEL = "device_deleted"
+
+# NOTIFY payloads must be shorter than 8000 bytes
+NOTIFY_MAX_PAYLOAD_BYTES = 7999
+
 
 def create_device(
     db_session: Session, device_information: Dict = {}
@@ -59,6 +72,65 @@ def create_device(
         raise
 
 
+def upsert_devices(
+    db_session: Session,
+    devices_information: List[Dict] = [],
+    update_fields: List[str] = [],
+    fill_empty_fields: List[str] = [],
+) -> int:
+    """
+    Register many Jetson devices with one INSERT ... ON CONFLICT statement per batch.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        devices_information {List[Dict]} -- New devices information.
+        update_fields {List[str]} -- Fields overwritten when the device already
+        exists. If empty, existing devices are left unchanged.
+        fill_empty_fields {List[str]} -- Fields set only when they are empty
+        in the existing device (e.g: devices registered without hello message).
+
+    Returns:
+        int -- Number of devices inserted (or updated) in the database.
+    """
+    # Replace empty spaces in device id, and keep one entry per device
+    devices_information = list(
+        {
+            device["id"].replace(" ", "_"): {
+                **device,
+                "id": device["id"].replace(" ", "_"),
+            }
+            for device in devices_information
+        }.values()
+    )
+
+    table = DeviceModel.__table__
+    affected = 0
+    for first in range(0, len(devices_information), UPSERT_BATCH_SIZE):
+        statement = insert(table).values(
+            devices_information[first : first + UPSERT_BATCH_SIZE]
+        )
+        if update_fields:
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.id],
+                set_={field: statement.excluded[field] for field in update_fields},
+            )
+        elif fill_empty_fields:
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.id],
+                set_={
+                    field: func.coalesce(table.c[field], statement.excluded[field])
+                    for field in fill_empty_fields
+                },
+                where=or_(*[table.c[field].is_(None) for field in fill_empty_fields]),
+            )
+        else:
+            statement = statement.on_conflict_do_nothing()
+        affected += db_session.execute(statement).rowcount
+
+    db_session.commit()
+    return affected
+
+
 def get_device(
     db_session: Session, device_id: str
 ) -> Union[DeviceModel, NoResultFound]:
@@ -93,6 +165,19 @@ def get_devices(db_session: Session) -> List[DeviceModel]:
     return db_session.query(DeviceModel).all()
 
 
+def get_device_ids(db_session: Session) -> List[str]:
+    """
+    Get the ids of all devices, without loading the devices.
+
+    Arguments:
+        db_session {Session} -- Database session.
+
+    Returns:
+        List[str] -- All device ids present in the database.
+    """
+    return [device_id for (device_id,) in db_session.query(DeviceModel.id)]
+
+
 def update_device(
     db_session: Session, device_id: str, new_device_information: Dict = {}
 ) -> Union[DeviceModel, NoResultFound]:
@@ -132,7 +217,8 @@ def delete_device(
     db_session: Session, device_id: str
 ) -> Union[DeviceModel, NoResultFound]:
     """
-    Delete a device.
+    Delete a device, announcing its id on DEVICE_DELETED_CHANNEL so that
+    the subscribers forget it.
 
     Arguments:
         db_session {Session} -- Database session.
@@ -146,6 +232,10 @@ def delete_device(
     try:
         device = get_device_by_id(db_session, device_id)
         db_session.delete(device)
+        db_session.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": DEVICE_DELETED_CHANNEL, "payload": device_id},
+        )
         db_session.commit()
         return device
 
@@ -174,3 +264,85 @@ def get_device_by_id(
         raise NoResultFound()
 
     return device
+
+
+def get_device_summary_query(device_id: Optional[str] = None):
+    """
+    Build the query that gets devices along with their latest statistic,
+    in a single statement, joining the device_latest table.
+
+    Arguments:
+        device_id {Optional[str]} -- Only get this device.
+
+    Returns:
+        Select -- Query returning the device columns, last_seen and the
+        device_latest columns, sorted by device id.
+    """
+    devices = DeviceModel.__table__
+    latest = DeviceLatestModel.__table__
+
+    query = select(
+        [
+            devices,
+            func.greatest(
+                latest.c.statistic_datetime,
+                latest.c.hello_datetime,
+                latest.c.files_datetime,
+            ).label("last_seen"),
+        ]
+        + [column for column in latest.c if column.name != "device_id"]
+    ).select_from(devices.outerjoin(latest, latest.c.device_id == devices.c.id))
+
+    if device_id is not None:
+        query = query.where(devices.c.id == device_id)
+
+    return query.order_by(devices.c.id)
+
+
+def to_device_summary(row) -> Dict:
+    """
+    Shape a row of the device summary query like DeviceSummarySchema.
+
+    Arguments:
+        row -- Row returned by the device summary query.
+
+    Returns:
+        Dict -- Device information, with latest_statistic set to None if
+        the device has no statistics.
+    """
+    device = {column: row[column] for column in DeviceModel.__table__.c.keys()}
+
+    latest_statistic = None
+    if row["statistic_datetime"] is not None:
+        latest_statistic = {
+            "device_id": row["id"],
+            "datetime": row["statistic_datetime"],
+            "statistic_type": row["statistic_type"],
+            "people_with_mask": row["people_with_mask"],
+            "people_without_mask": row["people_without_mask"],
+            "people_total": row["people_total"],
+        }
+
+    device["last_seen"] = row["last_seen"]
+    device["latest_statistic"] = latest_statistic
+    return device
+
+
+def notify_device_status(db_session: Session, device_status: Dict):
+    """
+    Announce on DEVICE_STATUS_CHANNEL the last status sent by a device,
+    so that API workers can push it to live dashboards.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        device_status {Dict} -- Status message, including the device_id.
+    """
+    payload = json.dumps(device_status)
+    if len(payload.encode()) > NOTIFY_MAX_PAYLOAD_BYTES:
+        raise ValueError(f"Status of {device_status['device_id']} is too long")
+
+    db_session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": DEVICE_STATUS_CHANNEL, "payload": payload},
+    )
+    db_session.commit()
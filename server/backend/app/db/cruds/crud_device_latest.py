@@ -0,0 +1,203 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+from typing import Dict, List
+
+from app.db.schema import DeviceLatestModel, StatisticsModel
+from app.db.utils import UPSERT_BATCH_SIZE, StatisticTypeEnum
+
+from sqlalchemy import and_, case, func, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+# Columns of device_latest set from the last statistic and the last alert
+LATEST_STATISTIC_COLUMNS = {
+    "statistic_datetime": "datetime",
+    "statistic_type": "statistic_type",
+    "people_with_mask": "people_with_mask",
+    "people_without_mask": "people_without_mask",
+    "people_total": "people_total",
+}
+LATEST_ALERT_COLUMNS = {
+    "alert_datetime": "datetime",
+    "alert_people_with_mask": "people_with_mask",
+    "alert_people_without_mask": "people_without_mask",
+    "alert_people_total": "people_total",
+}
+
+# Device events whose last time is kept in device_latest
+LATEST_EVENTS = ["hello", "files"]
+
+
+def add_statistics_to_latest(
+    db_session: Session, statistics_information: List[Dict]
+):
+    """
+    Keep the newest statistic and alert of every device in device_latest,
+    without committing. Rows are only overwritten by newer statistics, so
+    batches can be written in any order.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        statistics_information {List[Dict]} -- Inserted statistics.
+    """
+    latest = {}
+    for statistic in statistics_information:
+        device_latest = latest.setdefault(
+            statistic["device_id"], {"device_id": statistic["device_id"]}
+        )
+        groups = [LATEST_STATISTIC_COLUMNS]
+        if statistic["statistic_type"] == StatisticTypeEnum.ALERT:
+            groups.append(LATEST_ALERT_COLUMNS)
+
+        for columns in groups:
+            datetime_column = next(iter(columns))
+            current = device_latest.get(datetime_column)
+            if current is None or statistic["datetime"] > current:
+                for column, field in columns.items():
+                    device_latest[column] = statistic[field]
+
+    if not latest:
+        return
+
+    table = DeviceLatestModel.__table__
+    columns = ["device_id", *LATEST_STATISTIC_COLUMNS, *LATEST_ALERT_COLUMNS]
+    # Same row order in every transaction, so concurrent writers can't deadlock
+    rows = [
+        {column: device_latest.get(column) for column in columns}
+        for _, device_latest in sorted(latest.items())
+    ]
+
+    for first in range(0, len(rows), UPSERT_BATCH_SIZE):
+        statement = insert(table).values(
+            rows[first : first + UPSERT_BATCH_SIZE]
+        )
+        update = {}
+        for group in [LATEST_STATISTIC_COLUMNS, LATEST_ALERT_COLUMNS]:
+            datetime_column = next(iter(group))
+            is_newer = or_(
+                table.c[datetime_column].is_(None),
+                statement.excluded[datetime_column] > table.c[datetime_column],
+            )
+            for column in group:
+                update[column] = case(
+                    [(is_newer, statement.excluded[column])],
+                    else_=table.c[column],
+                )
+
+        db_session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[table.c.device_id], set_=update
+            )
+        )
+
+
+def refresh_device_latest(db_session: Session, device_id: str):
+    """
+    Recompute the last statistic and alert of a device from the statistic
+    table, without committing. Used when statistics are modified or deleted,
+    holding the device_latest row lock until committing.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        device_id {str} -- Device id.
+    """
+    statistics = StatisticsModel.__table__
+    table = DeviceLatestModel.__table__
+
+    # Lock the row first: writers of newer statistics that commit meanwhile
+    # wait, and the ones that committed before are seen by the SELECT below
+    db_session.execute(
+        insert(table).values(device_id=device_id).on_conflict_do_nothing()
+    )
+    db_session.execute(
+        select([table.c.device_id])
+        .where(table.c.device_id == device_id)
+        .with_for_update()
+    )
+
+    device_latest = {"device_id": device_id}
+    for columns, statistic_filter in [
+        (LATEST_STATISTIC_COLUMNS, statistics.c.statistic_type.isnot(None)),
+        (
+            LATEST_ALERT_COLUMNS,
+            statistics.c.statistic_type == StatisticTypeEnum.ALERT,
+        ),
+    ]:
+        last = db_session.execute(
+            select([statistics])
+            .where(and_(statistics.c.device_id == device_id, statistic_filter))
+            .order_by(statistics.c.datetime.desc())
+            .limit(1)
+        ).first()
+        for column, field in columns.items():
+            device_latest[column] = last[field] if last else None
+
+    statement = insert(table).values(device_latest)
+    db_session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[table.c.device_id],
+            set_={
+                column: statement.excluded[column]
+                for column in device_latest
+                if column != "device_id"
+            },
+        )
+    )
+
+
+def update_latest_event(db_session: Session, device_id: str, event: str):
+    """
+    Set the last time a device sent an event to now.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        device_id {str} -- Device id.
+        event {str} -- One of LATEST_EVENTS.
+    """
+    table = DeviceLatestModel.__table__
+    column = f"{event}_datetime"
+    # Naive UTC, like the statistic datetimes
+    now = func.timezone("UTC", func.now())
+
+    statement = insert(table).values({"device_id": device_id, column: now})
+    db_session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[table.c.device_id],
+            set_={column: statement.excluded[column]},
+        )
+    )
+    db_session.commit()
+
+
+def get_devices_latest(db_session: Session) -> List[DeviceLatestModel]:
+    """
+    Get the last values of all devices.
+
+    Arguments:
+        db_session {Session} -- Database session.
+
+    Returns:
+        List[DeviceLatestModel] -- Last values of every device.
+    """
+    query = db_session.query(DeviceLatestModel)
+    return query.order_by(DeviceLatestModel.device_id).all()
@@ -20,15 +20,33 @@
 # DEALINGS IN THE SOFTWARE.
 ################################################################################
 
-from datetime import datetime, timezone
-from typing import Dict, List, Optional, Union
-
-from app.db.schema import StatisticsModel
-
+import json
+from datetime import date, datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from app.core.config import EXPORT_BATCH_SIZE
+from app.db.schema import DeviceModel, StatisticsModel
+from app.db.utils import UPSERT_BATCH_SIZE, StatisticTypeEnum
+
+from .crud_device_latest import add_statistics_to_latest, refresh_device_latest
+from .crud_statistic_rollup import (
+    add_statistics_to_rollups,
+    refresh_statistic_rollups,
+)
+
+from sqlalchemy import Text, cast, select, text
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from sqlalchemy.orm.exc import NoResultFound
 
+# PostgreSQL NOTIFY channel where statistic changes are announced, see
+# notify_statistic_changes
+STATISTIC_CHANGES_CHANNEL = "statistic_changes"
+
+# New statistics included in each notification, to stay under the size limit
+NOTIFY_STATISTICS_PER_PAYLOAD = 40
+
 
 def create_statistic(
     db_session: Session, statistic_information: Dict = {}
@@ -47,6 +65,12 @@ def create_statistic(
     try:
         statistic = StatisticsModel(**statistic_information)
         db_session.add(statistic)
+        db_session.flush()
+        add_statistics_to_rollups(db_session, [statistic_information])
+        add_statistics_to_latest(db_session, [statistic_information])
+        notify_statistic_changes(
+            db_session, [statistic_information], added=True
+        )
         db_session.commit()
         db_session.refresh(statistic)
         return statistic
@@ -56,6 +80,149 @@ def create_statistic(
         raise
 
 
+def upsert_statistics(
+    db_session: Session,
+    statistics_information: List[Dict] = [],
+    update_existing: bool = False,
+) -> int:
+    """
+    Register many statistic entries with one INSERT ... ON CONFLICT statement
+    per batch, so duplicates (e.g: MQTT redeliveries) don't abort the transaction.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        statistics_information {List[Dict]} -- New statistics information.
+        update_existing {bool} -- Overwrite the values of statistics that already
+        exist instead of ignoring them.
+
+    Returns:
+        int -- Number of statistics inserted (or updated) in the database.
+    """
+    if not update_existing:
+        inserted = add_statistics(db_session, statistics_information)
+        db_session.commit()
+        return len(inserted)
+
+    # A statement can't update the same row twice, keep the last version
+    statistics_information = list(
+        {
+            (statistic["device_id"], statistic["datetime"]): statistic
+            for statistic in statistics_information
+        }.values()
+    )
+
+    table = StatisticsModel.__table__
+    affected = 0
+    for first in range(0, len(statistics_information), UPSERT_BATCH_SIZE):
+        statement = insert(table).values(
+            statistics_information[first : first + UPSERT_BATCH_SIZE]
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.device_id, table.c.datetime],
+            set_={
+                column.name: statement.excluded[column.name]
+                for column in table.columns
+                if not column.primary_key
+            },
+        )
+        affected += db_session.execute(statement).rowcount
+
+    # Overwritten values can't be added up, recompute the affected buckets
+    device_dates = {}
+    for statistic in statistics_information:
+        device_dates.setdefault(statistic["device_id"], []).append(
+            statistic["datetime"]
+        )
+
+    # Sorted, so that transactions lock the devices in the same order
+    for device_id, dates in sorted(device_dates.items()):
+        refresh_statistic_rollups(db_session, device_id, min(dates), max(dates))
+        refresh_device_latest(db_session, device_id)
+
+    notify_statistic_changes(db_session, statistics_information)
+
+    db_session.commit()
+    return affected
+
+
+def bulk_insert_statistics(
+    db_session: Session, statistics_information: List[Dict]
+) -> Dict[str, Dict[str, int]]:
+    """
+    Register many statistics of one or many devices in a single transaction,
+    counting the ones skipped because they already exist.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        statistics_information {List[Dict]} -- New statistics information.
+
+    Returns:
+        Union[Dict[str, Dict[str, int]], NoResultFound] -- Statistics received,
+        inserted and in conflict by device id, or an exception in case some
+        device is not registered (nothing is inserted then).
+    """
+    counts = {}
+    for statistic in statistics_information:
+        device_counts = counts.setdefault(
+            statistic["device_id"], {"received": 0, "inserted": 0}
+        )
+        device_counts["received"] += 1
+
+    query = db_session.query(DeviceModel.id)
+    registered = {
+        device_id
+        for (device_id,) in query.filter(DeviceModel.id.in_(list(counts)))
+    }
+    unknown = sorted(set(counts) - registered)
+    if unknown:
+        raise NoResultFound(f"Devices not registered: {', '.join(unknown)}")
+
+    for statistic in add_statistics(db_session, statistics_information):
+        counts[statistic["device_id"]]["inserted"] += 1
+
+    db_session.commit()
+
+    for device_counts in counts.values():
+        device_counts["conflicts"] = (
+            device_counts["received"] - device_counts["inserted"]
+        )
+    return counts
+
+
+def add_statistics(
+    db_session: Session, statistics_information: List[Dict]
+) -> List[Dict]:
+    """
+    Insert statistics in bulk without committing, ignoring the ones already
+    registered (or repeated). Rollups, device_latest and live dashboards are
+    updated with the inserted ones.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        statistics_information {List[Dict]} -- New statistics information.
+
+    Returns:
+        List[Dict] -- Statistics inserted in the database.
+    """
+    table = StatisticsModel.__table__
+    inserted_statistics = []
+    for first in range(0, len(statistics_information), UPSERT_BATCH_SIZE):
+        statement = insert(table).values(
+            statistics_information[first : first + UPSERT_BATCH_SIZE]
+        )
+        # Only the rows really inserted are returned and added to rollups
+        inserted = db_session.execute(
+            statement.on_conflict_do_nothing().returning(*table.columns)
+        ).fetchall()
+        inserted = [dict(statistic) for statistic in inserted]
+        add_statistics_to_rollups(db_session, inserted)
+        add_statistics_to_latest(db_session, inserted)
+        notify_statistic_changes(db_session, inserted, added=True)
+        inserted_statistics.extend(inserted)
+
+    return inserted_statistics
+
+
 def get_statistic(
     db_session: Session, device_id: str, datetime: datetime
 ) -> Union[StatisticsModel, NoResultFound]:
@@ -136,6 +303,70 @@ def get_statistics_from_to(
     return query.filter(StatisticsModel.datetime <= to_date).all()
 
 
+def iterate_statistics(
+    db_session: Session,
+    device_id: Optional[str] = None,
+    from_date: Optional[Union[datetime, date]] = None,
+    to_date: Optional[Union[datetime, date]] = None,
+    statistic_type: Optional[StatisticTypeEnum] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[List[Tuple]]:
+    """
+    Read statistics in batches of rows through a server-side cursor, so any
+    number of them can be read in bounded memory.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        device_id {Optional[str]} -- Device id, all devices by default.
+        from_date {Optional[Union[datetime, date]]} -- Beginning of
+        datetime range.
+        to_date {Optional[Union[datetime, date]]} -- End of datetime range.
+        statistic_type {Optional[StatisticTypeEnum]} -- Only reports or alerts.
+        batch_size {int} -- Rows per batch.
+
+    Returns:
+        Iterator[List[Tuple]] -- Batches of (device_id, datetime,
+        statistic_type, people_with_mask, people_without_mask, people_total)
+        rows, sorted by device and datetime.
+    """
+    table = StatisticsModel.__table__
+    query = select(
+        [
+            table.c.device_id,
+            table.c.datetime,
+            cast(table.c.statistic_type, Text).label("statistic_type"),
+            table.c.people_with_mask,
+            table.c.people_without_mask,
+            table.c.people_total,
+        ]
+    ).order_by(table.c.device_id, table.c.datetime)
+
+    if device_id:
+        query = query.where(table.c.device_id == device_id)
+
+    if from_date:
+        query = query.where(table.c.datetime >= from_date)
+
+    if to_date:
+        query = query.where(table.c.datetime <= to_date)
+
+    if statistic_type:
+        query = query.where(table.c.statistic_type == statistic_type)
+
+    connection = db_session.connection(
+        execution_options={"stream_results": True}
+    )
+    result = connection.execute(query)
+    try:
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        result.close()
+
+
 def update_statistic(
     db_session: Session,
     device_id: str,
@@ -176,6 +407,12 @@ def update_statistic(
             if hasattr(statistic, key):
                 setattr(statistic, key, value)
 
+        db_session.flush()
+        refresh_statistic_rollups(db_session, device_id, datetime, datetime)
+        refresh_device_latest(db_session, device_id)
+        notify_statistic_changes(
+            db_session, [{"device_id": device_id, "datetime": datetime}]
+        )
         db_session.commit()
         return statistic
 
@@ -203,6 +440,12 @@ def delete_statistic(
             db_session, device_id, datetime
         )
         db_session.delete(statistic)
+        db_session.flush()
+        refresh_statistic_rollups(db_session, device_id, datetime, datetime)
+        refresh_device_latest(db_session, device_id)
+        notify_statistic_changes(
+            db_session, [{"device_id": device_id, "datetime": datetime}]
+        )
         db_session.commit()
         return statistic
 
@@ -231,3 +474,78 @@ def get_statistic_by_id_and_datetime(
         raise NoResultFound()
 
     return statistic
+
+
+def notify_statistic_changes(
+    db_session: Session,
+    statistics_information: Optional[List[Dict]] = None,
+    added: bool = False,
+):
+    """
+    Announce on STATISTIC_CHANGES_CHANNEL which device and datetime range
+    changed, so that API workers can invalidate their cached responses.
+    New statistics are also included, to push them to live dashboards.
+    Notifications are sent when the transaction commits, and only if it does.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        statistics_information {Optional[List[Dict]]} -- Statistics that
+        were added, modified or deleted. None when any statistic of any
+        device may have changed (e.g: a partition was dropped).
+        added {bool} -- The statistics are new, include them in the payloads.
+    """
+    if statistics_information is None:
+        payloads = [json.dumps({"device_id": None})]
+    else:
+        device_statistics = {}
+        for statistic in statistics_information:
+            statistic = dict(statistic)
+            statistic_datetime = statistic["datetime"]
+            if statistic_datetime.tzinfo is not None:
+                statistic_datetime = statistic_datetime.astimezone(
+                    timezone.utc
+                ).replace(tzinfo=None)
+            statistic["datetime"] = statistic_datetime
+
+            device_statistics.setdefault(statistic["device_id"], []).append(
+                statistic
+            )
+
+        payloads = []
+        for device_id, statistics in sorted(device_statistics.items()):
+            statistics.sort(key=lambda statistic: statistic["datetime"])
+
+            # NOTIFY payloads are limited to 8000 bytes
+            step = NOTIFY_STATISTICS_PER_PAYLOAD if added else len(statistics)
+            for first in range(0, len(statistics), step):
+                chunk = statistics[first : first + step]
+                payload = {
+                    "device_id": device_id,
+                    "from": chunk[0]["datetime"].isoformat(),
+                    "to": chunk[-1]["datetime"].isoformat(),
+                }
+                if added:
+                    payload["statistics"] = [
+                        {
+                            "datetime": statistic["datetime"].isoformat(),
+                            "statistic_type": StatisticTypeEnum(
+                                statistic["statistic_type"]
+                            ).value,
+                            "people_with_mask": statistic["people_with_mask"],
+                            "people_without_mask": statistic[
+                                "people_without_mask"
+                            ],
+                            "people_total": statistic["people_total"],
+                        }
+                        for statistic in chunk
+                    ]
+                payloads.append(json.dumps(payload))
+
+    if payloads:
+        db_session.execute(
+            text(
+                "SELECT pg_notify(:channel, payload) "
+                "FROM unnest(CAST(:payloads AS text[])) AS payload"
+            ),
+            {"channel": STATISTIC_CHANGES_CHANNEL, "payloads": payloads},
+        )
@@ -0,0 +1,426 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from app.db.schema import (
+    StatisticDayModel,
+    StatisticHourModel,
+    StatisticMinuteModel,
+    StatisticsModel,
+)
+from app.db.utils import (
+    ROLLUP_RESOLUTIONS,
+    UPSERT_BATCH_SIZE,
+    StatisticBucketEnum,
+    StatisticTypeEnum,
+    truncate_datetime,
+)
+
+from sqlalchemy import and_, func, literal_column, select, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+ROLLUP_MODELS = {
+    "minute": StatisticMinuteModel,
+    "hour": StatisticHourModel,
+    "day": StatisticDayModel,
+}
+
+# Columns added up in every rollup bucket
+ROLLUP_SUMS = ["people_with_mask", "people_without_mask", "people_total"]
+
+# Rollup table aggregated for each chart bucket
+BUCKET_ROLLUPS = {
+    StatisticBucketEnum.MINUTE: "minute",
+    StatisticBucketEnum.HOUR: "hour",
+    StatisticBucketEnum.DAY: "day",
+    StatisticBucketEnum.WEEK: "day",
+    StatisticBucketEnum.MONTH: "day",
+}
+
+
+def add_statistics_to_rollups(
+    db_session: Session, statistics_information: List[Dict] = []
+) -> None:
+    """
+    Add new statistics to the minute, hour and day rollups without committing,
+    so they are updated in the same transaction that inserts the statistics.
+    Only statistics that were actually inserted must be passed, otherwise
+    they would be counted twice.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        statistics_information {List[Dict]} -- Inserted statistics.
+    """
+    for resolution, model in ROLLUP_MODELS.items():
+        buckets = defaultdict(lambda: [0, 0, 0, 0])
+        for statistic in statistics_information:
+            if statistic["statistic_type"] is None:
+                continue
+
+            key = (
+                statistic["device_id"],
+                statistic["statistic_type"],
+                truncate_datetime(statistic["datetime"], resolution),
+            )
+            bucket = buckets[key]
+            bucket[0] += 1
+            for index, column in enumerate(ROLLUP_SUMS, start=1):
+                bucket[index] += statistic[column]
+
+        # Sorted keys make concurrent writers lock the rows in the same order
+        rows = [
+            dict(
+                device_id=device_id,
+                statistic_type=statistic_type,
+                bucket=bucket,
+                samples=values[0],
+                **dict(zip(ROLLUP_SUMS, values[1:])),
+            )
+            for (device_id, statistic_type, bucket), values in sorted(
+                buckets.items()
+            )
+        ]
+
+        table = model.__table__
+        for first in range(0, len(rows), UPSERT_BATCH_SIZE):
+            statement = insert(table).values(
+                rows[first : first + UPSERT_BATCH_SIZE]
+            )
+            statement = statement.on_conflict_do_update(
+                index_elements=[
+                    table.c.device_id,
+                    table.c.statistic_type,
+                    table.c.bucket,
+                ],
+                set_={
+                    column: table.c[column] + statement.excluded[column]
+                    for column in ["samples"] + ROLLUP_SUMS
+                },
+            )
+            db_session.execute(statement)
+
+
+def refresh_statistic_rollups(
+    db_session: Session,
+    device_id: Optional[str] = None,
+    from_date: Optional[datetime] = None,
+    to_date: Optional[datetime] = None,
+) -> int:
+    """
+    Recompute the rollups of a datetime range from the statistic table,
+    without committing. Used after statistics are modified or deleted,
+    and to backfill the rollups.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        device_id {Optional[str]} -- Device id, all devices by default.
+        from_date {Optional[datetime]} -- Beginning of datetime range.
+        to_date {Optional[datetime]} -- End of datetime range (inclusive).
+
+    Returns:
+        int -- Number of rollup rows written, for all resolutions.
+    """
+    if device_id is not None:
+        # Concurrent refreshes of a device would insert the same buckets,
+        # wait until the others commit to see their changes (and rows)
+        db_session.execute(
+            select([func.pg_advisory_xact_lock(func.hashtext(device_id))])
+        )
+
+    written = 0
+    for resolution, model in ROLLUP_MODELS.items():
+        table = model.__table__
+        raw_filters, rollup_filters = [], []
+
+        if device_id is not None:
+            raw_filters.append(StatisticsModel.device_id == device_id)
+            rollup_filters.append(table.c.device_id == device_id)
+
+        # Whole buckets are recomputed, extend the range to their limits
+        if from_date is not None:
+            start = truncate_datetime(from_date, resolution)
+            raw_filters.append(StatisticsModel.datetime >= start)
+            rollup_filters.append(table.c.bucket >= start)
+
+        if to_date is not None:
+            end = (
+                truncate_datetime(to_date, resolution)
+                + ROLLUP_RESOLUTIONS[resolution]
+            )
+            raw_filters.append(StatisticsModel.datetime < end)
+            rollup_filters.append(table.c.bucket < end)
+
+        db_session.execute(table.delete().where(and_(*rollup_filters)))
+
+        bucket = func.date_trunc(
+            literal_column(f"'{resolution}'"), StatisticsModel.datetime
+        )
+        query = (
+            select(
+                [
+                    StatisticsModel.device_id,
+                    StatisticsModel.statistic_type,
+                    bucket,
+                    func.count(),
+                ]
+                + [func.sum(getattr(StatisticsModel, c)) for c in ROLLUP_SUMS]
+            )
+            .where(
+                and_(StatisticsModel.statistic_type.isnot(None), *raw_filters)
+            )
+            .group_by(
+                StatisticsModel.device_id,
+                StatisticsModel.statistic_type,
+                bucket,
+            )
+        )
+        statement = insert(table).from_select(
+            ["device_id", "statistic_type", "bucket", "samples"] + ROLLUP_SUMS,
+            query,
+        )
+        # Statistics added meanwhile may have created a bucket again
+        written += db_session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[
+                    table.c.device_id,
+                    table.c.statistic_type,
+                    table.c.bucket,
+                ],
+                set_={
+                    column: statement.excluded[column]
+                    for column in ["samples"] + ROLLUP_SUMS
+                },
+            )
+        ).rowcount
+
+    return written
+
+
+def get_statistic_rollups(
+    db_session: Session,
+    device_id: str,
+    resolution: str,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+) -> List:
+    """
+    Get the rollups of a device whose buckets start within a datetime range.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        device_id {str} -- Device id.
+        resolution {str} -- One of "minute", "hour" or "day".
+        from_date {Optional[str]} -- Beginning of datetime range.
+        to_date {Optional[str]} -- End of datetime range.
+
+    Returns:
+        List -- Rollup instances sorted by bucket.
+    """
+    model = ROLLUP_MODELS[resolution]
+    query = db_session.query(model).filter(model.device_id == device_id)
+
+    if from_date:
+        query = query.filter(model.bucket >= from_date)
+
+    if to_date:
+        query = query.filter(model.bucket <= to_date)
+
+    return query.order_by(model.bucket, model.statistic_type).all()
+
+
+def get_aggregate_query(
+    device_id: str,
+    bucket: StatisticBucketEnum,
+    from_date: Optional[datetime] = None,
+    to_date: Optional[datetime] = None,
+):
+    """
+    Build the query that adds up the statistics of a device by time bucket
+    (date_trunc) and type. Rollup buckets entirely within the range are
+    used where possible, and raw statistics only at the edges of the range,
+    so results are the same as aggregating the raw statistics.
+
+    Arguments:
+        device_id {str} -- Device id.
+        bucket {StatisticBucketEnum} -- Time bucket to aggregate by.
+        from_date {Optional[datetime]} -- Beginning of datetime range.
+        to_date {Optional[datetime]} -- End of datetime range (inclusive),
+        now by default.
+
+    Returns:
+        Select -- Query returning statistic_type, bucket and the sums of
+        ROLLUP_SUMS, sorted by bucket.
+    """
+    resolution = BUCKET_ROLLUPS[bucket]
+    step = ROLLUP_RESOLUTIONS[resolution]
+    rollup = ROLLUP_MODELS[resolution].__table__
+    raw = StatisticsModel.__table__
+
+    if from_date is not None and from_date.tzinfo is not None:
+        from_date = from_date.astimezone(timezone.utc).replace(tzinfo=None)
+    if to_date is None:
+        to_date = datetime.now(timezone.utc)
+    if to_date.tzinfo is not None:
+        to_date = to_date.astimezone(timezone.utc).replace(tzinfo=None)
+
+    # Rollup buckets entirely within [from_date, to_date]
+    rollup_start = None
+    if from_date is not None:
+        rollup_start = truncate_datetime(from_date, resolution)
+        if rollup_start < from_date:
+            rollup_start += step
+    rollup_end = truncate_datetime(
+        to_date + timedelta(microseconds=1), resolution
+    )
+
+    def raw_rows(*filters):
+        return select(
+            [raw.c.statistic_type, raw.c.datetime.label("datetime")]
+            + [raw.c[column] for column in ROLLUP_SUMS]
+        ).where(
+            and_(
+                raw.c.device_id == device_id,
+                raw.c.statistic_type.isnot(None),
+                *filters,
+            )
+        )
+
+    if rollup_start is not None and rollup_start >= rollup_end:
+        # The range is shorter than a rollup bucket
+        filters = [raw.c.datetime <= to_date]
+        if from_date is not None:
+            filters.append(raw.c.datetime >= from_date)
+        parts = [raw_rows(*filters)]
+    else:
+        rollup_filters = [
+            rollup.c.device_id == device_id,
+            rollup.c.bucket < rollup_end,
+        ]
+        if rollup_start is not None:
+            rollup_filters.append(rollup.c.bucket >= rollup_start)
+
+        parts = [
+            select(
+                [rollup.c.statistic_type, rollup.c.bucket.label("datetime")]
+                + [rollup.c[column] for column in ROLLUP_SUMS]
+            ).where(and_(*rollup_filters)),
+            raw_rows(raw.c.datetime >= rollup_end, raw.c.datetime <= to_date),
+        ]
+        if rollup_start is not None:
+            parts.append(
+                raw_rows(
+                    raw.c.datetime >= from_date,
+                    raw.c.datetime < rollup_start,
+                )
+            )
+
+    rows = union_all(*parts).alias("statistic_rows")
+    bucket_start = func.date_trunc(
+        literal_column(f"'{bucket.value}'"), rows.c.datetime
+    ).label("bucket")
+    return (
+        select(
+            [rows.c.statistic_type, bucket_start]
+            + [
+                func.sum(rows.c[column]).label(column)
+                for column in ROLLUP_SUMS
+            ]
+        )
+        .group_by(rows.c.statistic_type, bucket_start)
+        .order_by(bucket_start)
+    )
+
+
+def get_statistics_aggregate(
+    db_session: Session,
+    device_id: str,
+    bucket: StatisticBucketEnum,
+    from_date: Optional[datetime] = None,
+    to_date: Optional[datetime] = None,
+) -> Dict:
+    """
+    Get the statistics of a device added up by time bucket, as chart data.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        device_id {str} -- Device id.
+        bucket {StatisticBucketEnum} -- Time bucket to aggregate by.
+        from_date {Optional[datetime]} -- Beginning of datetime range.
+        to_date {Optional[datetime]} -- End of datetime range.
+
+    Returns:
+        Dict -- Reports and alerts chart data, see to_chart_data.
+    """
+    query = get_aggregate_query(device_id, bucket, from_date, to_date)
+    return to_chart_data(db_session.execute(query).fetchall())
+
+
+def to_chart_data(rows: List) -> Dict:
+    """
+    Shape aggregated rows as columns, like the frontend's grouped data.
+    Buckets without people are skipped.
+
+    Arguments:
+        rows {List} -- Rows returned by the aggregate query.
+
+    Returns:
+        Dict -- "reports" and "alerts", each one None or a dict of lists:
+        dates, people_with_mask, people_total, mask_percentage and
+        visible_people.
+    """
+    chart_data = {"reports": None, "alerts": None}
+    for row in rows:
+        people_with_mask = row["people_with_mask"]
+        people_total = row["people_total"]
+        if not people_with_mask and not people_total:
+            continue
+
+        key = (
+            "alerts"
+            if row["statistic_type"] == StatisticTypeEnum.ALERT
+            else "reports"
+        )
+        if chart_data[key] is None:
+            chart_data[key] = {
+                "dates": [],
+                "people_with_mask": [],
+                "people_total": [],
+                "mask_percentage": [],
+                "visible_people": [],
+            }
+
+        data = chart_data[key]
+        data["dates"].append(row["bucket"])
+        data["people_with_mask"].append(people_with_mask)
+        data["people_total"].append(people_total)
+        data["mask_percentage"].append(
+            people_with_mask * 100 / people_total if people_total else 0
+        )
+        data["visible_people"].append(
+            people_with_mask + row["people_without_mask"]
+        )
+
+    return chart_data
@@ -21,10 +21,12 @@
 ################################################################################
 
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 from app.db.schema import VideoFilesModel
+from app.db.utils import UPSERT_BATCH_SIZE
 
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from sqlalchemy.orm.exc import NoResultFound
@@ -34,9 +36,10 @@ def update_files(
     db_session: Session,
     device_id: str,
     file_list: List,
-) -> List[VideoFilesModel]:
+) -> Tuple[int, int]:
     """
-    Update the whole list of available files for this device
+    Update the whole list of available files for this device.
+    Only the files that changed are written, in a single transaction.
 
     Arguments:
         db_session {Session} -- Database session.
@@ -44,23 +47,31 @@ def update_files(
         file_list {List} -- List of all available files in the device
 
     Returns:
-        VideoFilesModel -- Updated video_files instance defined by device_id
+        Tuple[int, int] -- Number of files added and removed.
     """
-    # Remove all previous files for device_id
-    query = db_session.query(VideoFilesModel)
+    query = db_session.query(VideoFilesModel.video_name)
     query = query.filter(VideoFilesModel.device_id == device_id)
-    query.delete(synchronize_session=False)
-    db_session.commit()
+    current_files = {video_name for (video_name,) in query}
+
+    new_files = set(file_list)
+    removed_files = list(current_files - new_files)
+    added_files = [name for name in file_list if name not in current_files]
+
+    # Remove files no longer available in the device
+    for first in range(0, len(removed_files), UPSERT_BATCH_SIZE):
+        query = db_session.query(VideoFilesModel)
+        query = query.filter(
+            VideoFilesModel.device_id == device_id,
+            VideoFilesModel.video_name.in_(
+                removed_files[first : first + UPSERT_BATCH_SIZE]
+            ),
+        )
+        query.delete(synchronize_session=False)
 
-    # Add new list
-    result = []
-    for new_file in file_list:
-        file_add = VideoFilesModel(device_id=device_id, video_name=new_file)
-        db_session.add(file_add)
-        result.append(file_add)
+    added = add_files(db_session, device_id, added_files)
 
     db_session.commit()
-    return result
+    return added, len(removed_files)
 
 
 def get_files_by_device(
@@ -78,3 +89,32 @@ def get_files_by_device(
     """
     query = db_session.query(VideoFilesModel)
     return query.filter(VideoFilesModel.device_id == device_id).all()
+
+
+def add_files(db_session: Session, device_id: str, file_list: List) -> int:
+    """
+    Insert files in bulk without committing, ignoring the ones already registered.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        device_id {str} -- Jetson id which sent the information.
+        file_list {List} -- Names of the files to add.
+
+    Returns:
+        int -- Number of files inserted in the database.
+    """
+    files_information = [
+        {"device_id": device_id, "video_name": video_name}
+        for video_name in file_list
+    ]
+
+    affected = 0
+    for first in range(0, len(files_information), UPSERT_BATCH_SIZE):
+        statement = insert(VideoFilesModel.__table__).values(
+            files_information[first : first + UPSERT_BATCH_SIZE]
+        )
+        affected += db_session.execute(
+            statement.on_conflict_do_nothing()
+        ).rowcount
+
+    return affected
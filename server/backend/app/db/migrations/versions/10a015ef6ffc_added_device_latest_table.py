@@ -0,0 +1,70 @@
+"""Added device latest table
+
+Revision ID: 10a015ef6ffc
+Revises: c29bcf6ba447
+Create Date: 2026-10-19 13:40:52.207415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '10a015ef6ffc'
+down_revision = 'c29bcf6ba447'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The enum type was already created along with the statistic table
+    statistic_type = postgresql.ENUM(
+        'REPORT', 'ALERT', name='statistictypeenum', create_type=False
+    )
+
+    op.create_table('device_latest',
+    sa.Column('device_id', sa.String(), nullable=False),
+    sa.Column('statistic_datetime', sa.DateTime(), nullable=True),
+    sa.Column('statistic_type', statistic_type, nullable=True),
+    sa.Column('people_with_mask', sa.Integer(), nullable=True),
+    sa.Column('people_without_mask', sa.Integer(), nullable=True),
+    sa.Column('people_total', sa.Integer(), nullable=True),
+    sa.Column('alert_datetime', sa.DateTime(), nullable=True),
+    sa.Column('alert_people_with_mask', sa.Integer(), nullable=True),
+    sa.Column('alert_people_without_mask', sa.Integer(), nullable=True),
+    sa.Column('alert_people_total', sa.Integer(), nullable=True),
+    sa.Column('hello_datetime', sa.DateTime(), nullable=True),
+    sa.Column('files_datetime', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['device_id'], ['device.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('device_id')
+    )
+    # Rows are updated in place all the time, leave room for HOT updates
+    op.execute("ALTER TABLE device_latest SET (fillfactor = 70)")
+
+    # Backfill from the existing statistics
+    op.execute("""
+        INSERT INTO device_latest (device_id, statistic_datetime, statistic_type,
+            people_with_mask, people_without_mask, people_total, alert_datetime,
+            alert_people_with_mask, alert_people_without_mask, alert_people_total)
+        SELECT device.id, last_statistic.datetime, last_statistic.statistic_type,
+            last_statistic.people_with_mask, last_statistic.people_without_mask,
+            last_statistic.people_total, last_alert.datetime,
+            last_alert.people_with_mask, last_alert.people_without_mask,
+            last_alert.people_total
+        FROM device
+        JOIN LATERAL (
+            SELECT * FROM statistic
+            WHERE device_id = device.id AND statistic_type IS NOT NULL
+            ORDER BY datetime DESC LIMIT 1
+        ) last_statistic ON true
+        LEFT JOIN LATERAL (
+            SELECT * FROM statistic
+            WHERE device_id = device.id AND statistic_type = 'ALERT'
+            ORDER BY datetime DESC LIMIT 1
+        ) last_alert ON true
+    """)
+
+
+def downgrade():
+    op.drop_table('device_latest')
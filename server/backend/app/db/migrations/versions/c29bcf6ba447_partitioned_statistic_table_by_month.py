@@ -0,0 +1,75 @@
+"""Partitioned statistic table by month
+
+Revision ID: c29bcf6ba447
+Revises: d7b6833cb3c4
+Create Date: 2026-10-19 10:02:17.530914
+
+"""
+from datetime import date, datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c29bcf6ba447'
+down_revision = 'd7b6833cb3c4'
+branch_labels = None
+depends_on = None
+
+# Same columns as the original table, see 8f58cd776eda and fb245977373f
+COLUMNS = """
+    device_id VARCHAR NOT NULL,
+    datetime TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    statistic_type statistictypeenum,
+    people_with_mask INTEGER NOT NULL,
+    people_without_mask INTEGER NOT NULL,
+    people_total INTEGER NOT NULL,
+    CONSTRAINT statistic_pkey PRIMARY KEY (device_id, datetime),
+    CONSTRAINT statistic_device_id_fkey FOREIGN KEY (device_id) REFERENCES device (id)
+"""
+
+# Months created in advance, app/db/partitions.py creates the following ones
+MONTHS_AHEAD = 3
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade():
+    connection = op.get_bind()
+    op.execute('ALTER TABLE statistic RENAME TO statistic_old')
+    op.execute('ALTER TABLE statistic_old RENAME CONSTRAINT statistic_pkey TO statistic_old_pkey')
+    op.execute('ALTER TABLE statistic_old RENAME CONSTRAINT statistic_device_id_fkey TO statistic_old_device_id_fkey')
+    op.execute(f'CREATE TABLE statistic ({COLUMNS}) PARTITION BY RANGE (datetime)')
+    op.execute('CREATE TABLE statistic_default PARTITION OF statistic DEFAULT')
+
+    # One partition per month with statistics, up to MONTHS_AHEAD from now
+    current_month = datetime.now(timezone.utc).date().replace(day=1)
+    first_month = connection.execute(
+        sa.text("SELECT date_trunc('month', min(datetime))::date FROM statistic_old")
+    ).scalar() or current_month
+    last_month = add_months(current_month, MONTHS_AHEAD)
+
+    month = min(first_month, current_month)
+    while month <= last_month:
+        op.execute(
+            f"CREATE TABLE statistic_{month:%Y_%m} PARTITION OF statistic "
+            f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+        )
+        month = add_months(month, 1)
+
+    op.execute('INSERT INTO statistic SELECT device_id, datetime, statistic_type, people_with_mask, people_without_mask, people_total FROM statistic_old')
+    op.drop_table('statistic_old')
+
+
+def downgrade():
+    op.execute('ALTER TABLE statistic RENAME TO statistic_partitioned')
+    op.execute('ALTER TABLE statistic_partitioned RENAME CONSTRAINT statistic_pkey TO statistic_partitioned_pkey')
+    op.execute('ALTER TABLE statistic_partitioned RENAME CONSTRAINT statistic_device_id_fkey TO statistic_partitioned_device_id_fkey')
+    op.execute(f'CREATE TABLE statistic ({COLUMNS})')
+    op.execute('INSERT INTO statistic SELECT device_id, datetime, statistic_type, people_with_mask, people_without_mask, people_total FROM statistic_partitioned')
+    # Drops all the partitions too
+    op.drop_table('statistic_partitioned')
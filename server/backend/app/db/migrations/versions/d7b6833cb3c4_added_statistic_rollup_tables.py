@@ -0,0 +1,60 @@
+"""Added statistic rollup tables
+
+Revision ID: d7b6833cb3c4
+Revises: 6d5c250f098c
+Create Date: 2026-10-19 09:12:40.118326
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7b6833cb3c4'
+down_revision = '6d5c250f098c'
+branch_labels = None
+depends_on = None
+
+ROLLUP_TABLES = {
+    'statistic_minute': 'minute',
+    'statistic_hour': 'hour',
+    'statistic_day': 'day',
+}
+
+
+def upgrade():
+    # The enum type was already created along with the statistic table
+    statistic_type = postgresql.ENUM(
+        'REPORT', 'ALERT', name='statistictypeenum', create_type=False
+    )
+
+    for table_name, resolution in ROLLUP_TABLES.items():
+        op.create_table(table_name,
+        sa.Column('device_id', sa.String(), nullable=False),
+        sa.Column('statistic_type', statistic_type, nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('samples', sa.Integer(), nullable=False),
+        sa.Column('people_with_mask', sa.Integer(), nullable=False),
+        sa.Column('people_without_mask', sa.Integer(), nullable=False),
+        sa.Column('people_total', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['device_id'], ['device.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('device_id', 'statistic_type', 'bucket')
+        )
+
+        # Backfill from the existing statistics
+        op.execute(f"""
+            INSERT INTO {table_name} (device_id, statistic_type, bucket, samples,
+                people_with_mask, people_without_mask, people_total)
+            SELECT device_id, statistic_type, date_trunc('{resolution}', datetime),
+                count(*), sum(people_with_mask), sum(people_without_mask),
+                sum(people_total)
+            FROM statistic
+            WHERE statistic_type IS NOT NULL
+            GROUP BY 1, 2, 3
+        """)
+
+
+def downgrade():
+    for table_name in reversed(list(ROLLUP_TABLES)):
+        op.drop_table(table_name)
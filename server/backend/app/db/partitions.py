@@ -0,0 +1,234 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+"""
+Create the monthly partitions of the statistic table in advance and drop the
+ones older than the retention period. Data of dropped partitions is kept,
+downsampled, in the statistic rollup tables.
+
+Usage:
+    python app/db/partitions.py [--ahead N] [--retention-months N]
+"""
+
+import argparse
+from datetime import date, datetime, timezone
+from typing import List, Optional, Tuple
+
+from app.core.config import (
+    STATISTIC_PARTITIONS_AHEAD,
+    STATISTIC_RETENTION_MONTHS,
+)
+from app.db.cruds import notify_statistic_changes
+from app.db.schema import session_scope
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+PARTITIONED_TABLE = "statistic"
+# Catches statistics outside of the existing partitions, they are moved when
+# the partition for their month is created
+DEFAULT_PARTITION = "statistic_default"
+
+
+def add_months(month: date, months: int) -> date:
+    """
+    Move the first day of a month some months forward or backward.
+
+    Arguments:
+        month {date} -- First day of a month.
+        months {int} -- Number of months to add, can be negative.
+
+    Returns:
+        date -- First day of the resulting month.
+    """
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def get_partition_name(month: date) -> str:
+    """
+    Name of the partition holding a month of statistics.
+
+    Arguments:
+        month {date} -- First day of the month.
+
+    Returns:
+        str -- Partition name, e.g: statistic_2021_01.
+    """
+    return f"{PARTITIONED_TABLE}_{month:%Y_%m}"
+
+
+def get_partitions(db_session: Session) -> List[date]:
+    """
+    Get the months that have a partition.
+
+    Arguments:
+        db_session {Session} -- Database session.
+
+    Returns:
+        List[date] -- Sorted first days of the months with a partition.
+    """
+    partitions = db_session.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+            "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+            "WHERE parent.relname = :table"
+        ),
+        {"table": PARTITIONED_TABLE},
+    )
+
+    months = []
+    for (name,) in partitions:
+        if name == DEFAULT_PARTITION:
+            continue
+        months.append(
+            datetime.strptime(name, f"{PARTITIONED_TABLE}_%Y_%m").date()
+        )
+
+    return sorted(months)
+
+
+def create_partition(db_session: Session, month: date) -> None:
+    """
+    Create the partition of a month, without committing. Statistics of that
+    month already stored in the default partition are moved to the new one.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        month {date} -- First day of the month.
+    """
+    name = get_partition_name(month)
+    bounds = {"start": month, "end": add_months(month, 1)}
+
+    db_session.execute(
+        text(f"CREATE TABLE {name} (LIKE {PARTITIONED_TABLE} INCLUDING ALL)")
+    )
+    # Statistics of that month inserted in the default partition after moving
+    # them would make ATTACH PARTITION fail. Block inserts until committing,
+    # on the parent table (and so its partitions) since rows are routed to a
+    # partition before waiting for its lock
+    db_session.execute(
+        text(f"LOCK TABLE {PARTITIONED_TABLE} IN SHARE ROW EXCLUSIVE MODE")
+    )
+    db_session.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            "WHERE datetime >= :start AND datetime < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        bounds,
+    )
+    # The primary key index is attached to the parent one, foreign keys cloned
+    db_session.execute(
+        text(
+            f"ALTER TABLE {PARTITIONED_TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+        )
+    )
+
+
+def drop_partition(db_session: Session, month: date) -> None:
+    """
+    Drop the partition of a month, without committing.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        month {date} -- First day of the month.
+    """
+    name = get_partition_name(month)
+    db_session.execute(
+        text(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {name}")
+    )
+    db_session.execute(text(f"DROP TABLE {name}"))
+
+
+def manage_partitions(
+    db_session: Session,
+    ahead: int = STATISTIC_PARTITIONS_AHEAD,
+    retention_months: int = STATISTIC_RETENTION_MONTHS,
+    today: Optional[date] = None,
+) -> Tuple[List[date], List[date]]:
+    """
+    Create the partitions from the current month to `ahead` months later, and
+    drop the ones older than `retention_months`.
+
+    Arguments:
+        db_session {Session} -- Database session.
+        ahead {int} -- Months to create in advance.
+        retention_months {int} -- Months of statistics to keep, besides the
+        current one. 0 keeps all of them.
+        today {Optional[date]} -- Reference date, today (UTC) by default.
+
+    Returns:
+        Tuple[List[date], List[date]] -- Months created and dropped.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    current_month = today.replace(day=1)
+    existing = get_partitions(db_session)
+
+    created = []
+    for months in range(ahead + 1):
+        month = add_months(current_month, months)
+        if month not in existing:
+            create_partition(db_session, month)
+            created.append(month)
+
+    dropped = []
+    if retention_months > 0:
+        oldest_month = add_months(current_month, -retention_months)
+        for month in existing:
+            if month < oldest_month:
+                drop_partition(db_session, month)
+                dropped.append(month)
+
+    if dropped:
+        notify_statistic_changes(db_session)
+
+    db_session.commit()
+    return created, dropped
+
+
+def main(ahead: int, retention_months: int):
+    with session_scope() as database_session:
+        created, dropped = manage_partitions(
+            database_session, ahead, retention_months
+        )
+
+    for month in created:
+        print(f"Created partition {get_partition_name(month)}")
+    for month in dropped:
+        print(f"Dropped partition {get_partition_name(month)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Manage statistic table partitions"
+    )
+    parser.add_argument(
+        "--ahead", type=int, default=STATISTIC_PARTITIONS_AHEAD
+    )
+    parser.add_argument(
+        "--retention-months", type=int, default=STATISTIC_RETENTION_MONTHS
+    )
+    args = parser.parse_args()
+    main(args.ahead, args.retention_months)
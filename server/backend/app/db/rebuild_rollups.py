@@ -0,0 +1,77 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+"""
+Recompute the statistic rollup tables from the statistic table, e.g: after
+statistics were modified directly in the database. The rollups of months
+whose statistic partitions were dropped by the retention policy are kept.
+
+Usage:
+    python app/db/rebuild_rollups.py [--device ID] [--from DATE] [--to DATE]
+"""
+
+import argparse
+import time
+from datetime import datetime, timezone
+
+from app.db.cruds import refresh_statistic_rollups
+from app.db.partitions import get_partitions
+from app.db.schema import session_scope
+
+
+def main(device_id: str = None, from_date: str = None, to_date: str = None):
+    start = time.perf_counter()
+    from_date = datetime.fromisoformat(from_date) if from_date else None
+    to_date = datetime.fromisoformat(to_date) if to_date else None
+    if from_date and from_date.tzinfo:
+        from_date = from_date.astimezone(timezone.utc).replace(tzinfo=None)
+
+    with session_scope() as database_session:
+        # Statistics older than the first partition only remain in the rollups
+        partitions = get_partitions(database_session)
+        if partitions:
+            first_date = datetime.combine(partitions[0], datetime.min.time())
+            from_date = max(from_date or first_date, first_date)
+
+        written = refresh_statistic_rollups(
+            database_session,
+            device_id=device_id,
+            from_date=from_date,
+            to_date=to_date,
+        )
+        database_session.commit()
+
+    print(
+        f"Rebuilt {written} rollup rows in "
+        f"{time.perf_counter() - start:.1f} seconds"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild statistic rollups")
+    parser.add_argument("--device", help="Only rebuild this device")
+    parser.add_argument(
+        "--from", dest="from_date", help="ISO datetime, e.g: 2021-01-31T10:00"
+    )
+    parser.add_argument("--to", dest="to_date", help="ISO datetime")
+    args = parser.parse_args()
+    main(args.device, args.from_date, args.to_date)
@@ -20,6 +20,34 @@
 # DEALINGS IN THE SOFTWARE.
 ################################################################################
 
-from .base import Base, engine, get_db_session, get_db_generator
-from .models import DeviceModel, StatisticsModel, VideoFilesModel
-from .schemas import DeviceSchema, StatisticSchema, VideoFileSchema
+from .base import (
+    Base,
+    async_database,
+    engine,
+    get_async_db,
+    get_db_generator,
+    get_db_session,
+    pool_metrics,
+    session_scope,
+)
+from .models import (
+    DeviceLatestModel,
+    DeviceModel,
+    StatisticDayModel,
+    StatisticHourModel,
+    StatisticMinuteModel,
+    StatisticsModel,
+    VideoFilesModel,
+)
+from .schemas import (
+    ChartDataSchema,
+    DeviceLatestSchema,
+    DeviceSchema,
+    DeviceSummarySchema,
+    StatisticAggregateSchema,
+    StatisticBulkCountsSchema,
+    StatisticBulkItemSchema,
+    StatisticBulkResultSchema,
+    StatisticSchema,
+    VideoFileSchema,
+)
@@ -20,25 +20,55 @@
 # DEALINGS IN THE SOFTWARE.
 ################################################################################
 
-from typing import Generator, Union
+from contextlib import contextmanager
+from typing import AsyncGenerator, Generator, Iterator
 
-from app.core.config import DB_URI
+from app.core.config import (
+    DB_ASYNC_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_TIMEOUT,
+    DB_URI,
+)
 
+from databases import Database
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, sessionmaker
 
+from .pool import MeasuredQueuePool, PoolMetrics, measure_pool
+
 
 def get_db_session() -> Session:
     """
-    Get a new create a new database session.
+    Create a new database session, the caller must close it.
+    Prefer session_scope, which closes it automatically.
 
     Returns:
         Session -- New database session.
     """
+    return SessionLocal()
+
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    Provide a database session within a with statement. The session is
+    rolled back if an exception is raised and always closed afterwards,
+    which returns its connection to the pool.
+
+    Returns:
+        Iterator[Session] -- New database session.
+    """
     db = SessionLocal()
     try:
-        return db
+        yield db
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
@@ -57,9 +87,42 @@ def get_db_generator() -> Generator:
         db.close()
 
 
+async def get_async_db() -> AsyncGenerator:
+    """
+    Get a connection of the async database pool, released after the request.
+
+    Returns:
+        AsyncGenerator -- New async database connection.
+    """
+    async with async_database.connection() as connection:
+        yield connection
+
+
 # Create ORM engine and session
-engine = create_engine(DB_URI)
+# executemany_mode="values" turns bulk inserts into multi-row INSERT statements
+engine = create_engine(
+    DB_URI,
+    executemany_mode="values",
+    poolclass=MeasuredQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args={"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"},
+)
+pool_metrics = PoolMetrics()
+measure_pool(engine, pool_metrics)
 SessionLocal = sessionmaker(bind=engine)
 
+# Async database for the API read endpoints, which don't hold a worker thread
+# while they wait for the database. Connected on API startup
+async_database = Database(
+    DB_URI,
+    min_size=1,
+    max_size=DB_ASYNC_POOL_SIZE,
+    server_settings={"statement_timeout": str(DB_STATEMENT_TIMEOUT)},
+)
+
 # Construct a base class for declarative class definitions
 Base = declarative_base()
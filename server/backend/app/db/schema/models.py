@@ -24,10 +24,12 @@ from app.db.schema import Base
 from app.db.utils import StatisticTypeEnum
 
 from sqlalchemy import Column, DateTime, Enum, ForeignKey, Integer, String
+from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import relationship
 
 
 class StatisticsModel(Base):
+    # Partitioned by month on datetime, see app/db/partitions.py
     __tablename__ = "statistic"
 
     device_id = Column(
@@ -42,6 +44,66 @@ class StatisticsModel(Base):
     people_total = Column(Integer, nullable=False)
 
 
+class StatisticRollupMixin:
+    """
+    Sums of the statistics of a device within a time bucket, maintained
+    incrementally as statistics are ingested (see crud_statistic_rollup).
+    """
+
+    @declared_attr
+    def device_id(cls):
+        # Deleted along with the device, also by statements outside the ORM
+        return Column(
+            String,
+            ForeignKey("device.id", ondelete="CASCADE"),
+            primary_key=True,
+        )
+
+    statistic_type = Column(Enum(StatisticTypeEnum), primary_key=True)
+    bucket = Column(DateTime(timezone=True), primary_key=True)
+    samples = Column(Integer, nullable=False)
+    people_with_mask = Column(Integer, nullable=False)
+    people_without_mask = Column(Integer, nullable=False)
+    people_total = Column(Integer, nullable=False)
+
+
+class StatisticMinuteModel(StatisticRollupMixin, Base):
+    __tablename__ = "statistic_minute"
+
+
+class StatisticHourModel(StatisticRollupMixin, Base):
+    __tablename__ = "statistic_hour"
+
+
+class StatisticDayModel(StatisticRollupMixin, Base):
+    __tablename__ = "statistic_day"
+
+
+class DeviceLatestModel(Base):
+    """
+    Last statistic, last alert and last hello and file list times of every
+    device, upserted as messages are ingested (see crud_device_latest).
+    """
+
+    # Created with fillfactor 70, rows are updated in place all the time
+    __tablename__ = "device_latest"
+
+    device_id = Column(
+        String, ForeignKey("device.id", ondelete="CASCADE"), primary_key=True
+    )
+    statistic_datetime = Column(DateTime(timezone=True))
+    statistic_type = Column(Enum(StatisticTypeEnum))
+    people_with_mask = Column(Integer)
+    people_without_mask = Column(Integer)
+    people_total = Column(Integer)
+    alert_datetime = Column(DateTime(timezone=True))
+    alert_people_with_mask = Column(Integer)
+    alert_people_without_mask = Column(Integer)
+    alert_people_total = Column(Integer)
+    hello_datetime = Column(DateTime(timezone=True))
+    files_datetime = Column(DateTime(timezone=True))
+
+
 class VideoFilesModel(Base):
     __tablename__ = "video_file"
     device_id = Column(
@@ -60,3 +122,11 @@ class DeviceModel(Base):
     file_server_address = Column(String)
     statistics = relationship("StatisticsModel", cascade="all, delete")
     video_files = relationship("VideoFilesModel", cascade="all, delete")
+    statistics_minute = relationship(
+        "StatisticMinuteModel", cascade="all, delete"
+    )
+    statistics_hour = relationship("StatisticHourModel", cascade="all, delete")
+    statistics_day = relationship("StatisticDayModel", cascade="all, delete")
+    latest = relationship(
+        "DeviceLatestModel", cascade="all, delete", uselist=False
+    )
@@ -0,0 +1,139 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class PoolMetrics:
+    """
+    Connection pool usage: checkouts, time waited for a connection,
+    timeouts, new and failed connections and invalidated (broken) ones.
+    """
+
+    def __init__(self, max_samples: int = 10000):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.connect_errors = 0
+        self.invalidations = 0
+        self.max_wait = 0.0
+        self.total_wait = 0.0
+        self._waits = deque(maxlen=max_samples)
+        self.pool = None
+
+    def waited(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+            self._waits.append(seconds)
+
+    def increment(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            snapshot = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "connect_errors": self.connect_errors,
+                "invalidations": self.invalidations,
+                "mean_wait_ms": (
+                    self.total_wait * 1000 / self.checkouts
+                    if self.checkouts
+                    else 0.0
+                ),
+                "p95_wait_ms": (
+                    waits[int(0.95 * (len(waits) - 1))] * 1000
+                    if waits
+                    else 0.0
+                ),
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+        if self.pool is not None:
+            snapshot.update(
+                size=self.pool.size(),
+                checked_out=self.pool.checkedout(),
+                overflow=max(0, self.pool.overflow()),
+            )
+        return snapshot
+
+
+class MeasuredQueuePool(QueuePool):
+    """
+    QueuePool that records in `metrics` how long every checkout waited.
+    """
+
+    metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except TimeoutError:
+            self.metrics.waited(time.perf_counter() - start, timed_out=True)
+            raise
+        except Exception:
+            self.metrics.increment("connect_errors")
+            raise
+        self.metrics.waited(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # Keep measuring if the pool is recreated, e.g: engine.dispose()
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        self.metrics.pool = pool
+        return pool
+
+
+def measure_pool(engine, metrics: PoolMetrics) -> None:
+    """
+    Record the pool usage of an engine created with MeasuredQueuePool.
+
+    Arguments:
+        engine {Engine} -- Database engine.
+        metrics {PoolMetrics} -- Where usage is recorded.
+    """
+    engine.pool.metrics = metrics
+    metrics.pool = engine.pool
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics.increment("connects")
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.increment("invalidations")
@@ -20,11 +20,11 @@
 # DEALINGS IN THE SOFTWARE.
 ################################################################################
 
-from datetime import datetime
-from typing import Optional, List
+from datetime import datetime, timezone
+from typing import Dict, Optional, List
 
 from app.db.utils import StatisticTypeEnum
-from pydantic import BaseModel
+from pydantic import BaseModel, conint, validator
 
 
 class StatisticSchema(BaseModel):
@@ -43,7 +43,29 @@ class DeviceSchema(BaseModel):
     id: str
     description: Optional[str] = None
     file_server_address: Optional[str] = None
-    statistics: List[StatisticSchema] = []
+
+    class Config:
+        orm_mode = True
+
+
+class DeviceSummarySchema(DeviceSchema):
+    last_seen: Optional[datetime] = None
+    latest_statistic: Optional[StatisticSchema] = None
+
+
+class DeviceLatestSchema(BaseModel):
+    device_id: str
+    statistic_datetime: Optional[datetime] = None
+    statistic_type: Optional[StatisticTypeEnum] = None
+    people_with_mask: Optional[int] = None
+    people_without_mask: Optional[int] = None
+    people_total: Optional[int] = None
+    alert_datetime: Optional[datetime] = None
+    alert_people_with_mask: Optional[int] = None
+    alert_people_without_mask: Optional[int] = None
+    alert_people_total: Optional[int] = None
+    hello_datetime: Optional[datetime] = None
+    files_datetime: Optional[datetime] = None
 
     class Config:
         orm_mode = True
@@ -55,3 +77,40 @@ class VideoFileSchema(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class ChartDataSchema(BaseModel):
+    dates: List[datetime]
+    people_with_mask: List[int]
+    people_total: List[int]
+    mask_percentage: List[float]
+    visible_people: List[int]
+
+
+class StatisticAggregateSchema(BaseModel):
+    reports: Optional[ChartDataSchema] = None
+    alerts: Optional[ChartDataSchema] = None
+
+
+class StatisticBulkItemSchema(BaseModel):
+    device_id: str
+    # Unix timestamp or ISO 8601 string, UTC unless it has a timezone
+    datetime: datetime
+    statistic_type: StatisticTypeEnum
+    people_with_mask: conint(ge=0)
+    people_without_mask: conint(ge=0)
+    people_total: conint(ge=0)
+
+    @validator("datetime")
+    def datetime_with_timezone(cls, value):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class StatisticBulkCountsSchema(BaseModel):
+    received: int
+    inserted: int
+    conflicts: int
+
+
+class StatisticBulkResultSchema(StatisticBulkCountsSchema):
+    devices: Dict[str, StatisticBulkCountsSchema]
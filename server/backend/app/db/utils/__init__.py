@@ -1,2 +1,10 @@
-from .enums import StatisticTypeEnum
-from .utils import convert_timestamp_to_datetime, get_enum_type
+from .enums import StatisticBucketEnum, StatisticTypeEnum
+from .utils import (
+    ROLLUP_RESOLUTIONS,
+    UPSERT_BATCH_SIZE,
+    convert_timestamp_to_datetime,
+    decode_cursor,
+    encode_cursor,
+    get_enum_type,
+    truncate_datetime,
+)
@@ -4,3 +4,11 @@ from enum import Enum
 class StatisticTypeEnum(str, Enum):
     REPORT = "REPORT"
     ALERT = "ALERT"
+
+
+class StatisticBucketEnum(str, Enum):
+    MINUTE = "minute"
+    HOUR = "hour"
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
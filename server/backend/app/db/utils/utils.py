@@ -1,7 +1,21 @@
-from datetime import datetime, timezone
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Tuple
 
 from .enums import StatisticTypeEnum
 
+# Rows per INSERT ... ON CONFLICT statement, keeps bind parameters under
+# PostgreSQL's limit of 65535 per statement
+UPSERT_BATCH_SIZE = 1000
+
+# Time buckets of the statistic rollup tables
+ROLLUP_RESOLUTIONS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
 
 def convert_timestamp_to_datetime(timestamp: float) -> datetime:
     """
@@ -32,3 +46,62 @@ def get_enum_type(statistic_type: str) -> StatisticTypeEnum:
         if statistic_type.lower() == "alerts"
         else StatisticTypeEnum.REPORT
     )
+
+
+def truncate_datetime(value: datetime, resolution: str) -> datetime:
+    """
+    Truncate a datetime to the start of its rollup bucket, in UTC.
+
+    Arguments:
+        value {datetime} -- Input datetime, naive ones are assumed to be UTC.
+        resolution {str} -- One of ROLLUP_RESOLUTIONS.
+
+    Returns:
+        datetime -- Naive UTC datetime where the bucket starts, the same
+        value PostgreSQL's date_trunc returns for the statistic table.
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    value = value.replace(second=0, microsecond=0)
+    if resolution in ("hour", "day"):
+        value = value.replace(minute=0)
+    if resolution == "day":
+        value = value.replace(hour=0)
+
+    return value
+
+
+def encode_cursor(device_id: str, statistic_datetime: datetime) -> str:
+    """
+    Encode the key of the last statistic of a page as an opaque cursor.
+
+    Arguments:
+        device_id {str} -- Device id of the last statistic.
+        statistic_datetime {datetime} -- Datetime of the last statistic.
+
+    Returns:
+        str -- URL-safe cursor to request the next page.
+    """
+    key = json.dumps([device_id, statistic_datetime.isoformat()])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, datetime]:
+    """
+    Decode a cursor created by encode_cursor.
+
+    Arguments:
+        cursor {str} -- Cursor received from the client.
+
+    Returns:
+        Tuple[str, datetime] -- Device id and datetime of the last statistic
+        of the previous page. Raises ValueError if the cursor is not valid.
+    """
+    try:
+        device_id, statistic_datetime = json.loads(
+            base64.urlsafe_b64decode(cursor.encode())
+        )
+        return str(device_id), datetime.fromisoformat(statistic_datetime)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
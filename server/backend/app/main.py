@@ -22,12 +22,52 @@
 
 from fastapi import FastAPI
 
-from app.api import device_router, statistic_router
+from app.api import (
+    CompressionMiddleware,
+    database_listener,
+    device_router,
+    export_router,
+    live_hub,
+    live_router,
+    statistic_router,
+    statistics_cache,
+)
+from app.core.config import GZIP_MINIMUM_SIZE
+from app.db.cruds import (
+    DEVICE_DELETED_CHANNEL,
+    DEVICE_STATUS_CHANNEL,
+    STATISTIC_CHANGES_CHANNEL,
+)
+from app.db.schema import async_database, pool_metrics
 
 app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=GZIP_MINIMUM_SIZE)
 
 app.include_router(device_router)
 app.include_router(statistic_router)
+app.include_router(export_router)
+app.include_router(live_router)
+
+# Statistic changes, device status messages and deleted devices announced by
+# the database
+database_listener.add_channel(STATISTIC_CHANGES_CHANNEL, statistics_cache.on_change)
+database_listener.add_channel(STATISTIC_CHANGES_CHANNEL, live_hub.on_statistic_changes)
+database_listener.add_channel(DEVICE_STATUS_CHANNEL, live_hub.on_device_status)
+database_listener.add_channel(DEVICE_DELETED_CHANNEL, statistics_cache.on_device_deleted)
+database_listener.add_reset_callback(statistics_cache.reset)
+database_listener.add_reset_callback(live_hub.reset)
+
+
+@app.on_event("startup")
+async def startup():
+    await async_database.connect()
+    await database_listener.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await database_listener.close()
+    await async_database.disconnect()
 
 
 @app.get("/")
@@ -36,3 +76,16 @@ def health_check():
     API health check used by the load balancer.
     """
     return {"statusCode": 200}
+
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Database connection pool, response cache and live connections usage of
+    this API worker process.
+    """
+    return {
+        "db_pool": pool_metrics.snapshot(),
+        "response_cache": statistics_cache.snapshot(),
+        "live": live_hub.snapshot(),
+    }
@@ -25,13 +25,17 @@ from paho.mqtt import client as mqtt_client
 from typing import Callable
 
 
-def connect_mqtt_broker(client_id: str, cb_connect: Callable=None) -> mqtt_client:
+def connect_mqtt_broker(
+    client_id: str, cb_connect: Callable=None, clean_session: bool=True
+) -> mqtt_client:
     """
     Connect to MQTT broker.
 
     Arguments:
         client_id {str} -- Client process id.
         cb_connect {Callable} -- Callback for on_connect
+        clean_session {bool} -- If False, the broker keeps the subscriptions and
+        queues QoS>0 messages while the client is disconnected.
 
     Returns:
         mqtt_client -- MQTT client.
@@ -48,7 +52,7 @@ def connect_mqtt_broker(client_id: str, cb_connect: Callable=None) -> mqtt_clien
     def on_disconnect(client, userdata, code):
         print("MQTT Broker disconnected")
 
-    client = mqtt_client.Client(client_id)
+    client = mqtt_client.Client(client_id, clean_session=clean_session)
     client.on_connect = on_connect
     client.on_disconnect = on_disconnect
     client.connect(MQTT_BROKER, MQTT_BROKER_PORT)
@@ -0,0 +1,636 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+
+import queue
+import select
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from app.core.config import (
+    DB_URI,
+    INGEST_BATCH_SIZE,
+    INGEST_DB_WORKERS,
+    INGEST_FLUSH_INTERVAL,
+    INGEST_MAX_PENDING,
+    INGEST_METRICS_INTERVAL,
+    INGEST_QUEUE_SIZE,
+    INGEST_RETRY_INTERVAL,
+    INGEST_RETRY_MAX_INTERVAL,
+)
+from app.db.cruds import (
+    DEVICE_DELETED_CHANNEL,
+    get_device_ids,
+    upsert_devices,
+    upsert_statistics,
+)
+from app.db.schema import pool_metrics, session_scope
+
+import psycopg2
+
+from sqlalchemy.exc import (
+    IntegrityError,
+    InterfaceError,
+    OperationalError,
+    TimeoutError,
+)
+
+# Kinds of decoded messages
+STATISTIC_MESSAGE = "statistic"
+EVENT_MESSAGE = "event"
+SKIPPED_MESSAGE = "skipped"  # Handled by another subscriber process
+
+# PostgreSQL error code for foreign key violations
+FOREIGN_KEY_VIOLATION = "23503"
+
+# Errors of an unavailable database (restarts, lost connections, timeouts),
+# the statistics are written again once it's back
+TRANSIENT_ERRORS = (InterfaceError, OperationalError, TimeoutError)
+
+# Attempts to write each batch once the buffer is stopping
+STOPPING_WRITE_ATTEMPTS = 3
+
+# Seconds before listening for deleted devices again after losing the connection
+LISTEN_RETRY_INTERVAL = 5
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of a list of samples.
+
+    Arguments:
+        samples {List[float]} -- Unsorted samples.
+        fraction {float} -- Percentile to compute, between 0 and 1.
+
+    Returns:
+        float -- Percentile value, or 0 if there are no samples.
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class IngestionMetrics:
+    """
+    Throughput, latency, drop and lag counters of the ingestion pipeline.
+    """
+
+    def __init__(self, max_samples: int = 10000):
+        self._lock = threading.Lock()
+        self.start_time = time.time()
+        self.messages_received = 0
+        self.messages_dropped = 0
+        self.messages_invalid = 0
+        self.messages_skipped = 0
+        self.events_written = 0
+        self.rows_received = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.rows_duplicated = 0
+        self.write_retries = 0
+        self.batches = 0
+        self.flush_seconds = 0.0
+        self.max_queue_lag = 0.0
+        self.queue_depths = {}
+        # Device timestamp -> commit, and MQTT reception -> commit
+        self.device_latencies = deque(maxlen=max_samples)
+        self.ingest_latencies = deque(maxlen=max_samples)
+        self._last_report = (self.start_time, 0)
+
+    def increment(self, counter: str, count: int = 1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + count)
+
+    def dequeued(self, received_time: float):
+        lag = time.time() - received_time
+        with self._lock:
+            self.max_queue_lag = max(self.max_queue_lag, lag)
+
+    def written(
+        self,
+        rows: List[Dict],
+        flush_seconds: float,
+        inserted: int = None,
+        failed: int = 0,
+    ):
+        commit_time = time.time()
+        if inserted is None:
+            inserted = len(rows) - failed
+        with self._lock:
+            self.batches += 1
+            self.rows_written += inserted
+            self.rows_failed += failed
+            self.rows_duplicated += len(rows) - inserted - failed
+            self.flush_seconds += flush_seconds
+            for row in rows:
+                self.device_latencies.append(
+                    commit_time - row["datetime"].timestamp()
+                )
+                self.ingest_latencies.append(commit_time - row["_received"])
+
+    def snapshot(self) -> Dict:
+        """
+        Current metrics. Rates and max lag are computed since the previous snapshot.
+        """
+        with self._lock:
+            now = time.time()
+            last_time, last_written = self._last_report
+            self._last_report = (now, self.rows_written)
+            device_latencies = list(self.device_latencies)
+            ingest_latencies = list(self.ingest_latencies)
+            max_queue_lag, self.max_queue_lag = self.max_queue_lag, 0.0
+            return {
+                "messages_received": self.messages_received,
+                "messages_dropped": self.messages_dropped,
+                "messages_invalid": self.messages_invalid,
+                "messages_skipped": self.messages_skipped,
+                "events_written": self.events_written,
+                "rows_received": self.rows_received,
+                "rows_written": self.rows_written,
+                "rows_failed": self.rows_failed,
+                "rows_duplicated": self.rows_duplicated,
+                "write_retries": self.write_retries,
+                "batches": self.batches,
+                "queue_depths": dict(self.queue_depths),
+                "max_queue_lag": max_queue_lag,
+                "rows_per_second": (self.rows_written - last_written)
+                / max(now - last_time, 1e-6),
+                "mean_flush_ms": 1000 * self.flush_seconds / max(self.batches, 1),
+                "device_latency_p50": percentile(device_latencies, 0.5),
+                "device_latency_p95": percentile(device_latencies, 0.95),
+                "device_latency_p99": percentile(device_latencies, 0.99),
+                "ingest_latency_p50": percentile(ingest_latencies, 0.5),
+                "ingest_latency_p95": percentile(ingest_latencies, 0.95),
+                "ingest_latency_p99": percentile(ingest_latencies, 0.99),
+            }
+
+
+class DeviceRegistry:
+    """
+    In-process cache of the device ids present in the database, so that
+    writing statistics doesn't need a device lookup per message.
+    Devices that send statistics without a previous hello (e.g: the hello
+    message was lost) are registered in bulk before their statistics.
+    Devices deleted through the API are forgotten as soon as their deletion
+    is announced on DEVICE_DELETED_CHANNEL, see listen_deletions.
+    """
+
+    def __init__(self):
+        self._device_ids = set()
+        self._lock = threading.Lock()
+        self._listener = None
+        self.auto_registered = 0
+
+    def warm(self):
+        """
+        Load all the device ids from the database.
+        """
+        with session_scope() as database_session:
+            device_ids = get_device_ids(db_session=database_session)
+
+        with self._lock:
+            self._device_ids = set(device_ids)
+        print(f"Device registry loaded with {len(device_ids)} devices")
+
+    def listen_deletions(self):
+        """
+        Forget the deleted devices in a background thread, which listens
+        for their ids on DEVICE_DELETED_CHANNEL.
+        """
+        if self._listener is None:
+            self._listener = threading.Thread(
+                target=self._listen_forever, name="device-deletions", daemon=True
+            )
+            self._listener.start()
+
+    def _listen_forever(self):
+        reconnecting = False
+        while True:
+            try:
+                connection = psycopg2.connect(DB_URI)
+                try:
+                    connection.set_session(autocommit=True)
+                    with connection.cursor() as cursor:
+                        cursor.execute(f"LISTEN {DEVICE_DELETED_CHANNEL}")
+                    if reconnecting:
+                        # Devices might have been deleted while disconnected
+                        self.warm()
+
+                    while True:
+                        select.select([connection], [], [])
+                        connection.poll()
+                        device_ids = [
+                            notification.payload
+                            for notification in connection.notifies
+                        ]
+                        connection.notifies.clear()
+                        self.invalidate(device_ids)
+                finally:
+                    connection.close()
+            except Exception as e:
+                print(f"Exception listening for deleted devices: {e}")
+            reconnecting = True
+            time.sleep(LISTEN_RETRY_INTERVAL)
+
+    def add(self, device_id: str):
+        with self._lock:
+            self._device_ids.add(device_id)
+
+    def invalidate(self, device_ids: Iterable[str]):
+        """
+        Forget devices, e.g: when they were deleted from the database.
+        """
+        with self._lock:
+            self._device_ids.difference_update(device_ids)
+
+    def register(self, database_session, device_ids: Iterable[str]) -> int:
+        """
+        Make sure that all the devices exist in the database,
+        creating the unknown ones with a single statement.
+
+        Arguments:
+            database_session {Session} -- Database session.
+            device_ids {Iterable[str]} -- Device ids to check.
+
+        Returns:
+            int -- Number of devices created.
+        """
+        with self._lock:
+            unknown = set(device_ids) - self._device_ids
+        if not unknown:
+            return 0
+
+        created = upsert_devices(
+            db_session=database_session,
+            devices_information=[
+                {"id": device_id, "description": None} for device_id in unknown
+            ],
+        )
+        with self._lock:
+            self._device_ids.update(unknown)
+            self.auto_registered += created
+        if created:
+            print(f"Auto-registered {created} devices without hello message")
+        return created
+
+
+class StatisticBuffer:
+    """
+    Accumulate statistics and write them to the database in bulk, when
+    batch_size rows are pending or every flush_interval seconds, whichever
+    comes first. Batches are written by a pool of db_workers threads.
+
+    At most max_pending statistics wait in the buffer: add() blocks beyond
+    that, which pushes back on whoever is feeding the buffer. Batches are
+    written again while the database is unavailable, which keeps the buffer
+    full until it's back, and only the statistics the database rejects are
+    dropped.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = INGEST_BATCH_SIZE,
+        flush_interval: float = INGEST_FLUSH_INTERVAL,
+        max_pending: int = INGEST_MAX_PENDING,
+        db_workers: int = INGEST_DB_WORKERS,
+        metrics: IngestionMetrics = None,
+        device_registry: DeviceRegistry = None,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max(max_pending, batch_size)
+        self.metrics = metrics if metrics is not None else IngestionMetrics()
+        self.device_registry = device_registry or DeviceRegistry()
+        self._rows = []
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._flush_requested = threading.Event()
+        self._stopped = threading.Event()
+        # Limits the batches waiting for a worker, so memory stays bounded
+        self._in_flight = threading.BoundedSemaphore(db_workers)
+        self._db_pool = ThreadPoolExecutor(
+            max_workers=db_workers, thread_name_prefix="statistic-writer"
+        )
+        self._thread = threading.Thread(
+            target=self._run, name="statistic-buffer", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread, writing all pending statistics.
+        """
+        self._stopped.set()
+        self._flush_requested.set()
+        self._thread.join()
+        self._db_pool.shutdown(wait=True)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+    def add(self, statistic_information: Dict, received_time: float = None):
+        """
+        Enqueue a statistic to be written in a following batch.
+        Blocks while the buffer is full.
+
+        Arguments:
+            statistic_information {Dict} -- New statistic information.
+            received_time {float} -- Timestamp when the MQTT message arrived.
+        """
+        statistic_information["_received"] = received_time or time.time()
+        with self._not_full:
+            while len(self._rows) >= self.max_pending:
+                self._flush_requested.set()
+                self._not_full.wait()
+            self._rows.append(statistic_information)
+            pending = len(self._rows)
+        self.metrics.increment("rows_received")
+
+        if pending >= self.batch_size:
+            self._flush_requested.set()
+
+    def flush(self):
+        """
+        Hand all pending statistics to the database workers.
+        """
+        with self._not_full:
+            rows, self._rows = self._rows, []
+            self._not_full.notify_all()
+
+        for first in range(0, len(rows), self.batch_size):
+            self._in_flight.acquire()
+            future = self._db_pool.submit(
+                self._write, rows[first : first + self.batch_size]
+            )
+            future.add_done_callback(lambda _: self._in_flight.release())
+
+    def _write(self, rows: List[Dict]):
+        start = time.perf_counter()
+        statistics = [
+            {key: value for key, value in row.items() if key != "_received"}
+            for row in rows
+        ]
+        inserted, failed = 0, 0
+        try:
+            inserted = self._write_retrying(statistics)
+        except TRANSIENT_ERRORS as e:
+            # Only when stopping, with the database still unavailable
+            print(f"Exception writing {len(rows)} statistics: {e}")
+            failed = len(rows)
+        except Exception as e:
+            # Rejected by the database, write them one at a time to find which
+            print(f"Exception writing {len(rows)} statistics, one by one: {e}")
+            for statistic in statistics:
+                try:
+                    inserted += self._write_retrying([statistic])
+                except Exception as e:
+                    print(f"Dropped statistic {statistic}: {e}")
+                    failed += 1
+
+        self.metrics.written(rows, time.perf_counter() - start, inserted, failed)
+
+    def _write_retrying(self, statistics: List[Dict]) -> int:
+        """
+        Write statistics in a single transaction, attempting it again
+        while the database is unavailable.
+
+        Arguments:
+            statistics {List[Dict]} -- Statistics to write.
+
+        Returns:
+            int -- Number of statistics inserted.
+        """
+        interval, attempts = INGEST_RETRY_INTERVAL, 0
+        while True:
+            try:
+                return self._write_batch(statistics)
+            except TRANSIENT_ERRORS as e:
+                attempts += 1
+                if self._stopped.is_set() and attempts >= STOPPING_WRITE_ATTEMPTS:
+                    raise
+                print(
+                    f"Database unavailable writing {len(statistics)} statistics, "
+                    f"retrying in {interval:.1f}s: {e}"
+                )
+                self.metrics.increment("write_retries")
+                self._stopped.wait(interval)
+                interval = min(interval * 2, INGEST_RETRY_MAX_INTERVAL)
+
+    def _write_batch(self, statistics: List[Dict]) -> int:
+        device_ids = {statistic["device_id"] for statistic in statistics}
+        with session_scope() as database_session:
+            try:
+                return self._upsert(database_session, device_ids, statistics)
+            except IntegrityError as e:
+                if getattr(e.orig, "pgcode", None) != FOREIGN_KEY_VIOLATION:
+                    raise
+                # Some device was deleted after being cached, register it again
+                database_session.rollback()
+                self.device_registry.invalidate(device_ids)
+                return self._upsert(database_session, device_ids, statistics)
+
+    def _upsert(self, database_session, device_ids, statistics: List[Dict]) -> int:
+        self.device_registry.register(database_session, device_ids)
+        # Duplicates are skipped by the database, no failed transactions
+        return upsert_statistics(
+            db_session=database_session,
+            statistics_information=statistics,
+        )
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+            self.flush()
+
+        self.flush()
+
+
+class IngestionPipeline:
+    """
+    Staged processing of MQTT messages, so that paho's network thread never
+    waits on the database:
+
+        receive -> decode and validate -> persist
+
+    - receive: on_message only enqueues the raw message. If the queue is full
+      the message is dropped and counted, keepalives are never delayed.
+    - decode: decode_message(topic, payload) returns (STATISTIC_MESSAGE, dict),
+      (EVENT_MESSAGE, dict) or (SKIPPED_MESSAGE, dict) for messages that belong
+      to another subscriber process. It raises ValueError for invalid messages.
+    - persist: statistics go to a StatisticBuffer written by a small pool of
+      database workers. Events (hello, file lists) are handled one at a time,
+      in arrival order, by persist_event(database_session, topic, dict).
+    """
+
+    def __init__(
+        self,
+        decode_message: Callable[[str, bytes], Tuple[str, Dict]],
+        persist_event: Callable,
+        queue_size: int = INGEST_QUEUE_SIZE,
+        metrics_interval: float = INGEST_METRICS_INTERVAL,
+        statistic_buffer: StatisticBuffer = None,
+    ):
+        self.decode_message = decode_message
+        self.persist_event = persist_event
+        self.metrics_interval = metrics_interval
+        self.metrics = IngestionMetrics()
+        self.statistic_buffer = statistic_buffer or StatisticBuffer()
+        self.statistic_buffer.metrics = self.metrics
+        self._received = queue.Queue(maxsize=queue_size)
+        self._events = queue.Queue(maxsize=queue_size)
+        self._stopped = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._decode_loop, name="ingest-decode"),
+            threading.Thread(target=self._event_loop, name="ingest-events"),
+            threading.Thread(target=self._metrics_loop, name="ingest-metrics"),
+        ]
+        for thread in self._threads:
+            thread.daemon = True
+
+    def start(self):
+        self.statistic_buffer.device_registry.warm()
+        self.statistic_buffer.device_registry.listen_deletions()
+        self.statistic_buffer.start()
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Stop receiving, then drain every stage in order.
+        """
+        self._received.put((None, None, None))
+        self._threads[0].join()
+        self._events.put((None, None, None))
+        self._threads[1].join()
+        self.statistic_buffer.stop()
+        self._stopped.set()
+        print_metrics(self.snapshot())
+
+    def submit(self, topic: str, payload: bytes) -> bool:
+        """
+        Receive stage, called from paho's network thread. Never blocks.
+
+        Returns:
+            bool -- False if the message was dropped.
+        """
+        self.metrics.increment("messages_received")
+        try:
+            self._received.put_nowait((topic, payload, time.time()))
+            return True
+        except queue.Full:
+            self.metrics.increment("messages_dropped")
+            return False
+
+    def snapshot(self) -> Dict:
+        self.metrics.queue_depths = {
+            "received": self._received.qsize(),
+            "events": self._events.qsize(),
+            "statistics": self.statistic_buffer.pending(),
+        }
+        snapshot = self.metrics.snapshot()
+        snapshot["db_pool"] = pool_metrics.snapshot()
+        return snapshot
+
+    def _decode_loop(self):
+        while True:
+            topic, payload, received_time = self._received.get()
+            if topic is None:
+                return
+            self.metrics.dequeued(received_time)
+
+            try:
+                kind, information = self.decode_message(topic, payload)
+            except (ValueError, KeyError, TypeError) as e:
+                self.metrics.increment("messages_invalid")
+                print(f"Invalid message in topic {topic}: {e}")
+                continue
+
+            # Both puts block when the next stage is full (backpressure)
+            if kind == STATISTIC_MESSAGE:
+                self.statistic_buffer.add(information, received_time)
+            elif kind == EVENT_MESSAGE:
+                self._events.put((topic, information, received_time))
+            else:
+                self.metrics.increment("messages_skipped")
+
+    def _event_loop(self):
+        while True:
+            topic, information, received_time = self._events.get()
+            if topic is None:
+                return
+
+            try:
+                with session_scope() as database_session:
+                    self.persist_event(database_session, topic, information)
+                self.metrics.increment("events_written")
+            except Exception as e:
+                print(f"Exception processing message in topic {topic}: {e}")
+
+    def _metrics_loop(self):
+        while not self._stopped.wait(self.metrics_interval):
+            print_metrics(self.snapshot())
+
+
+def print_metrics(metrics: Dict):
+    """
+    Log ingestion metrics in a single line.
+    """
+    queue_depths = " ".join(
+        f"{name}={depth}" for name, depth in metrics["queue_depths"].items()
+    )
+    db_pool = metrics.get("db_pool", {})
+    print(
+        "Ingestion: "
+        f"{metrics['rows_per_second']:.1f} rows/s | "
+        f"received={metrics['messages_received']} "
+        f"dropped={metrics['messages_dropped']} "
+        f"invalid={metrics['messages_invalid']} "
+        f"skipped={metrics['messages_skipped']} | "
+        f"written={metrics['rows_written']} failed={metrics['rows_failed']} "
+        f"duplicated={metrics['rows_duplicated']} "
+        f"retries={metrics['write_retries']} "
+        f"batches={metrics['batches']} flush={metrics['mean_flush_ms']:.1f}ms | "
+        f"queues: {queue_depths} lag={metrics['max_queue_lag']:.3f}s | "
+        "device->commit "
+        f"p50={metrics['device_latency_p50']:.2f}s "
+        f"p95={metrics['device_latency_p95']:.2f}s "
+        f"p99={metrics['device_latency_p99']:.2f}s | "
+        "received->commit "
+        f"p50={metrics['ingest_latency_p50']:.3f}s "
+        f"p95={metrics['ingest_latency_p95']:.3f}s "
+        f"p99={metrics['ingest_latency_p99']:.3f}s | "
+        f"db pool: checked_out={db_pool.get('checked_out', 0)} "
+        f"overflow={db_pool.get('overflow', 0)} "
+        f"wait p95={db_pool.get('p95_wait_ms', 0):.1f}ms "
+        f"max={db_pool.get('max_wait_ms', 0):.1f}ms "
+        f"timeouts={db_pool.get('timeouts', 0)} "
+        f"reconnects={db_pool.get('invalidations', 0)}"
+    )
@@ -20,81 +20,403 @@
 # DEALINGS IN THE SOFTWARE.
 ################################################################################
 
+"""
+Fleet simulator: publishes the same MQTT messages as a fleet of MaskCam
+devices, and measures how the backend subscriber keeps up with them.
+
+Usage (from the backend folder, see docs/Useful-Development-Scripts.md):
+    python app/mqtt/publisher.py --devices 1000 --period 15 --duration 300
+"""
+
+import argparse
 import json
 import random
+import threading
 import time
-from datetime import datetime, timezone, timedelta
+import uuid
+from datetime import datetime, timezone
+from typing import Dict
+
+from app.core.config import (
+    MQTT_ALERT_TOPIC,
+    MQTT_BROKER,
+    MQTT_BROKER_PORT,
+    MQTT_FILES_TOPIC,
+    MQTT_HELLO_TOPIC,
+    MQTT_REPORT_TOPIC,
+)
+from app.db.schema import get_db_session
+from ingestion import percentile
 from paho.mqtt import client as mqtt_client
+from sqlalchemy import text
 
 
-def publish(client):
-    for msg_count in range(0, 6):
-        time.sleep(1)
+class SimulatedDevice:
+    """
+    Messages of a single device, with the same format that maskcam_run.py sends.
+    """
 
-        device_id = f"Device_{msg_count}"
+    def __init__(self, device_id: str, files: int, period: float):
+        self.device_id = device_id
+        # Spread devices over the period, like devices started at random times
+        self.next_statistic = time.time() + random.uniform(0, period)
+        self.next_files = self.next_statistic
+        self.file_counter = files
+        self.file_list = [self.file_name(number) for number in range(files)]
 
-        # Test hello
-        topic = "hello"
-        hello_msg = {
-            "id": device_id,
-            "description": f"Description {msg_count}",
+    def file_name(self, number: int) -> str:
+        return f"{self.device_id}_{number:06}.mp4"
+
+    def hello(self) -> Dict:
+        return {
+            "device_id": self.device_id,
+            "description": "Simulated MaskCam",
         }
-        hello_result = client.publish(topic, json.dumps(hello_msg))
 
-        if hello_result[0] == 0:
-            print(f"Send `{hello_msg}` to topic `{topic}`")
-        else:
-            print(f"Failed to send message to topic {topic}")
-
-        # Test alert
-        time.sleep(1)
-        topics = ["alerts", "receive-from-jetson"]
-        now = datetime.now(timezone.utc)
-        for _ in range(0, 600):
-            topic = random.choice(topics)
-            if topic == "alerts":
-                people_with_mask = random.randint(2000, 3000)
-                people_without_mask = random.randint(0, 1000)
-            else:
-                people_with_mask = random.randint(0, 1000)
-                people_without_mask = random.randint(500, 1000)
-
-            alert_msg = {
-                "device_id": device_id,
-                "timestamp": datetime.timestamp(now),
-                "people_with_mask": people_with_mask,
-                "people_without_mask": people_without_mask,
-                "people_total": people_with_mask + people_without_mask,
-            }
-
-            result = client.publish(topic, json.dumps(alert_msg))
-
-            if result[0] == 0:
-                print(f"Send `{alert_msg}` to topic `{topic}`")
-            else:
-                print(f"Failed to send message to topic {topic}")
-
-            now += timedelta(minutes=1)
-
-
-def connect_mqtt_broker(client_id: str):
-    def on_connect(client, userdata, flags, code):
-        if code == 0:
-            print("Connected to MQTT Broker")
+    def statistic(self, alert: bool) -> Dict:
+        people_with_mask = random.randint(0, 10)
+        people_without_mask = random.randint(
+            2 if alert else 0, 10 if alert else 2
+        )
+        return {
+            "device_id": self.device_id,
+            "timestamp": datetime.timestamp(datetime.now(timezone.utc)),
+            "people_with_mask": people_with_mask,
+            "people_without_mask": people_without_mask,
+            "people_total": people_with_mask
+            + people_without_mask
+            + random.randint(0, 3),
+        }
+
+    def files(self, churn: int) -> Dict:
+        # Record new videos and remove the oldest ones
+        for _ in range(churn):
+            self.file_list.append(self.file_name(self.file_counter))
+            self.file_counter += 1
+        del self.file_list[:churn]
+        return {
+            "device_id": self.device_id,
+            "file_server": f"http://{self.device_id}:8080",
+            "file_list": list(self.file_list),
+        }
+
+
+class IngestionProbe:
+    """
+    Polls the database for the statistics of the simulated devices, to measure
+    the latency from device timestamp to committed row, and the ingest rate.
+    """
+
+    def __init__(
+        self, device_prefix: str, poll_interval: float, window: float
+    ):
+        self.device_prefix = device_prefix
+        self.poll_interval = poll_interval
+        self.window = window
+        self.rows = 0
+        self.latencies = []
+        self._seen = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def poll(self):
+        now = time.time()
+        since = datetime.fromtimestamp(now - self.window, timezone.utc)
+        database_session = get_db_session()
+        try:
+            rows = database_session.execute(
+                text(
+                    "SELECT device_id, datetime FROM statistic "
+                    "WHERE device_id LIKE :prefix AND datetime > :since"
+                ),
+                {"prefix": f"{self.device_prefix}%", "since": since},
+            ).fetchall()
+        finally:
+            database_session.close()
+
+        for device_id, row_datetime in rows:
+            key = (device_id, row_datetime)
+            if key in self._seen:
+                continue
+            if row_datetime.tzinfo is None:
+                row_datetime = row_datetime.replace(tzinfo=timezone.utc)
+            timestamp = row_datetime.timestamp()
+            self._seen[key] = timestamp
+            self.latencies.append(now - timestamp)
+            self.rows += 1
+
+        # Rows older than the window won't be returned again
+        oldest = now - self.window
+        self._seen = {
+            key: timestamp
+            for key, timestamp in self._seen.items()
+            if timestamp > oldest
+        }
+
+    def count_rows(self) -> int:
+        database_session = get_db_session()
+        try:
+            return database_session.execute(
+                text(
+                    "SELECT count(*) FROM statistic WHERE device_id LIKE :prefix"
+                ),
+                {"prefix": f"{self.device_prefix}%"},
+            ).scalar()
+        finally:
+            database_session.close()
+
+    def _run(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Exception polling the database: {e}")
+
+
+class FleetSimulator:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.device_prefix = f"fleet-{args.run_id}-"
+        self.devices = [
+            SimulatedDevice(
+                f"{self.device_prefix}{number:05}", args.files, args.period
+            )
+            for number in range(args.devices)
+        ]
+        self.published = {"hello": 0, "statistics": 0, "files": 0}
+        self.publish_failed = 0
+        self.clients = []
+
+    def connect(self):
+        for number in range(min(self.args.connections, len(self.devices))):
+            client = mqtt_client.Client(f"{self.device_prefix}{number}")
+            client.connect(self.args.broker, self.args.port)
+            client.loop_start()
+            self.clients.append(client)
+
+    def disconnect(self):
+        for client in self.clients:
+            client.disconnect()
+            client.loop_stop()
+
+    def client_for(self, device_number: int) -> mqtt_client.Client:
+        return self.clients[device_number % len(self.clients)]
+
+    def publish(
+        self, device_number: int, topic: str, message: Dict, counter: str
+    ):
+        result = self.client_for(device_number).publish(
+            topic, json.dumps(message), qos=self.args.qos
+        )
+        if result[0] == 0:
+            self.published[counter] += 1
         else:
-            print(f"Failed to connect, return code {code}\n")
+            self.publish_failed += 1
+
+    def announce(self):
+        # Same messages a device sends right after connecting
+        for number, device in enumerate(self.devices):
+            self.publish(number, MQTT_HELLO_TOPIC, device.hello(), "hello")
+            self.publish(number, MQTT_FILES_TOPIC, device.files(0), "files")
+
+    def reconnect_storm(self):
+        print(f"Reconnect storm: {len(self.clients)} connections")
+        for client in self.clients:
+            client.reconnect()
+        self.announce()
+
+    def tick(self, now: float):
+        for number, device in enumerate(self.devices):
+            if now >= device.next_statistic:
+                device.next_statistic += self.args.period
+                alert = random.random() < self.args.alert_ratio
+                topic = MQTT_ALERT_TOPIC if alert else MQTT_REPORT_TOPIC
+                self.publish(
+                    number, topic, device.statistic(alert), "statistics"
+                )
+
+            if self.args.file_period and now >= device.next_files:
+                device.next_files += self.args.file_period
+                self.publish(
+                    number,
+                    MQTT_FILES_TOPIC,
+                    device.files(self.args.file_churn),
+                    "files",
+                )
+
+    def run(self, probe: IngestionProbe = None):
+        start = time.time()
+        next_storm = (
+            start + self.args.storm_interval
+            if self.args.storm_interval
+            else None
+        )
+        next_report = start + self.args.report_interval
+        last_rows = 0
+
+        while time.time() - start < self.args.duration:
+            now = time.time()
+            self.tick(now)
+
+            if next_storm and now >= next_storm:
+                next_storm += self.args.storm_interval
+                self.reconnect_storm()
+
+            if now >= next_report:
+                next_report += self.args.report_interval
+                rows = probe.rows if probe else 0
+                print(
+                    f"[{now - start:6.0f}s] published={self.published} "
+                    f"failed={self.publish_failed} | "
+                    f"ingest {(rows - last_rows) / self.args.report_interval:.1f} rows/s"
+                )
+                last_rows = rows
+
+            time.sleep(0.05)
 
-    client = mqtt_client.Client(client_id)
-    client.on_connect = on_connect
-    # client.connect("3.17.17.197", 1883)
-    client.connect("0.0.0.0", 1883)
-    return client
+        return time.time() - start
+
+
+def print_report(
+    simulator: FleetSimulator, probe: IngestionProbe, elapsed: float
+):
+    published = simulator.published["statistics"]
+    print("\nFleet simulation report")
+    print(f"  devices:              {len(simulator.devices)}")
+    print(f"  duration:             {elapsed:.0f}s")
+    print(f"  published:            {simulator.published}")
+    print(f"  publish failures:     {simulator.publish_failed}")
+    print(f"  offered load:         {published / elapsed:.1f} statistics/s")
+    if probe is None:
+        return
+
+    committed = probe.count_rows()
+    latencies = probe.latencies
+    print(f"  committed rows:       {committed}")
+    print(f"  dropped statistics:   {max(published - committed, 0)}")
+    print(f"  ingest rate:          {committed / elapsed:.1f} rows/s")
+    print(
+        "  device->commit:       "
+        f"p50={percentile(latencies, 0.5):.2f}s "
+        f"p95={percentile(latencies, 0.95):.2f}s "
+        f"p99={percentile(latencies, 0.99):.2f}s "
+        f"max={max(latencies, default=0):.2f}s"
+    )
+
+
+def cleanup(device_prefix: str):
+    database_session = get_db_session()
+    try:
+        for table in ["statistic", "video_file"]:
+            database_session.execute(
+                text(f"DELETE FROM {table} WHERE device_id LIKE :prefix"),
+                {"prefix": f"{device_prefix}%"},
+            )
+        database_session.execute(
+            text("DELETE FROM device WHERE id LIKE :prefix"),
+            {"prefix": f"{device_prefix}%"},
+        )
+        database_session.commit()
+    finally:
+        database_session.close()
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0]
+    )
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument(
+        "--period", type=float, default=15, help="Seconds between statistics"
+    )
+    parser.add_argument("--duration", type=float, default=120, help="Seconds")
+    parser.add_argument(
+        "--alert-ratio", type=float, default=0.1, help="Fraction of alerts"
+    )
+    parser.add_argument(
+        "--files", type=int, default=20, help="Files per device"
+    )
+    parser.add_argument(
+        "--file-period",
+        type=float,
+        default=30,
+        help="Seconds between file lists, 0 to send them only when connecting",
+    )
+    parser.add_argument(
+        "--file-churn", type=int, default=1, help="New files per file list"
+    )
+    parser.add_argument(
+        "--storm-interval",
+        type=float,
+        default=0,
+        help="Seconds between reconnect storms, 0 to disable",
+    )
+    parser.add_argument(
+        "--connections",
+        type=int,
+        default=20,
+        help="MQTT connections shared by the simulated devices",
+    )
+    parser.add_argument("--qos", type=int, default=0, choices=[0, 1, 2])
+    parser.add_argument("--broker", default=MQTT_BROKER)
+    parser.add_argument("--port", type=int, default=MQTT_BROKER_PORT)
+    parser.add_argument("--run-id", default=uuid.uuid4().hex[:6])
+    parser.add_argument("--report-interval", type=float, default=10)
+    parser.add_argument(
+        "--drain",
+        type=float,
+        default=10,
+        help="Seconds to wait for the subscriber after publishing",
+    )
+    parser.add_argument(
+        "--no-db",
+        action="store_true",
+        help="Only publish, without measuring the ingestion in the database",
+    )
+    parser.add_argument(
+        "--keep-data",
+        action="store_true",
+        help="Don't delete the simulated devices after the run",
+    )
+    return parser.parse_args()
 
 
 def run():
-    client = connect_mqtt_broker(client_id=f"publisher-{random.randint(0, 10)}")
-    client.loop_start()
-    publish(client)
+    args = parse_arguments()
+    simulator = FleetSimulator(args)
+    probe = None
+    if not args.no_db:
+        probe = IngestionProbe(
+            simulator.device_prefix,
+            poll_interval=0.2,
+            window=max(60, 4 * args.period),
+        )
+
+    print(f"Simulating {args.devices} devices ({simulator.device_prefix}*)")
+    simulator.connect()
+    simulator.announce()
+    if probe:
+        probe.start()
+
+    try:
+        elapsed = simulator.run(probe)
+        time.sleep(args.drain)
+    finally:
+        simulator.disconnect()
+        if probe:
+            probe.stop()
+
+    print_report(simulator, probe, elapsed)
+
+    if probe and not args.keep_data:
+        cleanup(simulator.device_prefix)
 
 
 if __name__ == "__main__":
@@ -20,18 +20,38 @@
 # DEALINGS IN THE SOFTWARE.
 ################################################################################
 
+
+import argparse
 import json
+import signal
+import zlib
+from typing import Dict, List, Tuple
 
 from app.core.config import SUBSCRIBER_CLIENT_ID, MQTT_HELLO_TOPIC,\
                             MQTT_ALERT_TOPIC, MQTT_SEND_TOPIC,\
-                            MQTT_REPORT_TOPIC, MQTT_FILES_TOPIC
-from app.db.cruds import create_device, create_statistic, update_files, update_device
-from app.db.schema import get_db_session
+                            MQTT_REPORT_TOPIC, MQTT_FILES_TOPIC,\
+                            MQTT_STATUS_TOPIC, SUBSCRIBER_SHARE_GROUP
+from app.db.cruds import (
+    notify_device_status,
+    update_files,
+    update_device,
+    update_latest_event,
+    upsert_devices,
+    upsert_statistics,
+)
 from app.db.utils import convert_timestamp_to_datetime, get_enum_type
 from broker import connect_mqtt_broker
+from ingestion import (
+    EVENT_MESSAGE,
+    SKIPPED_MESSAGE,
+    STATISTIC_MESSAGE,
+    DeviceRegistry,
+    IngestionPipeline,
+    StatisticBuffer,
+)
 
 from paho.mqtt import client as mqtt_client
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import NoResultFound
 
 MQTT_CLIENT_TOPICS = [  # topic, QoS
     (MQTT_HELLO_TOPIC, 2),
@@ -39,94 +59,244 @@ MQTT_CLIENT_TOPICS = [  # topic, QoS
     (MQTT_ALERT_TOPIC, 2),
     (MQTT_REPORT_TOPIC, 2),
     (MQTT_SEND_TOPIC, 2),
+    (MQTT_STATUS_TOPIC, 0),  # Only the latest status is interesting
 ]
 
-def subscribe(client: mqtt_client):
+# Order doesn't matter for statistics (they're upserted by device and datetime),
+# so several subscriber processes can share them
+MQTT_SHARED_TOPICS = [MQTT_ALERT_TOPIC, MQTT_REPORT_TOPIC]
+
+STATISTIC_COUNT_FIELDS = ["people_with_mask", "people_without_mask", "people_total"]
+
+# Devices known to exist, shared by the statistics writers and the event handler
+device_registry = DeviceRegistry()
+
+
+def get_client_topics(workers: int = 1) -> List[Tuple[str, int]]:
+    """
+    Topics to subscribe to.
+
+    Arguments:
+        workers {int} -- Number of subscriber processes.
+
+    Returns:
+        List[Tuple[str, int]] -- Topics and QoS. With several workers, statistics
+        use a shared subscription so that each message goes to only one worker.
+    """
+    if workers <= 1:
+        return MQTT_CLIENT_TOPICS
+
+    return [
+        (f"$share/{SUBSCRIBER_SHARE_GROUP}/{topic}", qos)
+        if topic in MQTT_SHARED_TOPICS
+        else (topic, qos)
+        for topic, qos in MQTT_CLIENT_TOPICS
+    ]
+
+
+def get_device_partition(device_id: str, workers: int) -> int:
+    """
+    Worker that handles the messages of a device, other than statistics.
+    Must be stable across processes, so the builtin hash() can't be used.
+
+    Arguments:
+        device_id {str} -- Device id.
+        workers {int} -- Number of subscriber processes.
+
+    Returns:
+        int -- Worker index.
+    """
+    return zlib.crc32(device_id.encode()) % workers
+
+
+def subscribe(client: mqtt_client, pipeline: IngestionPipeline, workers: int = 1):
     """
     Subscribe client to topic.
 
     Arguments:
         client {mqtt_client} -- Client process id.
+        pipeline {IngestionPipeline} -- Pipeline that processes the received messages.
+        workers {int} -- Number of subscriber processes.
     """
 
     def on_message(client, userdata, msg):
-        database_session = get_db_session()
-        try:
-            process_message(database_session, msg)
-        finally:
-            database_session.close()
+        # Only enqueue, all processing happens in the pipeline threads
+        pipeline.submit(msg.topic, msg.payload)
 
-    client.subscribe(MQTT_CLIENT_TOPICS)
+    client.subscribe(get_client_topics(workers))
     client.on_message = on_message
 
 
-def process_message(database_session, msg):
+def decode_message(topic: str, payload: bytes) -> Tuple[str, Dict]:
     """
-    Process message sent to topic.
+    Decode and validate a message sent to topic.
 
     Arguments:
-        database_session {Session} -- Database session.
-        msg {str} -- Received message.
+        topic {str} -- Topic where the message was received.
+        payload {bytes} -- Raw message.
+
+    Returns:
+        Tuple[str, Dict] -- STATISTIC_MESSAGE and the statistic information, or
+        EVENT_MESSAGE and the decoded message for any other topic.
+    """
+    message = json.loads(payload.decode())
+    if not isinstance(message, dict) or not isinstance(message.get("device_id"), str):
+        raise ValueError("Message must be an object with a device_id")
+
+    # Same normalization applied when devices are registered
+    message["device_id"] = message["device_id"].replace(" ", "_")
+
+    if topic in [MQTT_ALERT_TOPIC, MQTT_REPORT_TOPIC]:
+        for field in STATISTIC_COUNT_FIELDS:
+            if not isinstance(message[field], int) or message[field] < 0:
+                raise ValueError(f"Invalid {field}: {message[field]}")
+
+        statistic_information = {
+            "device_id": message["device_id"],
+            "datetime": convert_timestamp_to_datetime(float(message["timestamp"])),
+            "statistic_type": get_enum_type(topic),
+            "people_with_mask": message["people_with_mask"],
+            "people_without_mask": message["people_without_mask"],
+            "people_total": message["people_total"],
+        }
+        return STATISTIC_MESSAGE, statistic_information
+
+    if topic == MQTT_FILES_TOPIC and not isinstance(message["file_list"], list):
+        raise ValueError("file_list must be a list")
+
+    return EVENT_MESSAGE, message
+
+
+def persist_event(database_session, topic: str, message: Dict):
     """
-    message = json.loads(msg.payload.decode())
+    Process a decoded message which is not a statistic.
 
-    topic = msg.topic
-    if topic == "hello":
+    Arguments:
+        database_session {Session} -- Database session.
+        topic {str} -- Topic where the message was received.
+        message {Dict} -- Decoded message.
+    """
+    if topic == MQTT_HELLO_TOPIC:
         # Register new Jetson device
         device_id = message["device_id"]
-
-        try:
-            device_information = {
-                "id": device_id,
-                "description": message["description"],
-            }
-            device = create_device(
-                db_session=database_session,
-                device_information=device_information,
-            )
+        device_information = {
+            "id": device_id,
+            "description": message["description"],
+        }
+        # Devices auto-registered by their statistics get the description now
+        if upsert_devices(
+            db_session=database_session,
+            devices_information=[device_information],
+            fill_empty_fields=["description"],
+        ):
             print("Added device")
-        except IntegrityError:
+        else:
             print(f"A device with id={device_id} already exists")
+        device_registry.add(device_id)
+        update_latest_event(db_session=database_session, device_id=device_id, event="hello")
 
-    elif topic in ["alerts", "receive-from-jetson"]:
-        try:
-            # Receive alert or report and save it to the database
-            statistic_information = {
-                "device_id": message["device_id"],
-                "datetime": convert_timestamp_to_datetime(message["timestamp"]),
-                "statistic_type": get_enum_type(topic),
-                "people_with_mask": message["people_with_mask"],
-                "people_without_mask": message["people_without_mask"],
-                "people_total": message["people_total"],
-            }
-
-            statistic = create_statistic(
-                db_session=database_session,
-                statistic_information=statistic_information,
-            )
-
-            print(f"Added statistic")
-        except IntegrityError:
-            print(f"Error, the statistic already exist")
-    
-    elif topic == "video-files":
+    elif topic == MQTT_FILES_TOPIC:
         try:
             print(f"Adding files for device_id: {message['device_id']}")
+            device_registry.register(database_session, [message["device_id"]])
             new_information = {"file_server_address": message["file_server"]}
-            update_device(db_session=database_session, device_id=message["device_id"], new_device_information=new_information)
-            update_files(db_session=database_session, device_id=message["device_id"], file_list=message["file_list"])
+            try:
+                update_device(db_session=database_session, device_id=message["device_id"], new_device_information=new_information)
+            except NoResultFound:
+                # Deleted after being cached, register it again
+                database_session.rollback()
+                device_registry.invalidate([message["device_id"]])
+                device_registry.register(database_session, [message["device_id"]])
+                update_device(db_session=database_session, device_id=message["device_id"], new_device_information=new_information)
+            added, removed = update_files(db_session=database_session, device_id=message["device_id"], file_list=message["file_list"])
+            update_latest_event(db_session=database_session, device_id=message["device_id"], event="files")
+            print(f"Files updated for device_id: {message['device_id']} (+{added} -{removed})")
         except Exception as e:
             print(f"Exception trying to update files: {e}")
 
-    elif topic == "send-to-jetson":
+    elif topic == MQTT_STATUS_TOPIC:
+        # Pushed to the dashboards by the API workers, not stored
+        try:
+            notify_device_status(db_session=database_session, device_status=message)
+        except Exception as e:
+            print(f"Exception trying to notify device status: {e}")
+
+    elif topic == MQTT_SEND_TOPIC:
         # Just monitoring this channel, useful for debugging
         print(f"Detected info sent to device_id: {message['device_id']}")
 
 
-def main():
-    client = connect_mqtt_broker(client_id=SUBSCRIBER_CLIENT_ID, cb_connect=subscribe)
-    client.loop_forever()
+def process_message(database_session, msg):
+    """
+    Process message sent to topic synchronously, without the ingestion pipeline.
+
+    Arguments:
+        database_session {Session} -- Database session.
+        msg {str} -- Received message.
+    """
+    kind, information = decode_message(msg.topic, msg.payload)
+
+    if kind == STATISTIC_MESSAGE:
+        # Receive alert or report and save it to the database
+        device_registry.register(database_session, [information["device_id"]])
+        if upsert_statistics(
+            db_session=database_session,
+            statistics_information=[information],
+        ):
+            print(f"Added statistic")
+        else:
+            print(f"Error, the statistic already exist")
+    else:
+        persist_event(database_session, msg.topic, information)
+
+
+def main(worker_index: int = 0, workers: int = 1):
+    """
+    Run a subscriber process.
+
+    Arguments:
+        worker_index {int} -- Index of this process, from 0 to workers - 1.
+        workers {int} -- Number of subscriber processes.
+    """
+
+    def decode_worker_message(topic: str, payload: bytes) -> Tuple[str, Dict]:
+        kind, information = decode_message(topic, payload)
+        # Each device's events go to one single worker, which keeps their order
+        if kind == EVENT_MESSAGE and (
+            get_device_partition(information["device_id"], workers) != worker_index
+        ):
+            return SKIPPED_MESSAGE, information
+        return kind, information
+
+    pipeline = IngestionPipeline(
+        decode_message=decode_worker_message if workers > 1 else decode_message,
+        persist_event=persist_event,
+        statistic_buffer=StatisticBuffer(device_registry=device_registry),
+    )
+    pipeline.start()
+
+    client_id = SUBSCRIBER_CLIENT_ID
+    if workers > 1:
+        client_id = f"{SUBSCRIBER_CLIENT_ID}-{worker_index}"
+        print(f"Subscriber worker {worker_index + 1}/{workers}")
+
+    client = connect_mqtt_broker(
+        client_id=client_id,
+        cb_connect=lambda client: subscribe(client, pipeline, workers),
+        # Keep this worker's messages queued in the broker while it restarts
+        clean_session=workers <= 1,
+    )
+    # Stop gracefully (flushing pending statistics) when the supervisor terminates us
+    signal.signal(signal.SIGTERM, lambda signum, frame: client.disconnect())
+    try:
+        client.loop_forever()
+    finally:
+        pipeline.stop()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="MQTT subscriber process")
+    parser.add_argument("--worker-index", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    main(worker_index=args.worker_index, workers=args.workers)
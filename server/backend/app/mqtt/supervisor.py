@@ -0,0 +1,136 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+"""
+Start SUBSCRIBER_WORKERS subscriber processes and restart them if they exit.
+
+Usage:
+    python app/mqtt/supervisor.py [--workers N]
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from app.core.config import SUBSCRIBER_WORKERS
+
+SUBSCRIBER_SCRIPT = os.path.join(os.path.dirname(__file__), "subscriber.py")
+
+# Seconds to wait before restarting a worker, doubled on each consecutive failure
+RESTART_DELAY = 1
+MAX_RESTART_DELAY = 60
+# A worker running longer than this is considered healthy again
+HEALTHY_RUNTIME = 60
+
+
+class Worker:
+    def __init__(self, index: int, workers: int):
+        self.index = index
+        self.workers = workers
+        self.process = None
+        self.started = 0.0
+        self.restart_delay = RESTART_DELAY
+        self.restart_at = 0.0
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                SUBSCRIBER_SCRIPT,
+                "--worker-index",
+                str(self.index),
+                "--workers",
+                str(self.workers),
+            ],
+            # Selects the subscriber's database pool settings
+            env=dict(os.environ, DB_PROCESS_TYPE="subscriber"),
+        )
+        self.started = time.time()
+        print(f"Started subscriber worker {self.index} (PID: {self.process.pid})")
+
+    def check(self):
+        """
+        Restart the worker if its process exited.
+        """
+        now = time.time()
+        if self.process is None:
+            if now >= self.restart_at:
+                self.start()
+            return
+
+        code = self.process.poll()
+        if code is None:
+            return
+
+        if now - self.started > HEALTHY_RUNTIME:
+            self.restart_delay = RESTART_DELAY
+        print(
+            f"Subscriber worker {self.index} exited with code {code}, "
+            f"restarting in {self.restart_delay}s"
+        )
+        self.process = None
+        self.restart_at = now + self.restart_delay
+        self.restart_delay = min(self.restart_delay * 2, MAX_RESTART_DELAY)
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+    def wait(self, timeout: float):
+        if self.process is not None:
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def main(workers: int = SUBSCRIBER_WORKERS):
+    stopping = []
+
+    def on_signal(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    subscriber_workers = [Worker(index, workers) for index in range(workers)]
+    while not stopping:
+        for worker in subscriber_workers:
+            worker.check()
+        time.sleep(1)
+
+    print("Stopping subscriber workers")
+    for worker in subscriber_workers:
+        worker.stop()
+    for worker in subscriber_workers:
+        # Let the workers flush their pending statistics
+        worker.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MQTT subscriber supervisor")
+    parser.add_argument("--workers", type=int, default=SUBSCRIBER_WORKERS)
+    args = parser.parse_args()
+    main(workers=args.workers)
@@ -0,0 +1,194 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+"""
+Compare the async statistics endpoint with the previous sync implementation
+(sync session, one threadpool worker per in-flight request) under 50 to 500
+concurrent dashboard clients.
+
+Both apps run in-process behind an ASGI transport, so the numbers measure
+how requests wait for the database rather than network throughput.
+
+Usage (from the backend folder, with the database environment set):
+    python -m benchmarks.api_concurrency [seconds per level] [rows per request]
+"""
+
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import httpx
+
+from app.db.cruds import (
+    delete_device,
+    get_statistics_from_to,
+    upsert_devices,
+    upsert_statistics,
+)
+from app.db.schema import StatisticSchema, async_database, session_scope
+from app.db.utils import StatisticTypeEnum
+from app.main import app
+
+from fastapi import FastAPI, Query
+
+BENCHMARK_DEVICE_ID = "benchmark-api"
+CONCURRENCY_LEVELS = [50, 100, 200, 500]
+FIRST_DATETIME = datetime(2021, 1, 1)
+STATISTIC_PERIOD = timedelta(seconds=10)
+
+sync_app = FastAPI()
+
+
+@sync_app.get(
+    "/devices/{device_id}/statistics", response_model=List[StatisticSchema]
+)
+def get_all_device_statistics_items(
+    device_id: str,
+    datefrom: Optional[str] = Query(None),
+    dateto: Optional[str] = Query(None),
+):
+    """
+    Previous implementation of the endpoint, kept as a baseline. The session
+    is closed in the route: with a generator dependency, closing it needs a
+    threadpool worker too, and the benchmark deadlocks once all workers wait
+    for a pool connection.
+    """
+    with session_scope() as db:
+        return [
+            StatisticSchema.from_orm(statistic)
+            for statistic in get_statistics_from_to(
+                db_session=db,
+                device_id=device_id,
+                from_date=datefrom,
+                to_date=dateto,
+            )
+        ]
+
+
+def seed(rows: int):
+    with session_scope() as database_session:
+        upsert_devices(
+            db_session=database_session,
+            devices_information=[{"id": BENCHMARK_DEVICE_ID}],
+        )
+        upsert_statistics(
+            db_session=database_session,
+            statistics_information=[
+                {
+                    "device_id": BENCHMARK_DEVICE_ID,
+                    "datetime": FIRST_DATETIME + number * STATISTIC_PERIOD,
+                    "statistic_type": StatisticTypeEnum.REPORT,
+                    "people_with_mask": 3,
+                    "people_without_mask": 1,
+                    "people_total": 5,
+                }
+                for number in range(rows)
+            ],
+        )
+
+
+async def run_level(
+    benchmark_app, url: str, concurrency: int, duration: float
+) -> dict:
+    """
+    Returns:
+        dict -- Requests per second, latency percentiles and errors.
+    """
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=None)
+    transport = httpx.ASGITransport(app=benchmark_app)
+    deadline = time.perf_counter() + duration
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://benchmark", limits=limits
+    ) as client:
+
+        async def dashboard_client():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except Exception:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[dashboard_client() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0,
+        "p95_ms": (
+            latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+        ),
+        "errors": errors,
+    }
+
+
+async def benchmark(duration: float, rows: int):
+    last_datetime = FIRST_DATETIME + (rows - 1) * STATISTIC_PERIOD
+    url = (
+        f"/devices/{BENCHMARK_DEVICE_ID}/statistics"
+        f"?datefrom={FIRST_DATETIME.isoformat()}"
+        f"&dateto={last_datetime.isoformat()}"
+    )
+
+    await async_database.connect()
+    try:
+        print(f"{rows} statistics per request, {duration:.0f}s per level")
+        print(
+            f"{'clients':>8} {'sync req/s':>11} {'sync p95 ms':>12} "
+            f"{'async req/s':>12} {'async p95 ms':>13} {'errors':>7}"
+        )
+        for concurrency in CONCURRENCY_LEVELS:
+            sync = await run_level(sync_app, url, concurrency, duration)
+            async_ = await run_level(app, url, concurrency, duration)
+            print(
+                f"{concurrency:>8} {sync['requests_per_second']:>11.1f} "
+                f"{sync['p95_ms']:>12.1f} "
+                f"{async_['requests_per_second']:>12.1f} "
+                f"{async_['p95_ms']:>13.1f} "
+                f"{sync['errors'] + async_['errors']:>7}"
+            )
+    finally:
+        await async_database.disconnect()
+
+
+def main(duration: float = 10, rows: int = 360):
+    seed(rows)
+    try:
+        asyncio.run(benchmark(duration, rows))
+    finally:
+        with session_scope() as database_session:
+            delete_device(
+                db_session=database_session, device_id=BENCHMARK_DEVICE_ID
+            )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,597 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+"""
+Latency and throughput of every route of device_routes.py and
+statistic_routes.py, and of the subscriber's process_message, against a
+seeded fleet of devices. Results are saved as JSON, to compare them across
+commits with --compare.
+
+The app runs in-process behind an ASGI transport, so the numbers measure
+the API and the database rather than the network. The response cache is
+off, since the database listener is not started: every request reaches
+the database.
+
+Usage (from the backend folder, with the database environment set):
+    python -m benchmarks.api_routes [--devices 20] [--days 7] [--period 60]
+        [--requests 100] [--concurrency 10] [--compare results/<file>.json]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from app.db.cruds import (
+    delete_device,
+    update_files,
+    upsert_devices,
+    upsert_statistics,
+)
+from app.db.schema import async_database, session_scope
+from app.db.utils import StatisticTypeEnum
+from app.main import app
+
+# The subscriber is a script run from its folder, see app/mqtt/supervisor.py
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "app", "mqtt"))
+
+from paho.mqtt import client as mqtt_client  # noqa: E402
+from subscriber import process_message  # noqa: E402
+
+BENCHMARK_DEVICE_PREFIX = "benchmark-fleet-"
+FIRST_DATETIME = datetime(2021, 1, 1, tzinfo=timezone.utc)
+ALERT_EVERY = 20  # One alert every this many statistics
+FILES_PER_DEVICE = 20
+BULK_SIZE = 1000  # Statistics per request of the bulk endpoints
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Requests of the routes that read a whole device or the whole fleet
+FULL_READ_REQUESTS = 5
+
+
+class Fleet:
+    """
+    Devices and statistics seeded for the benchmark. Statistics sent by the
+    write routes start after the seeded ones, so they never conflict.
+    """
+
+    def __init__(self, devices: int, days: int, period: int):
+        self.device_ids = [
+            f"{BENCHMARK_DEVICE_PREFIX}{number:04d}"
+            for number in range(devices)
+        ]
+        self.period = timedelta(seconds=period)
+        self.statistics_per_device = days * 24 * 3600 // period
+        self.last_datetime = (
+            FIRST_DATETIME + (self.statistics_per_device - 1) * self.period
+        )
+
+    def device_id(self, number: int) -> str:
+        return self.device_ids[number % len(self.device_ids)]
+
+    def seeded_datetime(self, number: int) -> datetime:
+        return (
+            FIRST_DATETIME
+            + (number % self.statistics_per_device) * self.period
+        )
+
+    def new_datetime(self, number: int) -> datetime:
+        return self.last_datetime + (number + 1) * self.period
+
+    def statistic(self, device_id: str, statistic_datetime: datetime) -> Dict:
+        number = int((statistic_datetime - FIRST_DATETIME) / self.period)
+        people_with_mask = number % 7
+        people_without_mask = number % 3
+        return {
+            "device_id": device_id,
+            "datetime": statistic_datetime,
+            "statistic_type": (
+                StatisticTypeEnum.ALERT
+                if number % ALERT_EVERY == 0
+                else StatisticTypeEnum.REPORT
+            ),
+            "people_with_mask": people_with_mask,
+            "people_without_mask": people_without_mask,
+            "people_total": people_with_mask + people_without_mask + 1,
+        }
+
+    def seed(self) -> Dict:
+        """
+        Returns:
+            Dict -- Statistics seeded and seconds it took.
+        """
+        start = time.perf_counter()
+        with session_scope() as database_session:
+            upsert_devices(
+                db_session=database_session,
+                devices_information=[
+                    {"id": device_id, "description": "benchmark"}
+                    for device_id in self.device_ids
+                ],
+            )
+            for device_id in self.device_ids:
+                upsert_statistics(
+                    db_session=database_session,
+                    statistics_information=[
+                        self.statistic(device_id, self.seeded_datetime(number))
+                        for number in range(self.statistics_per_device)
+                    ],
+                )
+                update_files(
+                    db_session=database_session,
+                    device_id=device_id,
+                    file_list=[
+                        f"video_{number}.mp4"
+                        for number in range(FILES_PER_DEVICE)
+                    ],
+                )
+
+        return {
+            "statistics": self.statistics_per_device * len(self.device_ids),
+            "seconds": time.perf_counter() - start,
+        }
+
+    def clean(self, created_devices: int):
+        with session_scope() as database_session:
+            for device_id in self.device_ids + [
+                f"{BENCHMARK_DEVICE_PREFIX}new-{number}"
+                for number in range(created_devices)
+            ]:
+                try:
+                    delete_device(
+                        db_session=database_session, device_id=device_id
+                    )
+                except Exception:
+                    database_session.rollback()
+
+
+def summarize(latencies: List[float], elapsed: float, **extra) -> Dict:
+    latencies = sorted(latencies)
+
+    def percentile_ms(fraction: float) -> float:
+        if not latencies:
+            return 0.0
+        index = min(len(latencies) - 1, int(fraction * len(latencies)))
+        return latencies[index] * 1000
+
+    return {
+        "count": len(latencies),
+        "per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0,
+        "p50_ms": percentile_ms(0.5),
+        "p95_ms": percentile_ms(0.95),
+        "p99_ms": percentile_ms(0.99),
+        **extra,
+    }
+
+
+def get_route_cases(fleet: Fleet, requests: int) -> List[Dict]:
+    """
+    One case per route (and response format), in the order they run: the
+    write routes modify what the previous case created.
+
+    Returns:
+        List[Dict] -- Name, number of requests and a function that builds
+        the arguments of the request number i.
+    """
+    day = timedelta(days=1)
+
+    def timestamp(value: datetime) -> float:
+        return value.timestamp()
+
+    def new_statistic(i: int) -> Dict:
+        return {
+            "datetime": timestamp(fleet.new_datetime(i)),
+            "statistic_type": "reports",
+            "people_with_mask": 1,
+            "people_without_mask": 1,
+            "people_total": 2,
+        }
+
+    def bulk_statistics(i: int, device_id: Optional[str]) -> List[Dict]:
+        first = requests + i * BULK_SIZE
+        return [
+            {
+                "device_id": device_id or fleet.device_id(number),
+                "datetime": timestamp(fleet.new_datetime(first + number)),
+                "statistic_type": "REPORT",
+                "people_with_mask": 1,
+                "people_without_mask": 1,
+                "people_total": 2,
+            }
+            for number in range(BULK_SIZE)
+        ]
+
+    def case(name: str, build: Callable[[int], Dict], count: int = requests):
+        return {"name": name, "requests": count, "build": build}
+
+    new_device = f"{BENCHMARK_DEVICE_PREFIX}new-{{}}"
+    return [
+        # device_routes.py
+        case(
+            "POST /devices",
+            lambda i: {
+                "method": "POST",
+                "url": "/devices",
+                "json": {"id": new_device.format(i)},
+            },
+        ),
+        case(
+            "PUT /devices/{device_id}",
+            lambda i: {
+                "method": "PUT",
+                "url": f"/devices/{new_device.format(i)}",
+                "json": {"description": "updated"},
+            },
+        ),
+        case(
+            "DELETE /devices/{device_id}",
+            lambda i: {
+                "method": "DELETE",
+                "url": f"/devices/{new_device.format(i)}",
+            },
+        ),
+        case(
+            "GET /devices/latest",
+            lambda i: {"method": "GET", "url": "/devices/latest"},
+        ),
+        case("GET /devices", lambda i: {"method": "GET", "url": "/devices"}),
+        case(
+            "GET /devices/{device_id}",
+            lambda i: {
+                "method": "GET",
+                "url": f"/devices/{fleet.device_id(i)}",
+            },
+        ),
+        case(
+            "GET /files/{device_id}",
+            lambda i: {"method": "GET", "url": f"/files/{fleet.device_id(i)}"},
+        ),
+        # statistic_routes.py
+        case(
+            "GET /devices/{device_id}/statistics",
+            lambda i: {
+                "method": "GET",
+                "url": f"/devices/{fleet.device_id(i)}/statistics",
+                "params": {
+                    "datefrom": FIRST_DATETIME.isoformat(),
+                    "dateto": (FIRST_DATETIME + day).isoformat(),
+                },
+            },
+        ),
+        case(
+            "GET /devices/{device_id}/statistics?format=ndjson",
+            lambda i: {
+                "method": "GET",
+                "url": f"/devices/{fleet.device_id(i)}/statistics",
+                "params": {
+                    "datefrom": FIRST_DATETIME.isoformat(),
+                    "dateto": fleet.last_datetime.isoformat(),
+                    "format": "ndjson",
+                },
+            },
+            FULL_READ_REQUESTS,
+        ),
+        case(
+            "GET /statistics",
+            lambda i: {"method": "GET", "url": "/statistics"},
+        ),
+        case(
+            "GET /statistics?format=ndjson",
+            lambda i: {
+                "method": "GET",
+                "url": "/statistics",
+                "params": {"format": "ndjson"},
+            },
+            FULL_READ_REQUESTS,
+        ),
+        case(
+            "GET /devices/{device_id}/statistics/aggregate",
+            lambda i: {
+                "method": "GET",
+                "url": f"/devices/{fleet.device_id(i)}/statistics/aggregate",
+                "params": {
+                    "bucket": "hour",
+                    "from": FIRST_DATETIME.isoformat(),
+                    "to": fleet.last_datetime.isoformat(),
+                },
+            },
+        ),
+        case(
+            "GET /devices/{device_id}/statistics/{timestamp}",
+            lambda i: {
+                "method": "GET",
+                "url": f"/devices/{fleet.device_id(i)}/statistics/"
+                f"{timestamp(fleet.seeded_datetime(i * 7919))}",
+            },
+        ),
+        case(
+            "POST /devices/{device_id}/statistics",
+            lambda i: {
+                "method": "POST",
+                "url": f"/devices/{fleet.device_id(0)}/statistics",
+                "json": new_statistic(i),
+            },
+        ),
+        case(
+            "PUT /devices/{device_id}/statistics/{timestamp}",
+            lambda i: {
+                "method": "PUT",
+                "url": f"/devices/{fleet.device_id(0)}/statistics/"
+                f"{timestamp(fleet.new_datetime(i))}",
+                "json": {"people_total": 3},
+            },
+        ),
+        case(
+            "DELETE /devices/{device_id}/statistics/{timestamp}",
+            lambda i: {
+                "method": "DELETE",
+                "url": f"/devices/{fleet.device_id(0)}/statistics/"
+                f"{timestamp(fleet.new_datetime(i))}",
+            },
+        ),
+        case(
+            f"POST /devices/{{device_id}}/statistics/bulk ({BULK_SIZE})",
+            lambda i: {
+                "method": "POST",
+                "url": f"/devices/{fleet.device_id(1)}/statistics/bulk",
+                "json": bulk_statistics(i, fleet.device_id(1)),
+            },
+            FULL_READ_REQUESTS,
+        ),
+        case(
+            f"POST /statistics/bulk ({BULK_SIZE})",
+            lambda i: {
+                "method": "POST",
+                "url": "/statistics/bulk",
+                "json": bulk_statistics(FULL_READ_REQUESTS + i, None),
+            },
+            FULL_READ_REQUESTS,
+        ),
+    ]
+
+
+async def run_case(
+    client: httpx.AsyncClient, case: Dict, concurrency: int
+) -> Dict:
+    """
+    Send the requests of a case, at most concurrency at a time.
+
+    Returns:
+        Dict -- Requests per second, latency percentiles, errors and
+        average response size.
+    """
+    requests = [case["build"](i) for i in range(case["requests"])]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, sizes, errors = [], [], 0
+
+    async def send(request: Dict):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.request(**request)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+                sizes.append(len(response.content))
+            except Exception:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[send(request) for request in requests])
+    elapsed = time.perf_counter() - start
+
+    return summarize(
+        latencies,
+        elapsed,
+        concurrency=concurrency,
+        errors=errors,
+        response_bytes=sum(sizes) // len(sizes) if sizes else 0,
+    )
+
+
+async def benchmark_routes(
+    fleet: Fleet, requests: int, concurrency: int
+) -> Dict:
+    results = {}
+    await async_database.connect()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark", timeout=None
+        ) as client:
+            for case in get_route_cases(fleet, requests):
+                results[case["name"]] = await run_case(
+                    client, case, concurrency
+                )
+                print_result(case["name"], results[case["name"]])
+    finally:
+        await async_database.disconnect()
+    return results
+
+
+def benchmark_subscriber(fleet: Fleet, messages: int) -> Dict:
+    """
+    Process messages of every topic, one at a time, the way the subscriber
+    does without its ingestion pipeline.
+
+    Returns:
+        Dict -- Messages per second and latency percentiles, by topic.
+    """
+    first = fleet.new_datetime(2 * FULL_READ_REQUESTS * BULK_SIZE + 1)
+
+    def payload(topic: str, i: int) -> Dict:
+        device_id = fleet.device_id(i)
+        if topic == "hello":
+            return {"device_id": device_id, "description": "benchmark"}
+        if topic == "video-files":
+            return {
+                "device_id": device_id,
+                "file_server": "http://benchmark",
+                "file_list": [
+                    f"video_{number}.mp4"
+                    for number in range(i % 3, FILES_PER_DEVICE + i % 3)
+                ],
+            }
+        # Reports and alerts don't share datetimes, to be all inserted
+        number = i if topic == "alerts" else messages + i
+        return {
+            "device_id": device_id,
+            "timestamp": (first + number * fleet.period).timestamp(),
+            "people_with_mask": 1,
+            "people_without_mask": 1,
+            "people_total": 2,
+        }
+
+    results = {}
+    with session_scope() as database_session:
+        for topic in ["receive-from-jetson", "alerts", "hello", "video-files"]:
+            latencies = []
+            start = time.perf_counter()
+            for i in range(messages):
+                msg = mqtt_client.MQTTMessage(topic=topic.encode())
+                msg.payload = json.dumps(payload(topic, i)).encode()
+                message_start = time.perf_counter()
+                # Each message prints a line, leave them out of the results
+                with contextlib.redirect_stdout(io.StringIO()):
+                    process_message(database_session, msg)
+                latencies.append(time.perf_counter() - message_start)
+            name = f"process_message {topic}"
+            results[name] = summarize(latencies, time.perf_counter() - start)
+            print_result(name, results[name])
+    return results
+
+
+def print_result(name: str, result: Dict):
+    print(
+        f"{name:<58} {result['per_second']:>9.1f}/s "
+        f"p50 {result['p50_ms']:>8.1f} ms  p95 {result['p95_ms']:>8.1f} ms"
+        + (f"  errors {result['errors']}" if result.get("errors") else "")
+    )
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=os.path.dirname(__file__),
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except Exception:
+        return None
+
+
+def compare(previous: Dict, current: Dict):
+    """
+    Print the change of the p50 latency and throughput of every benchmark
+    present in both results.
+    """
+    print(
+        f"\nCompared with {previous['commit']} ({previous['date']}):\n"
+        f"{'':<58} {'p50 ms':>17} {'per second':>21}"
+    )
+    for section in ["routes", "subscriber"]:
+        for name, result in current[section].items():
+            before = previous.get(section, {}).get(name)
+            if not before or not before["p50_ms"] or not before["per_second"]:
+                continue
+            p50_change = result["p50_ms"] / before["p50_ms"] - 1
+            rate_change = result["per_second"] / before["per_second"] - 1
+            print(
+                f"{name:<58} {before['p50_ms']:>8.1f} {p50_change:>+8.0%} "
+                f"{before['per_second']:>11.1f} {rate_change:>+8.0%}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument(
+        "--period", type=int, default=60, help="Seconds between statistics"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=100, help="Requests per route"
+    )
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--messages", type=int, default=200, help="Messages per topic"
+    )
+    parser.add_argument("--output", help="JSON results file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    args = parser.parse_args()
+
+    fleet = Fleet(args.devices, args.days, args.period)
+    results = {
+        "commit": get_commit(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "parameters": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "compare")
+        },
+    }
+
+    print(
+        f"Seeding {args.devices} devices, "
+        f"{fleet.statistics_per_device} statistics each"
+    )
+    try:
+        results["seed"] = fleet.seed()
+        results["routes"] = asyncio.run(
+            benchmark_routes(fleet, args.requests, args.concurrency)
+        )
+        results["subscriber"] = benchmark_subscriber(fleet, args.messages)
+    finally:
+        fleet.clean(args.requests)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR,
+        f"{datetime.now():%Y%m%d-%H%M%S}-{results['commit'] or 'unknown'}.json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare(json.load(previous_file), results)
+
+
+if __name__ == "__main__":
+    main()
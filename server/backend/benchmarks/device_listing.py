@@ -0,0 +1,186 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+"""
+Compare listing devices the way the API used to, serializing every
+statistic of every device through the ORM, with the device summaries
+served by GET /devices and GET /devices/{device_id}.
+
+Usage (from the backend folder, with the database environment set):
+    python -m benchmarks.device_listing [devices] [statistics]
+"""
+
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+import httpx
+from sqlalchemy import event
+
+from app.db.cruds import (
+    delete_device,
+    get_device,
+    get_devices,
+    upsert_devices,
+    upsert_statistics,
+)
+from app.db.schema import (
+    DeviceSchema,
+    StatisticSchema,
+    async_database,
+    engine,
+    session_scope,
+)
+from app.db.utils import StatisticTypeEnum
+from app.main import app
+
+BENCHMARK_DEVICE_PREFIX = "benchmark-device-"
+FIRST_DATETIME = datetime(2021, 1, 1)
+STATISTIC_PERIOD = timedelta(seconds=10)
+REPETITIONS = 5
+
+
+class EagerDeviceSchema(DeviceSchema):
+    # DeviceSchema before the device summaries
+    statistics: List[StatisticSchema] = []
+
+
+class QueryCounter:
+    def __init__(self):
+        self.queries = 0
+
+    def __call__(self, *args):
+        self.queries += 1
+
+
+def device_ids(devices: int) -> List[str]:
+    return [f"{BENCHMARK_DEVICE_PREFIX}{number}" for number in range(devices)]
+
+
+def seed(devices: int, statistics: int):
+    ids = device_ids(devices)
+    with session_scope() as database_session:
+        upsert_devices(
+            db_session=database_session,
+            devices_information=[{"id": device_id} for device_id in ids],
+        )
+        upsert_statistics(
+            db_session=database_session,
+            statistics_information=[
+                {
+                    "device_id": ids[number % devices],
+                    "datetime": FIRST_DATETIME + number * STATISTIC_PERIOD,
+                    "statistic_type": StatisticTypeEnum.REPORT,
+                    "people_with_mask": number % 7,
+                    "people_without_mask": number % 3,
+                    "people_total": number % 7 + number % 3 + 1,
+                }
+                for number in range(statistics)
+            ],
+        )
+
+
+def eager_list() -> bytes:
+    with session_scope() as database_session:
+        devices = get_devices(db_session=database_session)
+        return json.dumps(
+            [EagerDeviceSchema.from_orm(device).dict() for device in devices],
+            default=str,
+        ).encode()
+
+
+def eager_get(device_id: str) -> bytes:
+    with session_scope() as database_session:
+        device = get_device(db_session=database_session, device_id=device_id)
+        return EagerDeviceSchema.from_orm(device).json().encode()
+
+
+def measure_eager(name: str, function, *args):
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    try:
+        seconds = []
+        for _ in range(REPETITIONS):
+            start = time.perf_counter()
+            content = function(*args)
+            seconds.append(time.perf_counter() - start)
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+
+    print_result(name, seconds, content, counter.queries // REPETITIONS)
+
+
+async def measure_summary(client: httpx.AsyncClient, name: str, url: str):
+    seconds = []
+    for _ in range(REPETITIONS):
+        start = time.perf_counter()
+        response = await client.get(url)
+        response.raise_for_status()
+        seconds.append(time.perf_counter() - start)
+
+    print_result(name, seconds, response.content, 1)
+
+
+def print_result(name: str, seconds: List[float], content: bytes, queries):
+    print(
+        f"{name:>16} {sum(seconds) / len(seconds) * 1000:>9.1f} "
+        f"{len(content) / 1e6:>8.2f} {queries:>8}"
+    )
+
+
+async def benchmark(devices: int, statistics: int):
+    first_device = device_ids(devices)[0]
+    print(f"{devices} devices, {statistics} statistics")
+    print(f"{'request':>16} {'mean ms':>9} {'size MB':>8} {'queries':>8}")
+
+    measure_eager("eager list", eager_list)
+    measure_eager("eager device", eager_get, first_device)
+
+    await async_database.connect()
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark", timeout=None
+        ) as client:
+            await measure_summary(client, "summary list", "/devices")
+            await measure_summary(
+                client, "summary device", f"/devices/{first_device}"
+            )
+    finally:
+        await async_database.disconnect()
+
+
+def main(devices: int = 100, statistics: int = 100000):
+    seed(devices, statistics)
+    try:
+        asyncio.run(benchmark(devices, statistics))
+    finally:
+        with session_scope() as database_session:
+            for device_id in device_ids(devices):
+                delete_device(db_session=database_session, device_id=device_id)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
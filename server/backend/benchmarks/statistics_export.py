@@ -0,0 +1,145 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+"""
+Compare exporting the statistics of a device as JSON (the statistics
+endpoint) with the Arrow and Parquet exports: time to produce the response,
+its size and the time to load it in the client.
+
+Usage (from the backend folder, with the database environment set):
+    python -m benchmarks.statistics_export [statistics]
+"""
+
+import asyncio
+import io
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.db.cruds import delete_device, upsert_devices, upsert_statistics
+from app.db.schema import async_database, session_scope
+from app.db.utils import StatisticTypeEnum
+from app.main import app
+
+BENCHMARK_DEVICE_ID = "benchmark-export"
+FIRST_DATETIME = datetime(2021, 1, 1)
+STATISTIC_PERIOD = timedelta(seconds=10)
+
+LOADERS = {
+    "json": json.loads,
+    "arrow": lambda content: pa.ipc.open_stream(content).read_all(),
+    "parquet": lambda content: pq.read_table(io.BytesIO(content)),
+}
+
+
+def seed(rows: int):
+    with session_scope() as database_session:
+        upsert_devices(
+            db_session=database_session,
+            devices_information=[{"id": BENCHMARK_DEVICE_ID}],
+        )
+        upsert_statistics(
+            db_session=database_session,
+            statistics_information=[
+                {
+                    "device_id": BENCHMARK_DEVICE_ID,
+                    "datetime": FIRST_DATETIME + number * STATISTIC_PERIOD,
+                    "statistic_type": (
+                        StatisticTypeEnum.ALERT
+                        if number % 10 == 0
+                        else StatisticTypeEnum.REPORT
+                    ),
+                    "people_with_mask": number % 7,
+                    "people_without_mask": number % 3,
+                    "people_total": number % 7 + number % 3 + 1,
+                }
+                for number in range(rows)
+            ],
+        )
+
+
+async def benchmark(rows: int):
+    last_datetime = FIRST_DATETIME + rows * STATISTIC_PERIOD
+    dates = (
+        f"datefrom={FIRST_DATETIME.isoformat()}"
+        f"&dateto={last_datetime.isoformat()}"
+    )
+    urls = {
+        "json": f"/devices/{BENCHMARK_DEVICE_ID}/statistics?{dates}",
+        "arrow": (
+            f"/statistics/export?format=arrow"
+            f"&device_id={BENCHMARK_DEVICE_ID}&{dates}"
+        ),
+        "parquet": (
+            f"/statistics/export?format=parquet"
+            f"&device_id={BENCHMARK_DEVICE_ID}&{dates}"
+        ),
+    }
+
+    await async_database.connect()
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark", timeout=None
+        ) as client:
+            print(f"{rows} statistics")
+            print(
+                f"{'format':>8} {'response s':>11} {'size MB':>8} "
+                f"{'load s':>7} {'rows':>9}"
+            )
+            for name, url in urls.items():
+                start = time.perf_counter()
+                response = await client.get(url)
+                response.raise_for_status()
+                response_seconds = time.perf_counter() - start
+
+                start = time.perf_counter()
+                loaded = LOADERS[name](response.content)
+                load_seconds = time.perf_counter() - start
+
+                print(
+                    f"{name:>8} {response_seconds:>11.2f} "
+                    f"{len(response.content) / 1e6:>8.1f} "
+                    f"{load_seconds:>7.2f} {len(loaded):>9}"
+                )
+    finally:
+        await async_database.disconnect()
+
+
+def main(rows: int = 200000):
+    seed(rows)
+    try:
+        asyncio.run(benchmark(rows))
+    finally:
+        with session_scope() as database_session:
+            delete_device(
+                db_session=database_session, device_id=BENCHMARK_DEVICE_ID
+            )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,134 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+"""
+Compare the video_file synchronization with the previous full rewrite
+(delete every file of the device, then insert each file).
+
+Each iteration simulates a new file-list message from a device with N
+archived clips: the oldest clip was removed and a new one was recorded.
+
+Usage (from the backend folder, with the database environment set):
+    python -m benchmarks.video_files [iterations]
+"""
+
+import sys
+import time
+from typing import List
+
+from app.db.cruds import delete_device, update_files, upsert_devices
+from app.db.schema import VideoFilesModel, get_db_session
+
+from sqlalchemy.orm import Session
+
+BENCHMARK_DEVICE_ID = "benchmark-video-files"
+FILE_COUNTS = [10, 1000, 10000]
+
+
+def update_files_full_rewrite(
+    db_session: Session, device_id: str, file_list: List
+):
+    """
+    Previous implementation of update_files, kept as a baseline.
+    """
+    query = db_session.query(VideoFilesModel)
+    query = query.filter(VideoFilesModel.device_id == device_id)
+    query.delete(synchronize_session=False)
+    db_session.commit()
+
+    for new_file in file_list:
+        db_session.add(
+            VideoFilesModel(device_id=device_id, video_name=new_file)
+        )
+
+    db_session.commit()
+
+
+def file_names(first: int, count: int) -> List[str]:
+    return [
+        f"{BENCHMARK_DEVICE_ID}_{number:08}.mp4"
+        for number in range(first, first + count)
+    ]
+
+
+def benchmark(
+    database_session, update_function, file_count: int, iterations: int
+) -> float:
+    """
+    Returns:
+        float -- Mean seconds per file-list message.
+    """
+    update_function(
+        database_session, BENCHMARK_DEVICE_ID, file_names(0, file_count)
+    )
+
+    start = time.perf_counter()
+    for iteration in range(1, iterations + 1):
+        update_function(
+            database_session,
+            BENCHMARK_DEVICE_ID,
+            file_names(iteration, file_count),
+        )
+    return (time.perf_counter() - start) / iterations
+
+
+def main(iterations: int = 10):
+    database_session = get_db_session()
+    try:
+        upsert_devices(
+            db_session=database_session,
+            devices_information=[{"id": BENCHMARK_DEVICE_ID}],
+        )
+
+        print(
+            f"{'files':>8} {'full rewrite ms':>16} {'diff sync ms':>13} {'speedup':>8}"
+        )
+        for file_count in FILE_COUNTS:
+            full_rewrite = benchmark(
+                database_session,
+                update_files_full_rewrite,
+                file_count,
+                iterations,
+            )
+            diff_sync = benchmark(
+                database_session,
+                lambda db_session, device_id, file_list: update_files(
+                    db_session=db_session,
+                    device_id=device_id,
+                    file_list=file_list,
+                ),
+                file_count,
+                iterations,
+            )
+            print(
+                f"{file_count:>8} {full_rewrite * 1000:>16.1f} "
+                f"{diff_sync * 1000:>13.1f} {full_rewrite / diff_sync:>7.1f}x"
+            )
+    finally:
+        delete_device(
+            db_session=database_session, device_id=BENCHMARK_DEVICE_ID
+        )
+        database_session.close()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
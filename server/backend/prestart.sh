@@ -4,5 +4,8 @@
 sleep 3
 alembic upgrade head
 
-# Init subscriber process
-python app/mqtt/subscriber.py &
+# Create the next statistic partitions and apply the retention policy, daily
+(while true; do DB_PROCESS_TYPE=script python app/db/partitions.py; sleep 86400; done) &
+
+# Init subscriber processes (SUBSCRIBER_WORKERS, restarted if they fail)
+python app/mqtt/supervisor.py &
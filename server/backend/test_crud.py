@@ -20,27 +20,51 @@
 # DEALINGS IN THE SOFTWARE.
 ################################################################################
 
+import asyncio
 import random
+import time
 from datetime import datetime, timezone
 
 import pytest
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
 
+from app.api import CachedResponse, DatabaseListener, LiveHub, ResponseCache
 from app.db.cruds import (
+    DEVICE_DELETED_CHANNEL,
+    DEVICE_STATUS_CHANNEL,
+    STATISTIC_CHANGES_CHANNEL,
+    async_get_devices,
+    async_get_statistics_page,
+    bulk_insert_statistics,
     create_device,
     create_statistic,
     delete_device,
     delete_statistic,
     get_device,
     get_devices,
+    get_devices_latest,
+    get_files_by_device,
     get_statistic,
+    get_statistic_rollups,
     get_statistics,
+    get_statistics_aggregate,
+    get_statistics_from_to,
+    notify_device_status,
     update_device,
+    update_files,
     update_statistic,
+    upsert_devices,
+    upsert_statistics,
+)
+from app.db.schema import async_database, get_db_session
+from app.db.utils import (
+    StatisticBucketEnum,
+    StatisticTypeEnum,
+    convert_timestamp_to_datetime,
+    decode_cursor,
+    encode_cursor,
 )
-from app.db.schema import get_db_session
-from app.db.utils import StatisticTypeEnum, convert_timestamp_to_datetime
 
 DEVICE_ID = "test"
 database_session = get_db_session()
@@ -79,6 +103,20 @@ def test_create_same_device():
         )
 
 
+def test_upsert_same_device():
+    info = {
+        "id": DEVICE_ID,
+        "description": "another description",
+    }
+    inserted = upsert_devices(
+        db_session=database_session, devices_information=[info]
+    )
+    device = get_device(db_session=database_session, device_id=DEVICE_ID)
+
+    assert inserted == 0
+    assert device.description == "test description"
+
+
 def test_get_device():
     device = get_device(db_session=database_session, device_id=DEVICE_ID)
 
@@ -173,6 +211,98 @@ def test_create_another_statistic():
     assert statistic.people_total == people_with_mask + people_without_mask
 
 
+def test_upsert_statistics():
+    people_with_mask = 5
+    people_without_mask = 8
+    # Already created by test_create_another_statistic
+    existing = convert_timestamp_to_datetime(1609867371.514455)
+    new = convert_timestamp_to_datetime(1609867386.514455)
+
+    stats_info = [
+        {
+            "device_id": DEVICE_ID,
+            "datetime": stat_datetime,
+            "statistic_type": StatisticTypeEnum.REPORT,
+            "people_with_mask": people_with_mask,
+            "people_without_mask": people_without_mask,
+            "people_total": people_with_mask + people_without_mask,
+        }
+        for stat_datetime in [existing, new, new]
+    ]
+
+    inserted = upsert_statistics(
+        db_session=database_session, statistics_information=stats_info
+    )
+    statistic = get_statistic(
+        db_session=database_session, device_id=DEVICE_ID, datetime=existing
+    )
+
+    assert inserted == 1
+    assert statistic.statistic_type == StatisticTypeEnum.ALERT
+
+    inserted = upsert_statistics(
+        db_session=database_session,
+        statistics_information=stats_info,
+        update_existing=True,
+    )
+    database_session.refresh(statistic)
+
+    assert inserted == 2
+    assert statistic.statistic_type == StatisticTypeEnum.REPORT
+
+
+def test_statistic_rollups():
+    rollups = get_statistic_rollups(
+        db_session=database_session, device_id=DEVICE_ID, resolution="day"
+    )
+
+    # One alert on 2021-01-04 and two reports on 2021-01-05
+    assert [
+        (rollup.statistic_type, rollup.samples, rollup.people_total)
+        for rollup in rollups
+    ] == [(StatisticTypeEnum.ALERT, 1, 11), (StatisticTypeEnum.REPORT, 2, 26)]
+    assert rollups[1].bucket == datetime(2021, 1, 5)
+
+
+def test_get_devices_latest():
+    latest = get_devices_latest(db_session=database_session)
+
+    # The alert of 2021-01-05 was overwritten by a report
+    assert [device.device_id for device in latest] == [DEVICE_ID]
+    assert latest[0].statistic_datetime == datetime(2021, 1, 5, 17, 23, 6, 514455)
+    assert latest[0].statistic_type == StatisticTypeEnum.REPORT
+    assert latest[0].alert_datetime == datetime(2021, 1, 4, 17, 22, 51, 514455)
+    assert latest[0].alert_people_total == 11
+
+
+def test_get_statistics_aggregate():
+    by_day = get_statistics_aggregate(
+        db_session=database_session,
+        device_id=DEVICE_ID,
+        bucket=StatisticBucketEnum.DAY,
+    )
+
+    assert by_day["alerts"]["dates"] == [datetime(2021, 1, 4)]
+    assert by_day["alerts"]["people_total"] == [11]
+    assert by_day["reports"]["dates"] == [datetime(2021, 1, 5)]
+    assert by_day["reports"]["people_with_mask"] == [10]
+    assert by_day["reports"]["visible_people"] == [26]
+
+    # Only the report at 17:23:06, read from the raw statistics
+    by_hour = get_statistics_aggregate(
+        db_session=database_session,
+        device_id=DEVICE_ID,
+        bucket=StatisticBucketEnum.HOUR,
+        from_date=datetime(2021, 1, 5, 17, 23, tzinfo=timezone.utc),
+        to_date=datetime(2021, 1, 6),
+    )
+
+    assert by_hour["alerts"] is None
+    assert by_hour["reports"]["dates"] == [datetime(2021, 1, 5, 17)]
+    assert by_hour["reports"]["people_total"] == [13]
+    assert by_hour["reports"]["mask_percentage"] == [5 * 100 / 13]
+
+
 def test_get_statistic():
     people_with_mask = 4
     people_without_mask = 7
@@ -191,6 +321,85 @@ def test_get_statistic():
     assert statistic.people_total == people_with_mask + people_without_mask
 
 
+def test_async_get_statistics_page_from_to():
+    async def get_statistics_async():
+        await async_database.connect()
+        try:
+            async with async_database.connection() as connection:
+                return await async_get_statistics_page(
+                    connection=connection,
+                    limit=10,
+                    device_id=DEVICE_ID,
+                    from_date="2021-01-05",
+                )
+        finally:
+            await async_database.disconnect()
+
+    statistics = asyncio.run(get_statistics_async())
+    expected = get_statistics_from_to(
+        db_session=database_session, device_id=DEVICE_ID, from_date="2021-01-05"
+    )
+
+    assert len(statistics) == 2
+    assert sorted(
+        (statistic["datetime"], statistic["statistic_type"])
+        for statistic in statistics
+    ) == sorted(
+        (statistic.datetime, statistic.statistic_type) for statistic in expected
+    )
+
+
+def test_async_get_statistics_page():
+    async def get_pages_async():
+        await async_database.connect()
+        try:
+            async with async_database.connection() as connection:
+                first = await async_get_statistics_page(
+                    connection=connection, limit=2, device_id=DEVICE_ID
+                )
+                cursor = encode_cursor(
+                    first[-1]["device_id"], first[-1]["datetime"]
+                )
+                second = await async_get_statistics_page(
+                    connection=connection,
+                    limit=2,
+                    device_id=DEVICE_ID,
+                    after=decode_cursor(cursor),
+                )
+                return first, second
+        finally:
+            await async_database.disconnect()
+
+    first, second = asyncio.run(get_pages_async())
+    expected = sorted(
+        statistic.datetime
+        for statistic in get_statistics(
+            db_session=database_session, device_id=DEVICE_ID
+        )
+    )
+
+    assert [statistic["datetime"] for statistic in first + second] == expected
+    assert len(first) == 2 and len(second) == 1
+
+
+def test_async_get_devices():
+    async def get_devices_async():
+        await async_database.connect()
+        try:
+            async with async_database.connection() as connection:
+                return await async_get_devices(connection=connection)
+        finally:
+            await async_database.disconnect()
+
+    devices = asyncio.run(get_devices_async())
+    latest = convert_timestamp_to_datetime(1609867386.514455)
+
+    assert [device["id"] for device in devices] == [DEVICE_ID]
+    assert devices[0]["last_seen"] == latest.replace(tzinfo=None)
+    assert devices[0]["latest_statistic"]["people_total"] == 13
+    assert "statistics" not in devices[0]
+
+
 def test_update_statistic():
     people_without_mask = 7
     # now = datetime(2021, 1, 4, 17, 22, 51, 514455, tzinfo=timezone.utc)
@@ -231,11 +440,193 @@ def test_delete_statistic():
     assert statistic.people_total == people_with_mask + people_without_mask
 
 
+# Response cache
+def test_response_cache_invalidation():
+    cache = ResponseCache(max_bytes=1024, ttl=60)
+    cache.listening = True
+    january = CachedResponse(
+        b"[]", DEVICE_ID, datetime(2021, 1, 1), datetime(2021, 1, 31)
+    )
+    cache.put("january", january, cache.changes)
+    cache.put("other", CachedResponse(b"[]", "other"), cache.changes)
+
+    # Another month of the same device
+    cache.invalidate(DEVICE_ID, datetime(2021, 2, 1), datetime(2021, 2, 2))
+    assert cache.get("january") is january
+
+    cache.invalidate(DEVICE_ID, datetime(2021, 1, 31), datetime(2021, 2, 1))
+    assert cache.get("january") is None
+    assert cache.get("other") is not None
+
+    # Changes between reading and caching a response
+    changes = cache.changes
+    cache.invalidate("other")
+    cache.put("january", january, changes)
+    assert cache.get("january") is None
+
+
+def test_response_cache_expiration():
+    cache = ResponseCache(max_bytes=1024, ttl=0.05)
+    cache.listening = True
+    entry = CachedResponse(b"[]", DEVICE_ID)
+    cache.put("key", entry, cache.changes)
+    assert cache.get("key") is entry
+
+    time.sleep(0.1)
+    assert cache.get("key") is None
+
+
+def test_live_hub():
+    hub = LiveHub(queue_size=2)
+    listener = DatabaseListener()
+    listener.add_channel(STATISTIC_CHANGES_CHANNEL, hub.on_statistic_changes)
+    listener.add_channel(DEVICE_STATUS_CHANNEL, hub.on_device_status)
+    listener.add_reset_callback(hub.reset)
+    new = convert_timestamp_to_datetime(1609867401.514455)
+
+    async def receive_events_async():
+        await listener.start()
+        while not listener.listening:
+            await asyncio.sleep(0.1)
+
+        queue = hub.subscribe(DEVICE_ID)
+        upsert_statistics(
+            db_session=database_session,
+            statistics_information=[
+                {
+                    "device_id": DEVICE_ID,
+                    "datetime": new,
+                    "statistic_type": StatisticTypeEnum.ALERT,
+                    "people_with_mask": 1,
+                    "people_without_mask": 2,
+                    "people_total": 3,
+                }
+            ],
+        )
+        notify_device_status(
+            db_session=database_session,
+            device_status={"device_id": DEVICE_ID, "time": "17:23:21"},
+        )
+        events = [await asyncio.wait_for(queue.get(), 5) for _ in range(2)]
+        await listener.close()
+        return events
+
+    alert, status = asyncio.run(receive_events_async())
+
+    assert alert == (
+        "alert",
+        {
+            "device_id": DEVICE_ID,
+            "datetime": new.replace(tzinfo=None).isoformat(),
+            "statistic_type": "ALERT",
+            "people_with_mask": 1,
+            "people_without_mask": 2,
+            "people_total": 3,
+        },
+    )
+    assert status == ("status", {"device_id": DEVICE_ID, "time": "17:23:21"})
+    assert hub.last_status[DEVICE_ID]["time"] == "17:23:21"
+
+
+def test_bulk_insert_statistics():
+    first = convert_timestamp_to_datetime(1609867500.514455)
+    stats_info = [
+        {
+            "device_id": DEVICE_ID,
+            "datetime": convert_timestamp_to_datetime(1609867500.514455 + i),
+            "statistic_type": StatisticTypeEnum.REPORT,
+            "people_with_mask": 1,
+            "people_without_mask": 1,
+            "people_total": 2,
+        }
+        for i in range(3)
+    ]
+
+    counts = bulk_insert_statistics(
+        db_session=database_session,
+        statistics_information=stats_info + stats_info[:1],
+    )
+
+    assert counts == {DEVICE_ID: {"received": 4, "inserted": 3, "conflicts": 1}}
+
+    # Nothing is inserted if some device doesn't exist
+    with pytest.raises(NoResultFound):
+        bulk_insert_statistics(
+            db_session=database_session,
+            statistics_information=[
+                dict(stats_info[0], datetime=convert_timestamp_to_datetime(1609867600)),
+                dict(stats_info[0], device_id="unknown"),
+            ],
+        )
+
+    assert (
+        get_statistic(db_session=database_session, device_id=DEVICE_ID, datetime=first)
+        is not None
+    )
+    with pytest.raises(NoResultFound):
+        get_statistic(
+            db_session=database_session,
+            device_id=DEVICE_ID,
+            datetime=convert_timestamp_to_datetime(1609867600),
+        )
+
+
+# Video files
+def test_update_files():
+    added, removed = update_files(
+        db_session=database_session,
+        device_id=DEVICE_ID,
+        file_list=["video_1.mp4", "video_2.mp4"],
+    )
+
+    assert (added, removed) == (2, 0)
+
+    added, removed = update_files(
+        db_session=database_session,
+        device_id=DEVICE_ID,
+        file_list=["video_2.mp4", "video_3.mp4"],
+    )
+    files = get_files_by_device(db_session=database_session, device_id=DEVICE_ID)
+
+    assert (added, removed) == (1, 1)
+    assert sorted(file.video_name for file in files) == [
+        "video_2.mp4",
+        "video_3.mp4",
+    ]
+
+
 def test_delete_device():
-    device = delete_device(db_session=database_session, device_id=DEVICE_ID)
+    cache = ResponseCache(max_bytes=1024, ttl=60)
+    cache.listening = True
+    cache.put("statistics", CachedResponse(b"[]", DEVICE_ID), cache.changes)
+    cache.put("other", CachedResponse(b"[]", "other"), cache.changes)
+
+    listener = DatabaseListener()
+    deleted = []
+    listener.add_channel(DEVICE_DELETED_CHANNEL, deleted.append)
+    listener.add_channel(DEVICE_DELETED_CHANNEL, cache.on_device_deleted)
+
+    async def delete_device_async():
+        await listener.start()
+        while not listener.listening:
+            await asyncio.sleep(0.1)
+
+        device = delete_device(db_session=database_session, device_id=DEVICE_ID)
+        for _ in range(50):
+            if deleted:
+                break
+            await asyncio.sleep(0.1)
+        await listener.close()
+        return device
+
+    device = asyncio.run(delete_device_async())
 
     assert device.id == DEVICE_ID
     assert device.description == "new description"
+    # Announced to the subscribers, which forget the device, and API workers
+    assert deleted == [DEVICE_ID]
+    assert cache.get("statistics") is None
+    assert cache.get("other") is not None
 
 
 def test_get_deleted_device():
@@ -0,0 +1,100 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+"""
+Measure downsampling the grouped data of long ranges with LTTB, and the
+charts drawn with and without it, for series of 10k, 100k and 1M points.
+Checks that every spike of the series is kept.
+
+Usage (from the frontend folder):
+    python -m benchmarks.chart_downsampling [points ...]
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import numpy as np
+
+from utils.format_utils import CHART_MAX_POINTS, create_chart, downsample
+
+POINT_COUNTS = [10000, 100000, 1000000]
+FIRST_DATETIME = datetime(2021, 1, 1)
+SPIKE_EVERY = 50000
+SPIKE_PEOPLE = 100
+
+
+def create_grouped_data(points: int) -> Dict:
+    """
+    Data as returned by group_data when grouping by second: a few people
+    every second, and a spike of people every SPIKE_EVERY seconds.
+    """
+    random = np.random.default_rng(0)
+    people_total = random.integers(1, 10, points)
+    people_total[SPIKE_EVERY // 2 :: SPIKE_EVERY] = SPIKE_PEOPLE
+    people_with_mask = random.integers(0, people_total + 1)
+
+    return {
+        "dates": [
+            FIRST_DATETIME + timedelta(seconds=second)
+            for second in range(points)
+        ],
+        "people_with_mask": people_with_mask.tolist(),
+        "people_total": people_total.tolist(),
+        "mask_percentage": (people_with_mask * 100 / people_total).tolist(),
+        "visible_people": people_total.tolist(),
+    }
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(point_counts: List[int] = POINT_COUNTS):
+    print(f"Up to {CHART_MAX_POINTS} points per trace")
+    print(
+        f"{'points':>9} {'downsample ms':>14} {'chart ms':>9} "
+        f"{'chart MB':>9} {'full chart ms':>14} {'full chart MB':>14}"
+    )
+    for points in point_counts:
+        reports = create_grouped_data(points)
+
+        downsampled, downsample_time = timed(downsample, reports)
+        spikes = reports["people_total"].count(SPIKE_PEOPLE)
+        assert downsampled["people_total"].count(SPIKE_PEOPLE) == spikes
+        assert len(downsampled["dates"]) == min(points, CHART_MAX_POINTS)
+
+        chart, chart_time = timed(create_chart, reports)
+        full_chart, full_chart_time = timed(create_chart, reports, {}, 0)
+        print(
+            f"{points:>9} {downsample_time * 1000:>14.1f} "
+            f"{chart_time * 1000:>9.1f} {len(chart.to_json()) / 1e6:>9.2f} "
+            f"{full_chart_time * 1000:>14.1f} "
+            f"{len(full_chart.to_json()) / 1e6:>14.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main(*[[int(arg) for arg in sys.argv[1:]]] if sys.argv[1:] else [])
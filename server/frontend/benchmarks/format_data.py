@@ -0,0 +1,198 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+"""
+Compare formatting the statistics of a device row by row, as the dashboard
+used to, with the vectorized format_data, for 10k, 100k and 1M statistics.
+
+Usage (from the frontend folder):
+    python -m benchmarks.format_data [rows ...]
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from utils.format_utils import (
+    DATE_FORMAT,
+    GROUP_FREQUENCIES,
+    format_data,
+)
+
+ROW_COUNTS = [10000, 100000, 1000000]
+FIRST_DATETIME = datetime(2021, 1, 1)
+STATISTIC_PERIOD = timedelta(seconds=15)
+ALERT_EVERY = 20
+REPETITIONS = 3
+
+
+def create_statistics(rows: int) -> List[Dict]:
+    """
+    Statistics as decoded from the API response, one every 15 seconds.
+    """
+    statistics = []
+    for number in range(rows):
+        people_with_mask = number % 5
+        people_without_mask = number % 3
+        statistics.append(
+            {
+                "device_id": "benchmark",
+                "datetime": (
+                    FIRST_DATETIME
+                    + number * STATISTIC_PERIOD
+                    + timedelta(microseconds=number % 2 * 514455)
+                ).isoformat(),
+                "statistic_type": (
+                    "ALERT" if number % ALERT_EVERY == 0 else "REPORT"
+                ),
+                "people_with_mask": people_with_mask,
+                "people_without_mask": people_without_mask,
+                "people_total": people_with_mask
+                + people_without_mask
+                + number % 2,
+            }
+        )
+    return statistics
+
+
+def format_data_by_row(statistics: List, group_data_by: str):
+    """
+    Previous implementation, kept as a baseline: appends every statistic to
+    Python lists, then builds a DataFrame for reports and another one for
+    alerts. The resample aliases and date format are the current ones, so
+    it runs with any pandas version.
+    """
+    reports, alerts = {}, {}
+    for statistic in statistics:
+        if statistic["statistic_type"] == "REPORT":
+            reports = reports or create_statistics_dict()
+            add_information(reports, statistic)
+        else:
+            alerts = alerts or create_statistics_dict()
+            add_information(alerts, statistic)
+
+    if reports:
+        reports = group_data_by_row(reports, group_data_by)
+    if alerts:
+        alerts = group_data_by_row(alerts, group_data_by)
+    return reports, alerts
+
+
+def create_statistics_dict():
+    return {
+        "dates": [],
+        "mask_percentage": [],
+        "people_total": [],
+        "people_with_mask": [],
+        "people_without_mask": [],
+        "visible_people": [],
+    }
+
+
+def add_information(statistic_dict: Dict, statistic_information: Dict):
+    total = statistic_information["people_total"]
+    people_with_mask = statistic_information["people_with_mask"]
+    people_without_mask = statistic_information["people_without_mask"]
+
+    statistic_dict["dates"].append(statistic_information["datetime"])
+    statistic_dict["people_total"].append(total)
+    statistic_dict["people_with_mask"].append(people_with_mask)
+    statistic_dict["people_without_mask"].append(people_without_mask)
+    statistic_dict["mask_percentage"].append(
+        people_with_mask * 100 / total if total != 0 else 0
+    )
+    statistic_dict["visible_people"].append(
+        people_with_mask + people_without_mask
+    )
+
+
+def group_data_by_row(data: Dict, group_data_by: str):
+    data_df = pd.DataFrame.from_dict(data)
+    data_df["dates"] = pd.to_datetime(data_df["dates"], format=DATE_FORMAT)
+
+    group = (
+        data_df.resample(GROUP_FREQUENCIES.get(group_data_by, "h"), on="dates")
+        .agg(
+            {
+                "people_total": "sum",
+                "people_with_mask": "sum",
+                "people_without_mask": "sum",
+            }
+        )
+        .reset_index()
+    )
+    group["mask_percentage"] = (
+        group["people_with_mask"] * 100 / group["people_total"]
+    )
+    group["mask_percentage"] = group["mask_percentage"].replace(
+        [np.inf, -np.inf], 0
+    )
+    group["visible_people"] = (
+        group["people_with_mask"] + group["people_without_mask"]
+    )
+    group.dropna(subset=["mask_percentage"], inplace=True)
+    group = group.to_dict()
+    return {
+        "dates": [t.to_pydatetime() for t in group["dates"].values()],
+        "people_with_mask": list(group["people_with_mask"].values()),
+        "people_total": list(group["people_total"].values()),
+        "mask_percentage": list(group["mask_percentage"].values()),
+        "visible_people": list(group["visible_people"].values()),
+    }
+
+
+def best_time(function, *args) -> float:
+    times = []
+    for _ in range(REPETITIONS):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(row_counts: List[int] = ROW_COUNTS, group_data_by: str = "Hour"):
+    print(f"Grouped by {group_data_by}, best of {REPETITIONS}")
+    print(
+        f"{'rows':>9} {'by row ms':>10} {'vectorized ms':>14} {'speedup':>8}"
+    )
+    for rows in row_counts:
+        statistics = create_statistics(rows)
+
+        # Both must draw the same charts
+        assert format_data(statistics, group_data_by) == format_data_by_row(
+            statistics, group_data_by
+        )
+
+        by_row = best_time(format_data_by_row, statistics, group_data_by)
+        vectorized = best_time(format_data, statistics, group_data_by)
+        print(
+            f"{rows:>9} {by_row * 1000:>10.1f} {vectorized * 1000:>14.1f} "
+            f"{by_row / vectorized:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main(*[[int(arg) for arg in sys.argv[1:]]] if sys.argv[1:] else [])
@@ -30,9 +30,12 @@ from session_manager import get_state
 from utils.api_utils import (
     get_device,
     get_devices,
-    get_statistics_from_to,
     get_device_files,
+    open_live_events,
+    request_timings,
+    wait_live_event,
 )
+from utils.cache_utils import api_cache, statistics_cache
 from utils.format_utils import create_chart, format_data
 
 from paho.mqtt import client as mqtt_client
@@ -42,7 +45,6 @@ MQTT_BROKER_PORT = int(os.environ["MQTT_BROKER_PORT"])
 MQTT_CLIENT_ID = os.environ["MQTT_CLIENT_ID"]
 
 MQTT_TOPIC_COMMANDS = "commands"
-MQTT_TOPIC_STATUS = "device-status"
 
 CMD_FILE_SAVE = "save_file"
 CMD_STREAMING_START = "streaming_start"
@@ -93,13 +95,16 @@ def display_sidebar(all_devices, state):
 
     state.show_only_one_chart = st.sidebar.checkbox("Show only one chart", value=True)
 
+    st.sidebar.subheader("Debug")
+    state.show_request_timings = st.sidebar.checkbox("Show request timings", value=False)
+
 
 def display_device(state):
     """
     Display specific device information.
     """
     selected_device = state.selected_device
-    device = get_device(selected_device)
+    device = api_cache.get(("device", selected_device), lambda: get_device(selected_device))
 
     if device is None:
         st.write("Seems that something went wrong while getting the device information.")
@@ -169,11 +174,12 @@ def display_device(state):
         date_filter = state.date_filter
 
         if len(date_filter) == 2:
-            datetime_from = f"{date_filter[0]}T{state.from_time}"
-            datetime_to = f"{date_filter[1]}T{state.to_time}"
-            device_statistics = get_statistics_from_to(selected_device, datetime_from, datetime_to)
+            # Only the statistics received since the last rerun are requested
+            datetime_from = datetime.combine(date_filter[0], state.from_time)
+            datetime_to = datetime.combine(date_filter[1], state.to_time)
+            device_statistics = statistics_cache.get(selected_device, datetime_from, datetime_to)
 
-        if not device_statistics:
+        if device_statistics is None or device_statistics.empty:
             st.write("The selected device has no statistics to show for the given filters.")
         else:
             reports, alerts = format_data(device_statistics, state.group_data_by)
@@ -195,7 +201,9 @@ def display_device(state):
                     st.plotly_chart(alerts_chart, use_container_width=True)
                 else:
                     st.write("The selected device has no alerts to show for the given filters.")
-        device_files = get_device_files(device_id=selected_device)
+        device_files = api_cache.get(
+            ("files", selected_device), lambda: get_device_files(device_id=selected_device)
+        )
         st.subheader("Saved video files on device")
         if not device_files:
             st.write("The selected device has no saved files yet")
@@ -217,6 +225,33 @@ def display_device(state):
                     st.markdown(f"{file_instance['video_name']}")
 
 
+def display_request_timings():
+    """
+    Display the last requests sent to the server, by any dashboard session.
+    """
+    st.header("Request timings")
+    timings = list(reversed(request_timings))
+    if not timings:
+        st.write("No requests sent to the server yet.")
+        return
+
+    st.table(
+        [
+            {
+                "Time": timing["time"],
+                "Path": timing["path"],
+                "Status": timing["status"],
+                "Encoding": timing["encoding"],
+                "Received (kB)": f"{timing['received_bytes'] / 1000:.1f}",
+                "Decoded (kB)": f"{timing['bytes'] / 1000:.1f}",
+                "Request (ms)": f"{timing['request_ms']:.1f}",
+                "Decode (ms)": f"{timing['decode_ms']:.1f}",
+            }
+            for timing in timings
+        ]
+    )
+
+
 def mqtt_set_status(mqtt_status, text):
     state.mqtt_status = text
     mqtt_status.empty()
@@ -228,19 +263,6 @@ def _on_connect(client, userdata, flags, rc):
         state.mqtt_connected = True
 
 
-def _on_message(client, userdata, msg):
-    # This is the only topic the frontend subscribes to
-    assert msg.topic == MQTT_TOPIC_STATUS
-    if not state.selected_device:
-        return
-
-    message = json.loads(msg.payload.decode())
-    if message["device_id"] != state.selected_device:
-        return
-
-    state.mqtt_last_status = message
-
-
 @st.cache(allow_output_mutation=True)
 def restore_client():
     client = mqtt_client.Client(MQTT_CLIENT_ID)
@@ -251,7 +273,6 @@ def restore_client():
 def get_mqtt_client():
     client = restore_client()
     client.on_connect = _on_connect
-    client.on_message = _on_message
     return client
 
 
@@ -261,14 +282,9 @@ def mqtt_wait_connection(client, timeout):
         timeout -= 1
 
 
-def mqtt_wait_response(client, timeout):
-    while not state.mqtt_last_status and timeout:
-        client.loop(timeout=1)
-        timeout -= 1
-
-
 def send_mqtt_message_wait_response(topic, message, mqtt_status):
     # This function connects, sends a message and waits for the reply. Reconnects as needed
+    live_response = None
     try:
         client = get_mqtt_client()
         if not state.mqtt_connected:
@@ -277,13 +293,15 @@ def send_mqtt_message_wait_response(topic, message, mqtt_status):
 
         state.mqtt_last_status = None  # Reset status to await updated response
 
+        # The reply is pushed by the server, which subscribes to the device status
+        live_response, live_events = open_live_events(message["device_id"], 5)
+
         # Since we're not running the client.loop() permanently,
         # the way to ensure that the MQTT client is connected is to try
         # to send a message and if it fails, try reconnecting.
         retry_publish = 2  # mosquitto disconnects after a while so at least use 2 here
         while retry_publish:
             retry_publish -= 1
-            client.subscribe(MQTT_TOPIC_STATUS)  # Must be done after reconnection
             msg_info = client.publish(topic, json.dumps(message))
             mqtt_set_status(mqtt_status, "Sending message...")
 
@@ -305,13 +323,17 @@ def send_mqtt_message_wait_response(topic, message, mqtt_status):
             mqtt_set_status(mqtt_status, ":o: Message failed")
             return
 
-        mqtt_wait_response(client, 5)
+        state.mqtt_last_status = wait_live_event(live_events, "status", 5)
         if not state.mqtt_last_status:
             mqtt_set_status(mqtt_status, ":red_circle: Device not responding")
 
     except Exception as e:
         mqtt_set_status(mqtt_status, f":red_circle: Could not connect to MQTT broker: {e}")
 
+    finally:
+        if live_response is not None:
+            live_response.close()
+
 
 def send_mqtt_command(device_id, command, mqtt_status):
     send_mqtt_message_wait_response(
@@ -323,7 +345,7 @@ def main():
     st.set_page_config(page_title="Maskcam")
 
     st.title("MaskCam dashboard")
-    all_devices = get_devices()
+    all_devices = api_cache.get("devices", get_devices)
     display_sidebar(all_devices, state)
 
     if state.selected_device is None:
@@ -331,6 +353,9 @@ def main():
     else:
         display_device(state)
 
+    if state.show_request_timings:
+        display_request_timings()
+
     state.sync()
 
 
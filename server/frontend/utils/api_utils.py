@@ -20,22 +20,78 @@
 # DEALINGS IN THE SOFTWARE.
 ################################################################################
 
-import json
 import os
+import time
+from collections import deque
+from datetime import datetime
 from typing import Dict, List
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 
 SERVER_URL = os.environ["SERVER_URL"]
 
+# Connections kept open to the server, shared by all the dashboard sessions
+API_POOL_SIZE = int(os.environ.get("API_POOL_SIZE", 10))
+API_TIMEOUT = float(os.environ.get("API_TIMEOUT", 30))
+
+# Last requests shown in the debug panel
+request_timings = deque(maxlen=50)
+
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_maxsize=API_POOL_SIZE))
+session.headers["Accept-Encoding"] = "gzip"
+
+
+def get_json(path: str, params: Dict = None, ndjson: bool = False):
+    """
+    Request a path of the server with the shared session and decode the
+    response, recording its timing in request_timings.
+
+    Arguments:
+        path {str} -- Path, e.g: "/devices".
+        params {Dict} -- Query parameters.
+        ndjson {bool} -- Whether the response has a JSON object per line.
+
+    Returns:
+        Optional[Union[Dict, List]] -- Decoded response, None if the server
+        answered with an error.
+    """
+    start = time.perf_counter()
+    response = session.get(
+        f"http://{SERVER_URL}{path}", params=params, timeout=API_TIMEOUT
+    )
+    content = response.content
+    received = time.perf_counter()
+
+    data = None
+    if response.ok:
+        if ndjson:
+            # A single call for all the lines
+            content = b"[" + b",".join(content.splitlines()) + b"]"
+        data = orjson.loads(content)
+
+    request_timings.append(
+        {
+            "time": datetime.now().strftime("%H:%M:%S"),
+            "path": path,
+            "status": response.status_code,
+            "encoding": response.headers.get("Content-Encoding", "identity"),
+            "received_bytes": response.raw.tell(),
+            "bytes": len(response.content),
+            "request_ms": (received - start) * 1000,
+            "decode_ms": (time.perf_counter() - received) * 1000,
+        }
+    )
+    return data
+
 
 def get_devices():
     """
     Get all devices.
     """
-    response = requests.get(f"http://{SERVER_URL}/devices")
-
-    devices_json = json.loads(response.content) if response.ok else []
+    devices_json = get_json("/devices") or []
 
     devices = [None]
     devices.extend([device["id"] for device in devices_json])
@@ -49,9 +105,7 @@ def get_device(device_id: str):
     Arguments:
         device_id {str} -- Device id.
     """
-    response = requests.get(f"http://{SERVER_URL}/devices/{device_id}")
-
-    return json.loads(response.content) if response.ok else None
+    return get_json(f"/devices/{device_id}")
 
 
 def get_statistics_from_to(device_id, datetime_from, datetime_to):
@@ -63,11 +117,17 @@ def get_statistics_from_to(device_id, datetime_from, datetime_to):
         datetime_from {str} -- Datetime from.
         datetime_to {str} -- Datetime to.
     """
-    response = requests.get(
-        f"http://{SERVER_URL}/devices/{device_id}/statistics?datefrom={datetime_from}&dateto={datetime_to}"
+    # Streamed as NDJSON, the JSON response only has the first page
+    return get_json(
+        f"/devices/{device_id}/statistics",
+        params={
+            "datefrom": datetime_from,
+            "dateto": datetime_to,
+            "format": "ndjson",
+        },
+        ndjson=True,
     )
 
-    return json.loads(response.content) if response.ok else None
 
 def get_device_files(device_id):
     """
@@ -76,9 +136,71 @@ def get_device_files(device_id):
     Arguments:
         device_id {str} -- Device id.
     """
-    response = requests.get(
-        f"http://{SERVER_URL}/files/{device_id}"
+    return get_json(f"/files/{device_id}")
+
+
+def open_live_events(device_id: str, timeout: float):
+    """
+    Connect to the live events of a device. Returns once the server is
+    subscribed, so no event sent after this call is missed.
+
+    Arguments:
+        device_id {str} -- Device id.
+        timeout {float} -- Seconds to wait for the server.
+
+    Returns:
+        Tuple[Response, Iterator] -- Streamed response, to be closed, and
+        iterator of (event, data) tuples.
+    """
+    response = session.get(
+        f"http://{SERVER_URL}/devices/{device_id}/live?last_status=false",
+        stream=True,
+        timeout=timeout,
     )
+    response.raise_for_status()
+
+    lines = response.iter_lines(decode_unicode=True)
+    next(lines)  # ": connected" comment
+    return response, read_live_events(lines)
+
 
-    return json.loads(response.content) if response.ok else None
+def read_live_events(lines):
+    """
+    Parse Server-Sent Events, skipping comments.
+
+    Arguments:
+        lines {Iterator[str]} -- Lines of the stream.
+    """
+    event, data = None, []
+    for line in lines:
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+        elif not line and data:
+            yield event, orjson.loads("\n".join(data))
+            event, data = None, []
+
+
+def wait_live_event(events, event_name: str, timeout: float):
+    """
+    Wait for an event of the live stream, e.g: the status sent by the device.
+
+    Arguments:
+        events {Iterator} -- Iterator returned by open_live_events.
+        event_name {str} -- Event to wait for.
+        timeout {float} -- Seconds to wait.
 
+    Returns:
+        Optional[Dict] -- Event data, None if it didn't arrive in time.
+    """
+    deadline = time.monotonic() + timeout
+    try:
+        for event, data in events:
+            if event == event_name:
+                return data
+            if time.monotonic() > deadline:
+                break
+    except requests.RequestException:
+        pass  # No data during the read timeout
+    return None
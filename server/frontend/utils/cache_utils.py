@@ -0,0 +1,248 @@
+################################################################################
+# Copyright (c) 2020-2021, Berkeley Design Technology, Inc. All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+################################################################################
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Callable, Hashable, List, Optional
+
+import pandas as pd
+
+from utils.api_utils import get_statistics_from_to
+from utils.format_utils import statistics_to_dataframe
+
+# Seconds to keep devices and their files, before requesting them again
+CACHE_TTL = float(os.environ.get("CACHE_TTL", 30))
+
+# Days of statistics kept in memory (of any device), and seconds until they
+# are requested again, in case statistics were modified or backfilled
+STATISTICS_CACHE_DAYS = int(os.environ.get("STATISTICS_CACHE_DAYS", 90))
+STATISTICS_CACHE_TTL = float(os.environ.get("STATISTICS_CACHE_TTL", 600))
+
+ONE_DAY = timedelta(days=1)
+
+
+class TTLCache:
+    """
+    Values by key, kept for ttl seconds. Values of failed requests (None)
+    are not kept.
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, fetch: Callable):
+        """
+        Get a value, calling fetch if it's not cached or it expired.
+
+        Arguments:
+            key {Hashable} -- Key of the value.
+            fetch {Callable} -- Function without arguments that gets the
+            value from the server.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        value = fetch()
+        if value is not None:
+            with self._lock:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+
+class StatisticsCache:
+    """
+    Statistics of the devices by UTC day, so that dashboard reruns only
+    request the statistics received since the previous one.
+
+    Completed days are kept in an LRU of max_days entries. The current day
+    of each device is kept apart, and extended with the statistics newer
+    than its last one on every call. Both are requested again after ttl
+    seconds.
+    """
+
+    def __init__(
+        self,
+        max_days: int = STATISTICS_CACHE_DAYS,
+        ttl: float = STATISTICS_CACHE_TTL,
+    ):
+        self.max_days = max_days
+        self.ttl = ttl
+        self._days = OrderedDict()  # (device_id, day): (expires, DataFrame)
+        self._today = {}  # device_id: (day, expires, DataFrame)
+        self._lock = threading.Lock()
+
+    def get(
+        self, device_id: str, from_date: datetime, to_date: datetime
+    ) -> Optional[pd.DataFrame]:
+        """
+        Get the statistics of a device within a datetime range.
+
+        Arguments:
+            device_id {str} -- Device id.
+            from_date {datetime} -- Datetime from (UTC).
+            to_date {datetime} -- Datetime to (UTC), inclusive.
+
+        Returns:
+            Optional[pd.DataFrame] -- Statistics sorted by datetime, like
+            statistics_to_dataframe returns them, or None if the server
+            didn't answer.
+        """
+        today = datetime.utcnow().date()
+        last_day = min(to_date.date(), today - ONE_DAY)
+        completed_days = [
+            from_date.date() + number * ONE_DAY
+            for number in range((last_day - from_date.date()).days + 1)
+        ]
+
+        frames = self._get_completed_days(device_id, completed_days)
+        if frames is not None and from_date.date() <= today <= to_date.date():
+            today_df = self._get_today(device_id, today)
+            frames = None if today_df is None else frames + [today_df]
+
+        if frames is None:
+            return None
+        if not frames:
+            return statistics_to_dataframe([])
+
+        data_df = pd.concat(frames, ignore_index=True)
+        in_range = (data_df["datetime"] >= from_date) & (
+            data_df["datetime"] <= to_date
+        )
+        return data_df[in_range.to_numpy()].reset_index(drop=True)
+
+    def clear(self):
+        with self._lock:
+            self._days.clear()
+            self._today.clear()
+
+    def _get_completed_days(
+        self, device_id: str, days: List[date]
+    ) -> Optional[List[pd.DataFrame]]:
+        frames, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for day in days:
+                entry = self._days.get((device_id, day))
+                if entry is not None and entry[0] > now:
+                    self._days.move_to_end((device_id, day))
+                    frames[day] = entry[1]
+                else:
+                    missing.append(day)
+
+        # One request for each run of consecutive missing days
+        runs = []
+        for day in missing:
+            if runs and runs[-1][-1] + ONE_DAY == day:
+                runs[-1].append(day)
+            else:
+                runs.append([day])
+
+        for run in runs:
+            first = datetime.combine(run[0], datetime.min.time())
+            fetched = fetch_statistics(
+                device_id, first, first + len(run) * ONE_DAY
+            )
+            if fetched is None:
+                return None
+
+            fetched_days = fetched["datetime"].dt.floor("D").dt.date.to_numpy()
+            for day in run:
+                frames[day] = fetched[fetched_days == day].reset_index(
+                    drop=True
+                )
+
+            with self._lock:
+                for day in run:
+                    self._days[(device_id, day)] = (
+                        time.monotonic() + self.ttl,
+                        frames[day],
+                    )
+                    self._days.move_to_end((device_id, day))
+                while len(self._days) > self.max_days:
+                    self._days.popitem(last=False)
+
+        return [frames[day] for day in days]
+
+    def _get_today(
+        self, device_id: str, today: date
+    ) -> Optional[pd.DataFrame]:
+        first = datetime.combine(today, datetime.min.time())
+        with self._lock:
+            entry = self._today.get(device_id)
+
+        if entry is None or entry[0] != today or entry[1] <= time.monotonic():
+            today_df = fetch_statistics(device_id, first, first + ONE_DAY)
+            if today_df is None:
+                return None
+            expires = time.monotonic() + self.ttl
+        else:
+            _, expires, today_df = entry
+            last = today_df["datetime"].max() if len(today_df) else first
+            # Only the statistics received since the previous call
+            delta_df = fetch_statistics(device_id, last, first + ONE_DAY)
+            if delta_df is None:
+                return None
+            delta_df = delta_df[(delta_df["datetime"] > last).to_numpy()]
+            if len(delta_df):
+                today_df = pd.concat([today_df, delta_df], ignore_index=True)
+
+        with self._lock:
+            self._today[device_id] = (today, expires, today_df)
+        return today_df
+
+
+def fetch_statistics(
+    device_id: str, from_date: datetime, to_date: datetime
+) -> Optional[pd.DataFrame]:
+    """
+    Request the statistics of a device from from_date, up to (but not
+    including) to_date.
+
+    Returns:
+        Optional[pd.DataFrame] -- Statistics, or None if the server didn't
+        answer.
+    """
+    statistics = get_statistics_from_to(
+        device_id, from_date.isoformat(), to_date.isoformat()
+    )
+    if statistics is None:
+        return None
+
+    data_df = statistics_to_dataframe(statistics)
+    return data_df[(data_df["datetime"] < to_date).to_numpy()].reset_index(
+        drop=True
+    )
+
+
+api_cache = TTLCache()
+statistics_cache = StatisticsCache()
@@ -20,7 +20,9 @@
 # DEALINGS IN THE SOFTWARE.
 ################################################################################
 
-from typing import Dict, List
+import os
+from operator import itemgetter
+from typing import Dict, List, Union
 
 import pandas as pd
 import numpy as np
@@ -28,154 +30,222 @@ import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
-
-def format_data(statistics: List = [], group_data_by: str = None):
+STATISTIC_COLUMNS = [
+    "datetime",
+    "statistic_type",
+    "people_with_mask",
+    "people_without_mask",
+    "people_total",
+]
+COUNT_COLUMNS = ["people_with_mask", "people_without_mask", "people_total"]
+
+# Aliases valid for every pandas version, by user selected aggregation option
+GROUP_FREQUENCIES = {
+    "Second": "s",
+    "Minute": "min",
+    "Hour": "h",
+    "Day": "D",
+    "Week": "W",
+    "Month": "MS",
+}
+
+# Points per trace drawn in the charts, about the width in pixels of a chart
+# (0 draws all of them)
+CHART_MAX_POINTS = int(os.environ.get("CHART_MAX_POINTS", 1500))
+
+# Datetimes come with and without microseconds, pandas >= 2 needs to know
+DATE_FORMAT = "ISO8601" if int(pd.__version__.split(".")[0]) >= 2 else None
+
+
+def format_data(
+    statistics: Union[List, pd.DataFrame] = [], group_data_by: str = None
+):
     """
     Format data to be displayed in the carts.
 
     Arguments:
-        statistics {List} -- All device statistics.
+        statistics {Union[List, pd.DataFrame]} -- All device statistics, as
+        sent by the API or already in a DataFrame (see
+        statistics_to_dataframe).
         group_data_by {str} -- User selected aggregation option.
     """
-    reports, alerts = {}, {}
+    data_df = (
+        statistics
+        if isinstance(statistics, pd.DataFrame)
+        else statistics_to_dataframe(statistics)
+    )
 
-    for statistic in statistics:
-        # Separate reports from alerts
-        if statistic["statistic_type"] == "REPORT":
-            if not reports:
-                reports = create_statistics_dict()
+    # Separate reports from alerts
+    is_report = (data_df["statistic_type"] == "REPORT").to_numpy()
 
-            reports = add_information(reports, statistic)
-        else:
-            if not alerts:
-                alerts = create_statistics_dict()
+    # Aggregate data
+    reports = (
+        group_data(data_df[is_report], group_data_by)
+        if is_report.any()
+        else {}
+    )
+    alerts = (
+        group_data(data_df[~is_report], group_data_by)
+        if not is_report.all()
+        else {}
+    )
 
-            alerts = add_information(alerts, statistic)
+    return reports, alerts
 
-    # Aggregate data
-    if reports:
-        reports = group_data(reports, group_data_by)
 
-    if alerts:
-        alerts = group_data(alerts, group_data_by)
+def statistics_to_dataframe(statistics: List) -> pd.DataFrame:
+    """
+    Build a single typed DataFrame from the statistics sent by the API.
 
-    return reports, alerts
+    Arguments:
+        statistics {List} -- Statistics, as decoded from JSON.
+
+    Returns:
+        pd.DataFrame -- STATISTIC_COLUMNS, with parsed datetimes and
+        integer counts.
+    """
+    # One column at a time, much faster than DataFrame(statistics)
+    columns = {
+        column: [statistic[column] for statistic in statistics]
+        for column in STATISTIC_COLUMNS
+    }
 
+    data_df = pd.DataFrame(
+        {
+            column: np.array(columns[column], dtype=np.int64)
+            for column in COUNT_COLUMNS
+        }
+    )
+    data_df["datetime"] = pd.to_datetime(
+        columns["datetime"], format=DATE_FORMAT
+    )
+    data_df["statistic_type"] = columns["statistic_type"]
+    return data_df
 
-def group_data(data: Dict, group_data_by: str):
+
+def group_data(data_df: pd.DataFrame, group_data_by: str):
     """
     Aggregate data using different criteria.
 
     Arguments:
-        data {Dict} -- Data to aggregate.
+        data_df {pd.DataFrame} -- Data to aggregate.
         group_data_by {str} -- User selected aggregation option.
     """
-    data_df = pd.DataFrame.from_dict(data)
-    data_df["dates"] = pd.to_datetime(data_df["dates"])
-
-    criterion = "H"
-    if group_data_by == "Second":
-        criterion = "S"
-    elif group_data_by == "Minute":
-        criterion = "T"
-    elif group_data_by == "Day":
-        criterion = "D"
-    elif group_data_by == "Week":
-        criterion = "W"
-    elif group_data_by == "Month":
-        criterion = "M"
-
-    group = (
-        data_df.resample(criterion, on="dates")
-        .agg(
-            {
-                "people_total": "sum",
-                "people_with_mask": "sum",
-                "people_without_mask": "sum",
-            }
-        )
-        .reset_index()
-    )
+    group = data_df.resample(
+        GROUP_FREQUENCIES.get(group_data_by, "h"), on="datetime"
+    )[COUNT_COLUMNS].sum()
 
-    # Calculate new mask percentage
-    group["mask_percentage"] = (
-        group["people_with_mask"] * 100 / group["people_total"]
-    )
-    group["mask_percentage"] = group["mask_percentage"].replace(
-        [np.inf, -np.inf], 0
-    )
+    people_with_mask = group["people_with_mask"].to_numpy()
+    people_without_mask = group["people_without_mask"].to_numpy()
+    people_total = group["people_total"].to_numpy()
 
-    group["visible_people"] = (
-        group["people_with_mask"] + group["people_without_mask"]
+    # Drop empty lines
+    keep = (people_total != 0) | (people_with_mask != 0)
+
+    # Calculate new mask percentage, 0 if there are masks but no people
+    mask_percentage = np.zeros(len(group))
+    np.divide(
+        people_with_mask * 100,
+        people_total,
+        out=mask_percentage,
+        where=people_total != 0,
     )
 
-    # Drop empty lines
-    group.dropna(subset=["mask_percentage"], inplace=True)
-    group = group.to_dict()
     grouped_data = {
-        "dates": [t.to_pydatetime() for t in group["dates"].values()],
-        "people_with_mask": list(group["people_with_mask"].values()),
-        "people_total": list(group["people_total"].values()),
-        "mask_percentage": list(group["mask_percentage"].values()),
-        "visible_people": list(group["visible_people"].values()),
+        "dates": group.index[keep].to_pydatetime().tolist(),
+        "people_with_mask": people_with_mask[keep].tolist(),
+        "people_total": people_total[keep].tolist(),
+        "mask_percentage": mask_percentage[keep].tolist(),
+        "visible_people": (people_with_mask + people_without_mask)[
+            keep
+        ].tolist(),
     }
 
     return grouped_data
 
 
-def create_statistics_dict():
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
     """
-    Chart data structure.
+    Choose the points that keep the shape of a series with the
+    Largest-Triangle-Three-Buckets algorithm: the first and last points, and
+    one of each bucket in between, the one forming the largest triangle with
+    the point chosen in the previous bucket and the average of the next one.
+
+    Arguments:
+        x {np.ndarray} -- Sorted x values.
+        y {np.ndarray} -- y values.
+        max_points {int} -- Number of points to choose (at least 3).
+
+    Returns:
+        np.ndarray -- Sorted indices of the chosen points.
     """
-    return {
-        "dates": [],
-        "mask_percentage": [],
-        "people_total": [],
-        "people_with_mask": [],
-        "people_without_mask": [],
-        "visible_people": [],
-    }
+    points = len(x)
+    if max_points >= points or max_points < 3:
+        return np.arange(points)
+
+    # Buckets of the points between the first and the last ones
+    edges = (
+        np.arange(max_points - 1) * (points - 2) / (max_points - 2) + 1
+    ).astype(np.int64)
+    edges[-1] = points - 1
+
+    # Averages of every bucket, and of the last point for the last bucket
+    sizes = np.diff(edges)
+    average_x = np.append(np.add.reduceat(x[:-1], edges[:-1]) / sizes, x[-1])
+    average_y = np.append(np.add.reduceat(y[:-1], edges[:-1]) / sizes, y[-1])
+
+    indices = np.empty(max_points, dtype=np.int64)
+    indices[0], indices[-1] = 0, points - 1
+    chosen = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_x, next_y = average_x[bucket + 1], average_y[bucket + 1]
+        areas = np.abs(
+            (x[chosen] - next_x) * (y[start:end] - y[chosen])
+            - (x[chosen] - x[start:end]) * (next_y - y[chosen])
+        )
+        chosen = start + int(np.argmax(areas))
+        indices[bucket + 1] = chosen
+    return indices
 
 
-def add_information(statistic_dict: Dict, statistic_information: Dict):
+def downsample(trace_information: Dict, max_points: int = CHART_MAX_POINTS):
     """
-    Add information to existing dict.
+    Keep up to max_points of grouped data, so that browsers can draw charts
+    of long ranges. The same points are kept for every trace, chosen with
+    LTTB on the number of people, which keeps the spikes visible.
 
     Arguments:
-        statistic_dict {Dict} -- Existing dict.
-        statistic_information {Dict} -- Data to add.
+        trace_information {Dict} -- Data returned by group_data.
+        max_points {int} -- Maximum number of points (0 keeps all of them).
     """
-    statistic_dict["dates"].append(statistic_information["datetime"])
-
-    total = statistic_information["people_total"]
-    people_with_mask = statistic_information["people_with_mask"]
-    people_without_mask = statistic_information["people_without_mask"]
-
-    statistic_dict["people_total"].append(total)
-    statistic_dict["people_with_mask"].append(people_with_mask)
-    statistic_dict["people_without_mask"].append(people_without_mask)
-
-    mask_percentage = (
-        statistic_information["people_with_mask"] * 100 / total
-        if total != 0
-        else 0
-    )
-    statistic_dict["mask_percentage"].append(mask_percentage)
-
-    statistic_dict["visible_people"].append(
-        people_with_mask + people_without_mask
+    if not max_points or len(trace_information["dates"]) <= max_points:
+        return trace_information
+
+    dates = pd.DatetimeIndex(trace_information["dates"]).asi8
+    indices = lttb_indices(
+        (dates - dates[0]).astype(np.float64),
+        np.asarray(trace_information["people_total"], dtype=np.float64),
+        max(max_points, 3),
     )
 
-    return statistic_dict
+    pick = itemgetter(*indices)
+    return {
+        key: list(pick(values)) for key, values in trace_information.items()
+    }
 
 
-def create_chart(reports: Dict = {}, alerts: Dict = {}):
+def create_chart(
+    reports: Dict = {}, alerts: Dict = {}, max_points: int = CHART_MAX_POINTS
+):
     """
     Create Plotly chart.
 
     Arguments:
         reports {Dict} -- Reports data.
         alerts {Dict} -- Alerts data.
+        max_points {int} -- Maximum number of points per trace (see
+        downsample).
     """
 
     # Create figure with secondary y-axis
@@ -188,7 +258,12 @@ def create_chart(reports: Dict = {}, alerts: Dict = {}):
             "mask_percentage": "limegreen",
             "visible_people": "royalblue",
         }
-        figure = add_trace(reports, figure, report_colors, trace_type="report")
+        figure = add_trace(
+            downsample(reports, max_points),
+            figure,
+            report_colors,
+            trace_type="report",
+        )
 
     if alerts:
         alert_colors = {
@@ -197,7 +272,12 @@ def create_chart(reports: Dict = {}, alerts: Dict = {}):
             "mask_percentage": "orange",
             "visible_people": "indianred",
         }
-        figure = add_trace(alerts, figure, alert_colors, trace_type="alert")
+        figure = add_trace(
+            downsample(alerts, max_points),
+            figure,
+            alert_colors,
+            trace_type="alert",
+        )
 
     # Set x-axis title
     figure.update_xaxes(title_text="Datetime")